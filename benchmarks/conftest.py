@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/16 14:40'
+import os
+
+from selenium import webdriver
+import pytest
+
+from common.base_selenium import Base
+from common.benchmark import Benchmark, compare, load_baseline, save_baseline
+from common.fake_webdriver import FakeWebDriverServer, demo_page
+from common.launcher import BrowserLauncher
+from common.local_site import LocalSite
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+@pytest.fixture(scope='session')
+def bench_driver(request):
+    '''
+    基准测试用的浏览器，返回(driver, 命令计数函数, 站点url)
+    fake： 进程内的假WebDriver，可以用--bench-latency模拟每个命令的网络耗时
+    chrome： 无头chrome访问本地站点，统计不到命令数，只比较耗时
+    '''
+    config = request.config
+    if config.getoption("--bench-backend") == "fake":
+        server = FakeWebDriverServer(page_factory=demo_page, latency=config.getoption("--bench-latency")).start()
+        request.addfinalizer(server.stop)
+        driver = webdriver.Remote(command_executor=server.url, desired_capabilities={'browserName': 'fake'})
+        counter, url = lambda: server.total, 'http://fake'
+    else:
+        site = LocalSite().start()
+        request.addfinalizer(site.stop)
+        launcher = BrowserLauncher('chrome', os.path.join(os.getcwd(), "driver", "chromedriver"), profile='headless')
+        request.addfinalizer(launcher.stop)
+        try:
+            driver = launcher.new_driver()
+        except Exception as e:
+            pytest.skip('无法启动无头chrome：%s' % e)
+        counter, url = None, site.url
+    request.addfinalizer(driver.quit)
+    return driver, counter, url
+
+
+@pytest.fixture(scope='session')
+def benchmark(request, bench_driver):
+    bench = Benchmark(command_counter=bench_driver[1])
+    request.config._benchmark = bench
+    return bench
+
+
+@pytest.fixture(scope='function')
+def bench_base(bench_driver, logger):
+    '''每个基准用例都从首页开始'''
+    driver, counter, url = bench_driver
+    base = Base(logger, driver)
+    base.get(url + '/index.html')
+    return base
+
+
+def pytest_sessionfinish(session):
+    bench = getattr(session.config, '_benchmark', None)
+    if bench is None or not bench.results:
+        return
+    config = session.config
+    backend = config.getoption("--bench-backend")
+    if config.getoption("--bench-save"):
+        save_baseline(BASELINE_PATH, backend, bench.results)
+        return
+    bench.regressions = compare(bench.results, load_baseline(BASELINE_PATH, backend),
+                                tolerance=config.getoption("--bench-tolerance"))
+    if bench.regressions and session.exitstatus == 0:
+        session.exitstatus = 1
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    bench = getattr(config, '_benchmark', None)
+    if bench is None or not bench.results:
+        return
+    terminalreporter.section('benchmark (%s)' % config.getoption("--bench-backend"))
+    terminalreporter.write_line('%-36s %8s %10s %10s %10s' % ('name', 'commands', 'mean(ms)', 'p50(ms)', 'p95(ms)'))
+    for name, result in sorted(bench.results.items()):
+        commands = '-' if result['commands'] is None else result['commands']
+        terminalreporter.write_line('%-36s %8s %10.2f %10.2f %10.2f' % (
+            name, commands, result['mean'] * 1000, result['p50'] * 1000, result['p95'] * 1000))
+    if config.getoption("--bench-save"):
+        terminalreporter.write_line('已保存为基线：%s' % BASELINE_PATH)
+    for line in getattr(bench, 'regressions', ()):
+        terminalreporter.write_line('性能退化 %s' % line, red=True)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/16 15:00'
+import pytest
+
+KW = ('id', 'kw')
+RESULT = ('id', 'result')
+CITY = ('id', 'city')
+FRAME = ('id', 'frame')
+INNER = ('id', 'inner')
+MISSING = ('id', 'missing')
+
+
+def test_find_element(benchmark, bench_base):
+    '''定位单个元素'''
+    benchmark.run('find_element', lambda: bench_base.find_element(KW))
+
+
+def test_element_cache_hit(benchmark, bench_base):
+    '''
+    开启元素缓存后重复操作同一个元素：每次都命中缓存，是缓存的最好情况，不代表用例中的实际收益
+    find_element总是重新定位，缓存只对click、is_enabled等操作元素的方法生效
+    '''
+    bench_base.cache_elements = True
+    benchmark.run('is_enabled[cached_hit]', lambda: bench_base.is_enabled(KW))
+
+
+def test_element_cache_mix(benchmark, bench_base, bench_driver):
+    '''
+    接近用例的缓存效果：每轮先跳转（清空缓存，不计时），再操作3个不同元素共6次，开启缓存时3次未命中、3次命中
+    假WebDriver默认没有延迟，命中省下的只是本机的一次请求，用--bench-latency模拟远程浏览器时耗时差距更接近实际
+    '''
+    url = bench_driver[2] + '/index.html'
+
+    def fn():
+        for locator in (KW, RESULT, KW, CITY, RESULT, KW):
+            bench_base.is_enabled(locator)
+    benchmark.run('is_enabled_mix[6]', fn, setup=lambda: bench_base.get(url))
+    bench_base.cache_elements = True
+    benchmark.run('is_enabled_mix[6,cached]', fn, setup=lambda: bench_base.get(url))
+
+
+def test_find_many(benchmark, bench_base):
+    '''一次批量定位多个元素'''
+    locators = {'kw': KW, 'result': RESULT, 'city': CITY}
+    benchmark.run('find_many[3]', lambda: bench_base.find_many(locators))
+
+
+def test_send_keys(benchmark, bench_base):
+    benchmark.run('send_keys', lambda: bench_base.send_keys(KW, 'selenium'))
+
+
+@pytest.mark.parametrize('wait_mode', ['poll', 'backoff', 'observer'])
+def test_is_waits(benchmark, bench_base, wait_mode):
+    '''is_*等待条件立即成立时的开销'''
+    bench_base.wait_mode = wait_mode
+    benchmark.run('is_title[%s]' % wait_mode, lambda: bench_base.is_title('本地测试站点'))
+    benchmark.run('is_title_contains[%s]' % wait_mode, lambda: bench_base.is_title_contains('测试'))
+    benchmark.run('is_element_contains_text[%s]' % wait_mode,
+                  lambda: bench_base.is_element_contains_text(RESULT, 'selenium'))
+    benchmark.run('wait_until_absent[%s]' % wait_mode, lambda: bench_base.wait_until_absent(MISSING))
+
+
+def test_is_element_exist(benchmark, bench_base):
+    '''判断元素不存在：不等待的探测'''
+    benchmark.run('is_element_exist[absent]', lambda: bench_base.is_element_exist(MISSING))
+
+
+def test_get_element_attribute(benchmark, bench_base):
+    benchmark.run('get_element_attribute', lambda: bench_base.get_element_attribute(KW, 'name'))
+
+
+def test_select(benchmark, bench_base):
+    '''下拉框选择'''
+    benchmark.run('select_by_index', lambda: bench_base.select_by_index(CITY, 1))
+    benchmark.run('select_by_value', lambda: bench_base.select_by_value(CITY, 'gz'))
+    benchmark.run('select_by_text', lambda: bench_base.select_by_text(CITY, '北京'))
+
+
+def test_switch_iframe(benchmark, bench_base):
+    '''切换到iframe定位元素再切回'''
+    def fn():
+        bench_base.switch_iframe('frame')
+        bench_base.find_element(INNER)
+        bench_base.switch_default_content()
+    # 没有开启缓存时id/name交给selenium定位后切换，开启后frame元素按路径缓存
+    benchmark.run('switch_iframe', fn)
+    bench_base.cache_elements = True
+    benchmark.run('switch_iframe[cached]', fn)
+    bench_base.cache_elements = False
+
+    def in_frame():
+        with bench_base.in_frame(FRAME):
+            bench_base.find_element(INNER)
+    benchmark.run('in_frame', in_frame)
+
+
+def test_screenshot(benchmark, bench_base):
+    '''失败截图使用的png截图'''
+    benchmark.run('screenshot', lambda: bench_base.driver.get_screenshot_as_png(), rounds=5)
+
+
+def test_macro(benchmark, bench_base):
+    '''填表单：逐步执行和动作序列对比'''
+    def steps():
+        bench_base.clear(KW)
+        bench_base.send_keys(KW, 'selenium')
+        bench_base.select_by_value(CITY, 'gz')
+        bench_base.js_scroll_end()
+    benchmark.run('form[step_by_step]', steps)
+    benchmark.run('form[macro]', lambda: bench_base.macro().fill(KW, 'selenium').select(CITY, value='gz')
+                  .scroll(to='end').run())
+
+
+def test_reset_context(benchmark, bench_base):
+    '''用例之间重置浏览器（--isolation=recycle）'''
+    benchmark.run('reset_context', lambda: bench_base.reset_context())
+
+
+def test_snapshot(benchmark, bench_base):
+    '''读取下拉框所有选项的文本和value：逐个元素请求和DOM快照对比'''
+    def per_element():
+        return [(option.text, option.get_attribute('value')) for option in bench_base.get_select_options(CITY)]
+
+    def snapshot():
+        return [(option.text, option.get('value')) for option in bench_base.snapshot(CITY).select('option')]
+    assert per_element() == snapshot()
+    benchmark.run('read_options[per_element]', per_element)
+    benchmark.run('read_options[snapshot]', snapshot)
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/14 18:10'
+import pytest
+
+
+@pytest.mark.block_resources(types=['image'])
+def test_block_image(request, handle, local_site):
+    '''本地站点：图片被拦截，页面其他内容正常加载'''
+    if request.config.getoption("--request-filter") == "none":
+        pytest.skip("需要--request-filter=proxy或者cdp")
+    handle.get(local_site + '/index.html')
+    assert handle.is_title('本地测试站点')
+    assert handle.driver.execute_script('return document.getElementById("logo").naturalWidth') == 0
@@ -1,33 +1,148 @@
-from selenium.webdriver.support.wait import WebDriverWait
+import contextlib
+import time
+from urllib.parse import urlsplit
+
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.select import Select
 from selenium.webdriver.common.action_chains import ActionChains
+from selenium.common.exceptions import NoSuchFrameException, StaleElementReferenceException, TimeoutException
+
+from common import waits
+from common.waits import LOCATE_JS
+from common.macro import ActionMacro
+from common.snapshot import SNAPSHOT_JS, DomSnapshot
+
+# 一次execute_script批量定位多个元素，arguments[0]为[[定位方式, value值], ...]，没定位到的返回null
+FIND_MANY_JS = LOCATE_JS + '''
+return arguments[0].map(function (loc) {
+    try { return locate(loc[0], loc[1], false); } catch (e) { return null; }
+});
+'''
+
+# 用例之间重置浏览器状态：清空localStorage、sessionStorage、js可见的cookie，删除IndexedDB和Cache Storage（异步，不等待完成）
+# 只能清空当前页面所在域名的存储，其他域名见Base.reset_context
+RESET_JS = '''
+try { window.localStorage.clear(); } catch (e) {}
+try { window.sessionStorage.clear(); } catch (e) {}
+document.cookie.split(";").forEach(function (c) {
+    var name = c.split("=")[0].trim();
+    if (name) document.cookie = name + "=; expires=Thu, 01 Jan 1970 00:00:00 GMT; path=/";
+});
+try { indexedDB.databases().then(function (dbs) { dbs.forEach(function (db) { indexedDB.deleteDatabase(db.name); }); }); } catch (e) {}
+try { caches.keys().then(function (keys) { keys.forEach(function (key) { caches.delete(key); }); }); } catch (e) {}
+'''
 
 class Base:
     '''
     selenium api 封装
     '''
-    def __init__(self, logger, driver=None):
+    def __init__(self, logger, driver=None, cache_elements=False, wait_mode='poll'):
+        '''
+        cache_elements： 是否缓存定位到的元素，默认为False
+        wait_mode： 等待模式，poll/backoff/observer，见common.waits，默认为poll
+        '''
+        if wait_mode not in waits.WAIT_MODES:
+            raise Exception('wait_mode参数错误，必须是%s其中一个' % '/'.join(waits.WAIT_MODES))
         self.driver = driver
         self.timeout = 6
         self.t = 0.5
+        self.wait_mode = wait_mode
+        self.locator_listener = None  # 使用locator时的回调，用于记录用例依赖的locator
+        self.last_idle_time = None  # 最近一次wait_for_page_idle等待的秒数
+        self.home_window = None  # 浏览器的原始窗口，reset_context时保留；由DriverPool租用时记录
         self.logger = logger
+        self.cache_elements = cache_elements
+        self._element_cache = {}
+        self._cache_scope = {}
+        self._origins = {}  # {id(driver): 通过get打开过的域名}，reset_context时清空这些域名的存储
     
     def _get_driver(self, driver):
         '''获取driver，判断用初始化的driver还是传入的driver，传入的优先级的driver优先级最高'''
         return driver or self.driver
 
-    def _get_element(self, locator, element, driver):
-        '''判断传入的是locator还是element；返回element; 只传其中一个'''
+    def _get_element(self, locator, element, driver, timeout=None):
+        '''判断传入的是locator还是element；返回element; 只传其中一个；timeout为定位时等待的秒数'''
         if element:
             return element
-        return self.find_element(locator, driver)
+        if not self.cache_elements:
+            return self.find_element(locator, driver, timeout)
+        key = self._cache_key(locator, driver)
+        element = self._element_cache.get(key)
+        if element is None:
+            element = self.find_element(locator, driver, timeout)
+            if element:
+                self._element_cache[key] = element
+        elif self.locator_listener:
+            self.locator_listener(locator)
+        return element
+
+    def _until(self, driver, condition, timeout=None, predicate=None, args=()):
+        '''按wait_mode等待condition成立；predicate、args为observer模式的页面内js判断函数及参数'''
+        timeout = self.timeout if timeout is None else timeout
+        return waits.wait_until(driver, condition, timeout, self.t, self.wait_mode, predicate, args)
+
+    def _on_element(self, locator, element, driver, action, timeout=None):
+        '''对元素执行action并返回结果；缓存的元素已过期时，重新定位后再执行一次'''
+        target = self._get_element(locator, element, driver, timeout)
+        try:
+            return action(target)
+        except StaleElementReferenceException:
+            if element or not self.cache_elements:
+                raise
+            self.logger.info("缓存元素已过期，重新定位：定位方式->%s, value值->%s" % (locator[0], locator[1]))
+            self._element_cache.pop(self._cache_key(locator, driver), None)
+            return action(self._get_element(locator, None, driver, timeout))
+
+    def _navigate(self, driver, navigate):
+        '''
+        跳转页面，并注入空闲检测的埋点（见wait_for_page_idle）
+        chrome在第一次跳转前用Page.addScriptToEvaluateOnNewDocument注册一次埋点，之后每个新页面加载时自动埋点，跳转不额外发命令；
+        其他浏览器跳转后执行一次IDLE_INSTRUMENT_JS
+        '''
+        registered = self._register_idle_script(driver)
+        navigate()
+        self.clear_element_cache(driver)
+        if not registered:
+            try:
+                driver.execute_script(waits.IDLE_INSTRUMENT_JS)
+            except Exception:
+                self.logger.info("页面空闲检测埋点失败")
+
+    def _register_idle_script(self, driver):
+        '''chrome注册新页面埋点脚本，每个浏览器只注册一次；注册成功返回True，不支持或失败返回False'''
+        if not hasattr(driver, 'execute_cdp_cmd'):
+            return False
+        if getattr(driver, '_idle_script', None) is None:
+            try:
+                driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': waits.IDLE_INSTRUMENT_JS})
+                driver._idle_script = True
+            except Exception:
+                self.logger.info("注册页面空闲检测埋点失败，改为跳转后注入")
+                driver._idle_script = False
+        return driver._idle_script
+
+    def _get_scope(self, driver):
+        '''元素缓存的作用域：当前窗口、frame路径、url'''
+        return self._cache_scope.setdefault(id(driver), {'window': None, 'frames': (), 'url': None, 'frame_elements': {}})
+
+    def _cache_key(self, locator, driver):
+        scope = self._get_scope(driver)
+        return id(driver), scope['window'], scope['frames'], scope['url'], locator
+
+    def clear_element_cache(self, driver=None):
+        '''清空元素缓存；传入driver时只清空该driver的缓存'''
+        if driver is None:
+            self._element_cache.clear()
+            return
+        for key in [key for key in self._element_cache if key[0] == id(driver)]:
+            del self._element_cache[key]
     
-    def find_element(self, locator, driver=None):
+    def find_element(self, locator, driver=None, timeout=None):
         '''
         定位元素
         返回定位到的元素，没定位到则抛timeout异常
         locator： ('id', 'kw')/('css selector', 'input#kw')
+        timeout： 本次等待的秒数，不传则为self.timeout；click、send_keys等操作元素的方法及is_*、wait_*等方法的timeout参数相同
          ID = "id"
         XPATH = "xpath"
         LINK_TEXT = "link text"
@@ -40,9 +155,12 @@ class Base:
         if not isinstance(locator, tuple):
             self.logger.error('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
             raise Exception('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
+        if self.locator_listener:
+            self.locator_listener(locator)
         driver = self._get_driver(driver)
         try:
-            element = WebDriverWait(driver, self.timeout, self.t).until(EC.presence_of_element_located(locator))
+            element = self._until(driver, EC.presence_of_element_located(locator), timeout,
+                                  predicate=waits.PRESENCE_JS, args=locator)
             self.logger.info("定位元素信息：定位方式->%s, value值->%s"%(locator[0], locator[1]))
         except Exception:
             self.logger.error("定位方式报错->%s, value值->%s"%(locator[0], locator[1]), exc_info=True)
@@ -51,108 +169,206 @@ class Base:
         else:
             return element
 
-    def find_elements(self, locator, driver=None):
+    def find_elements(self, locator, driver=None, timeout=None):
         # 定位元素, 返回元素[]
         if not isinstance(locator, tuple):
             self.logger.error('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
             raise Exception('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
+        if self.locator_listener:
+            self.locator_listener(locator)
         driver = self._get_driver(driver)
         try:
-            elements = WebDriverWait(driver, self.timeout, self.t).until(EC.presence_of_all_elements_located(locator))
+            elements = self._until(driver, EC.presence_of_all_elements_located(locator), timeout,
+                                   predicate=waits.ALL_PRESENCE_JS, args=locator)
             self.logger.info("定位元素信息：定位方式->%s, value值->%s"%(locator[0], locator[1]))
             return elements
         except Exception:
             self.logger.error("查找元素报错->%s, value值->%s"%(locator[0], locator[1]), exc_info=True)
 
-    def send_keys(self, locator=None, text='', element=None, driver=None):
-        driver = self._get_driver(driver)
-        element = self._get_element(locator, element, driver)
-        element.send_keys(text)
+    def find_many(self, locators, driver=None, timeout=None):
+        '''
+        批量定位元素，每轮只发一次execute_script，所有locator共用一个超时时间
+        locators： {name: locator}字典，或者locator列表（name为列表索引）
+        返回{name: element}，超时仍没定位到的元素为None
+        '''
+        if not isinstance(locators, dict):
+            locators = dict(enumerate(locators))
+        for locator in locators.values():
+            if not isinstance(locator, tuple):
+                self.logger.error('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
+                raise Exception('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
+            if self.locator_listener:
+                self.locator_listener(locator)
+        driver = self._get_driver(driver)
+        found = dict.fromkeys(locators)
+        missing = list(locators)
+        deadline = time.time() + (self.timeout if timeout is None else timeout)
+        while True:
+            elements = driver.execute_script(FIND_MANY_JS, [list(locators[name]) for name in missing])
+            for name, element in zip(missing, elements):
+                found[name] = element
+            missing = [name for name in missing if found[name] is None]
+            if not missing or time.time() >= deadline:
+                break
+            time.sleep(self.t)
+        if self.cache_elements:
+            for name, element in found.items():
+                if element is not None:
+                    self._element_cache[self._cache_key(locators[name], driver)] = element
+        self.logger.info("批量定位元素：共%s个，定位到%s个" % (len(locators), len(locators) - len(missing)))
+        if missing:
+            self.logger.error("批量定位元素，没定位到：%s" % ', '.join('%s->%s' % (name, locators[name]) for name in missing))
+        return found
+
+    def find_all(self, page, driver=None, timeout=None):
+        '''批量定位页面对象类（如BaiduHomePage）中的所有locator，返回{属性名: element}'''
+        locators = dict((name, value) for name, value in vars(page).items()
+                        if not name.startswith('_') and isinstance(value, tuple) and len(value) == 2)
+        return self.find_many(locators, driver, timeout)
+
+    def send_keys(self, locator=None, text='', element=None, driver=None, timeout=None):
+        driver = self._get_driver(driver)
+        self._on_element(locator, element, driver, lambda e: e.send_keys(text), timeout=timeout)
         self.logger.info("输入信息：%s"% text)
 
-    def click(self, locator=None, element=None, driver=None):
+    def click(self, locator=None, element=None, driver=None, timeout=None):
         driver = self._get_driver(driver)
-        element = self._get_element(locator, element, driver)
-        element.click()
+        self._on_element(locator, element, driver, lambda e: e.click(), timeout=timeout)
         self.logger.info("点击元素")
 
-    def clear(self, locator=None, element=None, driver=None):
+    def clear(self, locator=None, element=None, driver=None, timeout=None):
         driver = self._get_driver(driver)
-        element = self._get_element(locator, element, driver)
-        element.clear()
+        self._on_element(locator, element, driver, lambda e: e.clear(), timeout=timeout)
         self.logger.info("清空输入框")
 
-    def is_selected(self, locator=None, element=None, driver=None):
+    def is_selected(self, locator=None, element=None, driver=None, timeout=None):
         '''判断元素是否被选中，返回bool值'''
         driver = self._get_driver(driver)
-        element = self._get_element(locator, element, driver)
-        r = element.is_selected()
+        r = self._on_element(locator, element, driver, lambda e: e.is_selected(), timeout=timeout)
         self.logger.info("元素是否被选中:%s" %r)
         return r
 
-    def is_enabled(self, locator=None, element=None, driver=None):
+    def is_enabled(self, locator=None, element=None, driver=None, timeout=None):
         '''判断input\select等元素是否可编辑状态，返回bool值'''
         driver = self._get_driver(driver)
-        element = self._get_element(locator, element, driver)
-        r = element.is_enabled()
+        r = self._on_element(locator, element, driver, lambda e: e.is_enabled(), timeout=timeout)
         self.logger.info("元素是否可编辑：%s" %r)
         return r
 
-    def is_element_exist(self, locator=None, element=None, driver=None):
-        '''判断元素是否存在，返回bool值'''
+    def is_element_exist(self, locator=None, element=None, driver=None, timeout=0):
+        '''
+        判断元素是否存在，返回bool值
+        timeout： 默认为0，不等待，只看当前页面；元素会稍后出现时传入等待的秒数
+        传入element时判断元素是否还在页面上
+        '''
+        driver = self._get_driver(driver)
+        if element:
+            try:
+                element.is_enabled()
+                exist = True
+            except StaleElementReferenceException:
+                exist = False
+        elif not isinstance(locator, tuple):
+            self.logger.error('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
+            exist = False
+        elif timeout:
+            if self.locator_listener:
+                self.locator_listener(locator)
+            try:
+                exist = bool(self._until(driver, EC.presence_of_element_located(locator), timeout,
+                                         predicate=waits.PRESENCE_JS, args=locator))
+            except TimeoutException:
+                exist = False
+        else:
+            exist = bool(self.probe(locator, driver))
+        self.logger.info("元素存在" if exist else "元素不存在")
+        return exist
+
+    def probe(self, locator, driver=None):
+        '''不等待的定位，返回当前页面上匹配的元素列表，没有则返回[]；用于判断元素不存在等不需要等待的场景'''
+        if not isinstance(locator, tuple):
+            self.logger.error('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
+            raise Exception('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
+        if self.locator_listener:
+            self.locator_listener(locator)
+        driver = self._get_driver(driver)
+        elements = waits.probe(driver, locator)
+        self.logger.info("探测元素：定位方式->%s, value值->%s，匹配%s个" % (locator[0], locator[1], len(elements)))
+        return elements
+
+    def wait_until_absent(self, locator, timeout=None, driver=None):
+        '''等待元素从页面上移除，移除后立即返回True，超时返回False'''
+        return self._wait_until_gone(locator, waits.absence_of(locator), waits.ABSENT_JS, '移除', timeout, driver)
+
+    def wait_until_invisible(self, locator, timeout=None, driver=None):
+        '''等待元素不可见（隐藏或者移除），不可见后立即返回True，超时返回False'''
+        return self._wait_until_gone(locator, waits.invisibility_of(locator), waits.INVISIBLE_JS, '不可见', timeout, driver)
+
+    def _wait_until_gone(self, locator, condition, predicate, state, timeout, driver):
+        if not isinstance(locator, tuple):
+            self.logger.error('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
+            raise Exception('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
+        if self.locator_listener:
+            self.locator_listener(locator)
         driver = self._get_driver(driver)
         try:
-            self._get_element(locator, element, driver)
-            self.logger.info("元素存在")
+            self._until(driver, condition, timeout, predicate=predicate, args=locator)
+            self.logger.info("元素已%s：定位方式->%s, value值->%s" % (state, locator[0], locator[1]))
             return True
-        except:
-            self.logger.info("元素不存在")
+        except TimeoutException:
+            self.logger.info("等待元素%s超时：定位方式->%s, value值->%s" % (state, locator[0], locator[1]))
             return False
 
-    def is_title(self, title='', driver=None):
+    def is_title(self, title='', driver=None, timeout=None):
         '''判断标题是否相同，返回bool'''
         driver = self._get_driver(driver)
         try:
-            result = WebDriverWait(driver, self.timeout, self.t).until(EC.title_is(title))
+            result = self._until(driver, EC.title_is(title), timeout, predicate=waits.TITLE_IS_JS, args=(title,))
             self.logger.info('标题相同：%s'%title)
             return result
         except:
             self.logger.info('标题不相同：%s' % title)
             return False
 
-    def is_title_contains(self, title='', driver=None):
+    def is_title_contains(self, title='', driver=None, timeout=None):
         '''判断标题是否包含，返回bool'''
         driver = self._get_driver(driver)
         try:
-            result = WebDriverWait(driver, self.timeout, self.t).until(EC.title_contains(title))
+            result = self._until(driver, EC.title_contains(title), timeout, predicate=waits.TITLE_CONTAINS_JS, args=(title,))
             self.logger.info('标题包含：%s' % title)
             return result
         except:
             self.logger.info('标题没有包含：%s' % title)
             return False
 
-    def is_element_contains_text(self, locator, text='', driver=None):
+    def is_element_contains_text(self, locator, text='', driver=None, timeout=None):
         '''判断元素是否包含预期的字符串，返回bool'''
         if not isinstance(locator, tuple):
             self.logger.error('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
             raise Exception('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
+        if self.locator_listener:
+            self.locator_listener(locator)
         driver = self._get_driver(driver)
         try:
-            result = WebDriverWait(driver, self.timeout, self.t).until(EC.text_to_be_present_in_element(locator, text))
+            result = self._until(driver, EC.text_to_be_present_in_element(locator, text), timeout,
+                                 predicate=waits.TEXT_IN_ELEMENT_JS, args=locator + (text,))
             self.logger.info('元素文本值包含：%s'%text)
             return result
         except:
             self.logger.info('元素文本值没有包含：%s' % text)
             return False
 
-    def is_elementValue_contains_value(self, locator, value='', driver=None):
+    def is_elementValue_contains_value(self, locator, value='', driver=None, timeout=None):
         '''判断元素的value属性值是否包含预期的value，返回bool'''
         if not isinstance(locator, tuple):
             self.logger.error('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
             raise Exception('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
+        if self.locator_listener:
+            self.locator_listener(locator)
         driver = self._get_driver(driver)
         try:
-            result = WebDriverWait(driver, self.timeout, self.t).until(EC.text_to_be_present_in_element_value(locator, value))
+            result = self._until(driver, EC.text_to_be_present_in_element_value(locator, value), timeout,
+                                 predicate=waits.VALUE_IN_ELEMENT_JS, args=locator + (value,))
             self.logger.info('元素的value属性值包含：%s'%value)
             return result
         except:
@@ -163,35 +379,59 @@ class Base:
         '''判断alert,存在返回alert实例，不存在，返回false'''
         driver = self._get_driver(driver)
         try:
-            result = WebDriverWait(driver, timeout, self.t).until(EC.alert_is_present())
+            result = self._until(driver, EC.alert_is_present(), timeout)
             self.logger.info('有alert弹框')
             return result
         except:
             self.logger.info('没有alert弹框')
             return False
 
+    def wait_for_page_idle(self, quiet=0.5, timeout=None, driver=None):
+        '''
+        等待页面稳定：加载完成、没有进行中的fetch/XHR请求、DOM连续quiet秒没有变化，代替固定的sleep
+        页面空闲返回True，超时返回False；等待的秒数记录在last_idle_time
+        get/refresh/forward/back跳转时注入空闲检测的埋点，chrome上点击跳转打开的新页面也自动埋点；
+        其他浏览器上不是通过这几个方法打开的页面，在第一次调用时才埋点，之前已经发出的请求统计不到
+        '''
+        driver = self._get_driver(driver)
+        timeout = self.timeout if timeout is None else timeout
+        elapsed = waits.page_idle(driver, timeout, quiet)
+        self.last_idle_time = elapsed
+        if elapsed is None:
+            self.logger.info("等待页面空闲超时：%s秒" % timeout)
+            return False
+        self.logger.info("页面空闲，等待%.2f秒" % elapsed)
+        return True
+
     def get(self, url, driver=None):
         '''打开地址'''
         driver = self._get_driver(driver)
-        driver.get(url)
+        self._navigate(driver, lambda: driver.get(url))
+        self._get_scope(driver).update(url=url, frames=(), frame_elements={})
+        parts = urlsplit(url)
+        if parts.scheme in ('http', 'https'):
+            self._origins.setdefault(id(driver), set()).add('%s://%s' % (parts.scheme, parts.netloc))
         self.logger.info('打开url：%s'%url)
 
     def refresh(self, driver=None):
         '''刷新页面'''
         driver = self._get_driver(driver)
-        driver.refresh()
+        self._navigate(driver, driver.refresh)
+        self._get_scope(driver).update(url=None, frames=(), frame_elements={})
         self.logger.info('刷新页面')
 
     def forward(self, driver=None):
         '''跳转到下一页'''
         driver = self._get_driver(driver)
-        driver.forward()
+        self._navigate(driver, driver.forward)
+        self._get_scope(driver).update(url=None, frames=(), frame_elements={})
         self.logger.info('跳转下一页')
 
     def back(self, driver=None):
         '''跳转到下一页'''
         driver = self._get_driver(driver)
-        driver.back()
+        self._navigate(driver, driver.back)
+        self._get_scope(driver).update(url=None, frames=(), frame_elements={})
         self.logger.info('跳转上一页')
 
     def maximize_window(self, driver=None):
@@ -216,6 +456,8 @@ class Base:
         '''关闭浏览器'''
         driver = self._get_driver(driver)
         driver.quit()
+        self.clear_element_cache(driver)
+        self._cache_scope.pop(id(driver), None)
         self.logger.info('关闭浏览器')
 
     def get_screenshot(self, file_path, driver=None):
@@ -270,35 +512,32 @@ class Base:
         self.logger.info('获取当前url：%s' % url)
         return url
 
-    def get_element_text(self, locator=None, element=None, driver=None):
+    def get_element_text(self, locator=None, element=None, driver=None, timeout=None):
         '''获取元素的文本'''
         try:
             driver = self._get_driver(driver)
-            element = self._get_element(locator, element, driver)
-            text = element.text
+            text = self._on_element(locator, element, driver, lambda e: e.text, timeout=timeout)
             self.logger.info('获取元素的文本：%s'%text)
             return text
         except:
             self.logger.info("获取text失败，返回''")
             return ""
 
-    def get_element_attribute(self, locator, name, element=None, driver=None):
+    def get_element_attribute(self, locator, name, element=None, driver=None, timeout=None):
         '''获取元素的属性'''
         driver = self._get_driver(driver)
         try:
-            element = self._get_element(locator, element, driver)
-            attribute = element.get_attribute(name)
-            self.logger.info('获取元素的%s属性：' %(name,attribute))
+            attribute = self._on_element(locator, element, driver, lambda e: e.get_attribute(name), timeout=timeout)
+            self.logger.info('获取元素的%s属性：%s' %(name,attribute))
             return attribute
         except:
-            self.logger.info("获取元素的%s属性失败，返回''")
+            self.logger.info("获取元素的%s属性失败，返回''" % name)
             return ""
 
-    def js_focus_element(self, locator=None, element=None, driver=None):
+    def js_focus_element(self, locator=None, element=None, driver=None, timeout=None):
         '''聚焦元素'''
         driver = self._get_driver(driver)
-        target_element = self._get_element(locator, element, driver)
-        driver.execute_script("arguments[0].scrollIntoView();", target_element)
+        self._on_element(locator, element, driver, lambda e: driver.execute_script("arguments[0].scrollIntoView();", e), timeout=timeout)
         self.logger.info("聚焦元素")
 
     def js_scroll_top(self, driver=None):
@@ -315,132 +554,287 @@ class Base:
         driver.execute_script(js)
         self.logger.info("滚动到底部")
 
-    def js_play_video(self, locator=None, element=None, driver=None):
+    def js_play_video(self, locator=None, element=None, driver=None, timeout=None):
         '''播放视频'''
         driver = self._get_driver(driver)
-        target_element = self._get_element(locator, element, driver)
         js = "arguments[0].play();"
-        driver.execute_script(js, target_element)
+        self._on_element(locator, element, driver, lambda e: driver.execute_script(js, e), timeout=timeout)
         self.logger.info("播放视频")
 
-    def select_by_index(self, locator, index=0, element=None, driver=None):
+    def select_by_index(self, locator, index=0, element=None, driver=None, timeout=None):
         '''下拉框，通过索引选择。index是索引第几个，从0开始，默认选第一个'''
         driver = self._get_driver(driver)
-        target_element = self._get_element(locator, element, driver)
-        Select(target_element).select_by_index(index)
+        self._on_element(locator, element, driver, lambda e: Select(e).select_by_index(index), timeout=timeout)
         self.logger.info("下拉框选择索引%s的值"%index)
 
-    def select_by_value(self, locator, value, element=None, driver=None):
+    def select_by_value(self, locator, value, element=None, driver=None, timeout=None):
         '''下拉框，通过value选择'''
         driver = self._get_driver(driver)
-        target_element = self._get_element(locator, element, driver)
-        Select(target_element).select_by_value(value)
+        self._on_element(locator, element, driver, lambda e: Select(e).select_by_value(value), timeout=timeout)
         self.logger.info("下拉框选择value:%s的值"%value)
 
-    def select_by_text(self, locator, text, element=None, driver=None):
+    def select_by_text(self, locator, text, element=None, driver=None, timeout=None):
         '''下拉框，通过文本值选择'''
         driver = self._get_driver(driver)
-        target_element = self._get_element(locator, element, driver)
-        Select(target_element).select_by_visible_text(text)
+        self._on_element(locator, element, driver, lambda e: Select(e).select_by_visible_text(text), timeout=timeout)
         self.logger.info("下拉框选择文本:%s的值" % text)
 
-    def deselect_by_index(self, locator, index=0, element=None, driver=None):
+    def deselect_by_index(self, locator, index=0, element=None, driver=None, timeout=None):
         '''下拉框，通过索引,取消选择。index是索引第几个，从0开始，默认取消第一个'''
         driver = self._get_driver(driver)
-        target_element = self._get_element(locator, element, driver)
-        Select(target_element).deselect_by_index(index)
+        self._on_element(locator, element, driver, lambda e: Select(e).deselect_by_index(index), timeout=timeout)
         self.logger.info("下拉框取消选择索引%s的值" % index)
 
-    def deselect_by_value(self, locator, value, element=None, driver=None):
+    def deselect_by_value(self, locator, value, element=None, driver=None, timeout=None):
         '''下拉框，通过value，取消选择'''
         driver = self._get_driver(driver)
-        target_element = self._get_element(locator, element, driver)
-        Select(target_element).deselect_by_index(value)
+        self._on_element(locator, element, driver, lambda e: Select(e).deselect_by_index(value), timeout=timeout)
         self.logger.info("下拉框取消选择value:%s的值"%value)
 
-    def deselect_by_text(self, locator, text, element=None, driver=None):
+    def deselect_by_text(self, locator, text, element=None, driver=None, timeout=None):
         '''下拉框，通过文本值，取消选择'''
         driver = self._get_driver(driver)
-        target_element = self._get_element(locator, element, driver)
-        Select(target_element).deselect_by_visible_text(text)
+        self._on_element(locator, element, driver, lambda e: Select(e).deselect_by_visible_text(text), timeout=timeout)
         self.logger.info("下拉框取消选择文本:%s的值" % text)
 
-    def deselect_all(self, locator=None, element=None, driver=None):
+    def deselect_all(self, locator=None, element=None, driver=None, timeout=None):
         '''下拉框，取消选择'''
         driver = self._get_driver(driver)
-        target_element = self._get_element(locator, element, driver)
-        Select(target_element).deselect_all()
+        self._on_element(locator, element, driver, lambda e: Select(e).deselect_all(), timeout=timeout)
         self.logger.info("下拉框取消选择")
 
-    def get_select_options(self, locator=None, element=None, driver=None):
-        '''获取下拉框的所有options ； 遍历之后 .text可以获取该文本值'''
+    def get_select_options(self, locator=None, element=None, driver=None, timeout=None):
+        '''获取下拉框的所有options ； 遍历之后 .text可以获取该文本值；批量读取文本、value用snapshot更快'''
         driver = self._get_driver(driver)
-        target_element = self._get_element(locator, element, driver)
-        options = Select(target_element).options()
+        options = self._on_element(locator, element, driver, lambda e: Select(e).options, timeout=timeout)
         self.logger.info("获取下拉框的所有options")
         return options
 
-    def get_first_selected_option(self, locator=None, element=None, driver=None):
+    def get_first_selected_option(self, locator=None, element=None, driver=None, timeout=None):
         '''获取第一个被选中的option'''
         driver = self._get_driver(driver)
-        target_element = self._get_element(locator, element, driver)
-        first_option = Select(target_element).first_selected_option()
+        first_option = self._on_element(locator, element, driver, lambda e: Select(e).first_selected_option, timeout=timeout)
         self.logger.info("获取下拉框的第一个被选中的option")
         return first_option
 
-    def get_selected_options(self, locator=None, element=None, driver=None):
+    def get_selected_options(self, locator=None, element=None, driver=None, timeout=None):
         '''获取所有被选中的option'''
         driver = self._get_driver(driver)
-        target_element = self._get_element(locator, element, driver)
-        options = Select(target_element).all_selected_options()
+        options = self._on_element(locator, element, driver, lambda e: Select(e).all_selected_options, timeout=timeout)
         self.logger.info("获取下拉框的所有被选中的option")
         return options
 
+    def snapshot(self, locator=None, driver=None):
+        '''
+        DOM快照：一次execute_script取回locator元素（不传则为整个页面）的子树，见common.snapshot.DomSnapshot
+        之后的断言在本地查询，不再逐个元素请求浏览器：
+            snap = handle.snapshot(('id', 'result-table'))
+            rows = snap.texts('tbody tr')
+            selected = snap.select_one('option[selected]').get('value')
+        '''
+        driver = self._get_driver(driver)
+        if locator is not None:
+            if not isinstance(locator, tuple):
+                self.logger.error('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
+                raise Exception('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
+            if self.locator_listener:
+                self.locator_listener(locator)
+        data = driver.execute_script(SNAPSHOT_JS, list(locator) if locator else None)
+        if data is None:
+            # 元素还没出现时等待出现后再取一次
+            try:
+                self._until(driver, EC.presence_of_element_located(locator), predicate=waits.PRESENCE_JS, args=locator)
+            except Exception:
+                self.logger.error("DOM快照没定位到元素->%s, value值->%s" % (locator[0], locator[1]))
+                raise Exception("DOM快照没定位到元素->%s, value值->%s" % (locator[0], locator[1]))
+            data = driver.execute_script(SNAPSHOT_JS, list(locator))
+        self.logger.info("获取DOM快照：%s" % (locator[1] if locator else '整个页面'))
+        return DomSnapshot(data)
+
     def switch_iframe(self, id_name_index_locator, driver=None):
-        '''切换iframe ； 可以传入id、name、index以及selenium的WebElement对象'''
+        '''切换iframe（相对当前frame） ； 可以传入id、name、index、locator以及selenium的WebElement对象'''
         driver = self._get_driver(driver)
+        scope = self._get_scope(driver)
         try:
-            if isinstance(id_name_index_locator, tuple):
-                element = self.find_element(id_name_index_locator)
-                driver.switch_to.frame(element)
-            driver.switch_to.frame(id_name_index_locator)
+            self._enter_frame(driver, scope, scope['frames'] + (id_name_index_locator,))
             self.logger.info("切换iframe")
-        except:
+        except Exception:
             self.logger.error("切换iframe异常", exc_info=True)
             raise Exception("切换iframe异常")
 
+    def _frame_element(self, driver, scope, path):
+        '''
+        path最后一层frame的元素；locator定位到的元素按frame路径缓存，嵌套iframe不用每次重新定位
+        id/name只在开启元素缓存时定位并缓存，否则直接交给selenium切换
+        '''
+        ref = path[-1]
+        if isinstance(ref, int) or not isinstance(ref, (str, tuple)) or (isinstance(ref, str) and not self.cache_elements):
+            return ref  # index、WebElement、id/name直接切换
+        cache = scope['frame_elements']
+        element = cache.get(path)
+        if element is None:
+            if isinstance(ref, tuple):
+                element = self.find_element(ref, driver)
+            else:
+                found = self.probe(('id', ref), driver) or self.probe(('name', ref), driver)
+                element = found[0] if found else None
+            if not element:
+                raise NoSuchFrameException(str(ref))
+            cache[path] = element
+        return element
+
+    def _enter_frame(self, driver, scope, path):
+        '''从当前frame（path的上一层）切换到path的最后一层；缓存的frame元素过期时重新定位'''
+        try:
+            driver.switch_to.frame(self._frame_element(driver, scope, path))
+        except (StaleElementReferenceException, NoSuchFrameException):
+            cache = scope['frame_elements']
+            if path not in cache:
+                raise
+            # 页面刷新过，清掉这一层及以下的缓存后重新定位
+            for key in [key for key in cache if key[:len(path)] == path]:
+                del cache[key]
+            driver.switch_to.frame(self._frame_element(driver, scope, path))
+        self.clear_element_cache(driver)
+        scope['frames'] = path
+
+    def switch_to_frames(self, path=(), driver=None):
+        '''
+        切换到从最外层开始的frame路径，如(外层iframe, 内层iframe)，空元组为最外层页面
+        和当前所在的frame比较，只发送必要的切换命令：已经在目标frame时不切换，只差几层时只切换差的层
+        '''
+        driver = self._get_driver(driver)
+        scope = self._get_scope(driver)
+        path, current = tuple(path), scope['frames']
+        if path == current:
+            self.logger.info("已在目标iframe中，不切换")
+            return
+        common = 0
+        while common < min(len(path), len(current)) and path[common] == current[common]:
+            common += 1
+        # 回到公共的上层：逐层parent或者直接回到最外层再往下切，取命令少的
+        up = len(current) - common
+        if up and up <= 1 + common:
+            for _ in range(up):
+                driver.switch_to.parent_frame()
+            scope['frames'] = current[:common]
+        elif up:
+            driver.switch_to.default_content()
+            scope['frames'] = ()
+        for depth in range(len(scope['frames']), len(path)):
+            self._enter_frame(driver, scope, path[:depth + 1])
+        self.clear_element_cache(driver)
+        self.logger.info("切换到iframe：%s" % (', '.join(str(ref) for ref in path) or '最外层页面'))
+
+    @contextlib.contextmanager
+    def in_frame(self, *frames, driver=None):
+        '''
+        在iframe中执行，结束后回到原来的frame；frames相对当前frame，多个时逐层进入，可以嵌套使用：
+            with handle.in_frame(Page.外层iframe, Page.内层iframe):
+                handle.click(Page.保存按钮)
+        已经在目标frame中时不发送切换命令
+        '''
+        driver = self._get_driver(driver)
+        previous = self._get_scope(driver)['frames']
+        self.switch_to_frames(previous + frames, driver)
+        try:
+            yield self
+        finally:
+            self.switch_to_frames(previous, driver)
+
     def switch_default_content(self, driver=None):
-        '''释放iframe'''
+        '''释放iframe；已经在最外层时不发送命令'''
         driver = self._get_driver(driver)
-        driver.switch_to.default_content()
+        scope = self._get_scope(driver)
+        if scope['frames']:
+            driver.switch_to.default_content()
+            self.clear_element_cache(driver)
+            scope['frames'] = ()
         self.logger.info("释放iframe")
 
     def switch_parent_iframe(self, driver=None):
-        '''回到父级的iframe'''
+        '''回到父级的iframe；已经在最外层时不发送命令'''
         driver = self._get_driver(driver)
-        driver.switch_to.parent_frame()
+        scope = self._get_scope(driver)
+        if scope['frames']:
+            driver.switch_to.parent_frame()
+            self.clear_element_cache(driver)
+            scope['frames'] = scope['frames'][:-1]
         self.logger.info("回到父级的iframe")
 
     def get_current_handle(self, driver=None):
         '''获取当前句柄窗口'''
         driver = self._get_driver(driver)
-        handle = driver.current_window_handle()
+        handle = driver.current_window_handle
         self.logger.info("获取当前句柄窗口")
         return handle
 
     def get_handles(self, driver=None):
         '''获取所有的句柄窗口'''
         driver = self._get_driver(driver)
-        handles = driver.window_handles()
+        handles = driver.window_handles
         self.logger.info("获取所有的句柄窗口")
         return handles
 
     def switch_handle(self, handle, driver=None):
-        '''切换句柄窗口'''
+        '''
+        切换句柄窗口；本次租用中已经通过switch_handle切换到这个窗口的最外层页面时不发送命令
+        其他代码（如driver.switch_to.window）切换过窗口时，先调用forget_window
+        '''
         driver = self._get_driver(driver)
-        driver.switch_to.window(handle)
+        scope = self._get_scope(driver)
+        if scope['window'] != handle or scope['frames']:
+            driver.switch_to.window(handle)
+            scope.update(window=handle, frames=(), frame_elements={})
         self.logger.info("切换句柄窗口")
 
+    def forget_window(self, driver=None):
+        '''忘记switch_handle记录的窗口，下次switch_handle一定发送命令；DriverPool每次租用时调用'''
+        for key, scope in self._cache_scope.items():
+            if driver is None or key == id(driver):
+                scope['window'] = None
+        self.clear_element_cache(driver)
+
+    def reset_context(self, url='about:blank', driver=None):
+        '''
+        用例之间重置浏览器，代替重启浏览器：关闭多余的窗口、退出iframe、清空cookie和本地存储，再打开url
+        保留home_window（没有记录或者已被关闭时保留第一个窗口），关闭其他窗口
+        js只能清空当前页面域名的cookie和存储；chrome通过CDP删除所有域名的cookie，并清空通过get打开过的域名的存储，
+        其他浏览器中，点击跳转等方式打开的其他域名的localStorage、IndexedDB不会被清空
+        重置成功返回True，失败返回False（此时应该重启浏览器）
+        '''
+        driver = self._get_driver(driver)
+        try:
+            handles = driver.window_handles
+            home = self.home_window if driver is self.driver and self.home_window in handles else handles[0]
+            if len(handles) > 1:
+                for handle in handles:
+                    if handle != home:
+                        driver.switch_to.window(handle)
+                        driver.close()
+                driver.switch_to.window(home)
+            elif self._get_scope(driver)['frames']:
+                driver.switch_to.default_content()
+            driver.execute_script(RESET_JS)
+            if hasattr(driver, 'execute_cdp_cmd'):
+                driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+                for origin in sorted(self._origins.get(id(driver), ())):
+                    driver.execute_cdp_cmd('Storage.clearDataForOrigin', {
+                        'origin': origin, 'storageTypes': 'local_storage,indexeddb,cache_storage,service_workers'})
+            else:
+                driver.delete_all_cookies()
+            driver.get(url)
+        except Exception:
+            self.logger.error("重置浏览器失败", exc_info=True)
+            return False
+        if driver is self.driver:
+            self.home_window = home
+        self.clear_element_cache(driver)
+        self._cache_scope.pop(id(driver), None)
+        self._origins.pop(id(driver), None)
+        self.logger.info("重置浏览器：关闭了%s个窗口" % (len(handles) - 1))
+        return True
+
     def switch_alert(self, driver=None):
         '''切换到alert ；'''
         driver = self._get_driver(driver)
@@ -464,41 +858,44 @@ class Base:
         driver.execute_script(js)
         self.logger.info("执行js脚本--> %s"%js)
 
-    def move_to_element(self, locator=None, element=None, driver=None):
+    def move_to_element(self, locator=None, element=None, driver=None, timeout=None):
         '''鼠标悬停到某个元素上'''
         driver = self._get_driver(driver)
-        element = self._get_element(locator, element, driver)
-        ActionChains(driver).move_to_element(element).perform()
+        self._on_element(locator, element, driver, lambda e: ActionChains(driver).move_to_element(e).perform(), timeout=timeout)
         self.logger.info("鼠标悬停到元素上")
 
-    def double_click(self, locator=None, element=None, driver=None):
+    def double_click(self, locator=None, element=None, driver=None, timeout=None):
         '''双击鼠标'''
         driver = self._get_driver(driver)
-        element = self._get_element(locator, element, driver)
-        ActionChains(driver).double_click(element).perform()
+        self._on_element(locator, element, driver, lambda e: ActionChains(driver).double_click(e).perform(), timeout=timeout)
         self.logger.info("双击鼠标")
 
-    def context_click(self, locator=None, element=None, driver=None):
+    def context_click(self, locator=None, element=None, driver=None, timeout=None):
         '''点击鼠标右键'''
         driver = self._get_driver(driver)
-        element = self._get_element(locator, element, driver)
-        ActionChains(driver).context_click(element).perform()
+        self._on_element(locator, element, driver, lambda e: ActionChains(driver).context_click(e).perform(), timeout=timeout)
         self.logger.info("点击鼠标右键")
 
-    def drag_element(self, from_locator, to_locator, driver=None):
+    def drag_element(self, from_locator, to_locator, driver=None, timeout=None):
         '''拖动元素（原元素--->目标元素）'''
         driver = self._get_driver(driver)
-        from_element = self.find_element(from_locator, driver)
-        to_element = self.find_element(to_locator, driver)
+        from_element = self.find_element(from_locator, driver, timeout)
+        to_element = self.find_element(to_locator, driver, timeout)
         ActionChains(driver).drag_and_drop(from_element, to_element).perform()
         self.logger.info("拖动元素")
 
+    def macro(self, driver=None, mode='script'):
+        '''
+        动作序列，多个fill/click/select/clear/scroll步骤一次请求执行，见common.macro.ActionMacro
+        handle.macro().fill(loc_kw, 'selenium').click(loc_su).run()
+        '''
+        return ActionMacro(self, driver, mode)
+
 
 
 
 if __name__ == '__main__':
     from selenium import webdriver
-    from time import sleep
     from selenium.webdriver.chrome.options import Options
     from logger import Logger
 
@@ -514,13 +911,12 @@ if __name__ == '__main__':
     handle.set_page_load_timeout()
     handle.get('http://www.baidu.com')
     handle.send_keys(('id', 'kw'), '哦哦哦哦')  # 初始化传了driver的，默认用初始化的driver
-    sleep(1)
+    handle.wait_for_page_idle()  # 等页面稳定，代替固定的sleep
 
     handle.clear(('id', 'kw'), driver=driver)   # 初始化没有传driver，或者传了driver的；调方法时，传driver会优先用方法传的driver
-
-    sleep(2)
+    handle.wait_for_page_idle()
     search_btn_ele = handle.find_element(('id', 'su'))
     handle.double_click(element=search_btn_ele) # 可以传locator或者element，其中一个，去操作
-    sleep(2)
+    handle.wait_for_page_idle()
     handle.close()
 
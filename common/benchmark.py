@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/16 14:20'
+import json
+import os
+import time
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+class Benchmark:
+    '''
+    Base方法的基准测试：每个操作执行rounds轮，统计每次操作的WebDriver命令数和耗时
+    command_counter： 返回已发送命令总数的函数（假WebDriver的server.total），真实浏览器统计不到命令数时为None
+    '''
+    def __init__(self, command_counter=None, rounds=20, warmup=1):
+        self.command_counter = command_counter
+        self.rounds = rounds
+        self.warmup = warmup
+        self.results = {}
+
+    def run(self, name, fn, setup=None, rounds=None):
+        '''
+        执行并记录一个操作，setup在每轮之前执行，不计入命令数和耗时
+        返回{"commands": 每次操作的命令数, "mean": 秒, "p50": 秒, "p95": 秒}
+        '''
+        rounds = rounds or self.rounds
+        for _ in range(self.warmup):
+            if setup:
+                setup()
+            fn()
+        durations, commands = [], 0
+        for _ in range(rounds):
+            if setup:
+                setup()
+            before = self.command_counter() if self.command_counter else 0
+            start = time.perf_counter()
+            fn()
+            durations.append(time.perf_counter() - start)
+            if self.command_counter:
+                commands += self.command_counter() - before
+        result = {
+            'commands': round(commands / float(rounds), 2) if self.command_counter else None,
+            'mean': round(sum(durations) / len(durations), 6),
+            'p50': round(_percentile(durations, 50), 6),
+            'p95': round(_percentile(durations, 95), 6),
+        }
+        self.results[name] = result
+        return result
+
+
+def compare(results, baseline, tolerance=0.5, min_latency=0.002):
+    '''
+    和基线对比，返回退化的操作说明列表
+    命令数只要比基线多就算退化
+    耗时按相对值比较，不受机器快慢影响：先取所有操作p50相对基线倍数的中位数作为本机的速度系数，
+    某个操作的倍数超过速度系数的(1 + tolerance)倍，且多出的部分超过min_latency秒才算退化
+    '''
+    regressions = []
+    ratios = dict((name, result['p50'] / baseline[name]['p50']) for name, result in results.items()
+                  if baseline.get(name) and baseline[name].get('p50'))
+    factor = sorted(ratios.values())[len(ratios) // 2] if ratios else 1.0
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result['commands'] is not None and base.get('commands') is not None \
+                and result['commands'] > base['commands']:
+            regressions.append('%s：命令数 %s -> %s' % (name, base['commands'], result['commands']))
+        expected = base['p50'] * factor
+        if name in ratios and ratios[name] > factor * (1 + tolerance) and result['p50'] - expected > min_latency:
+            regressions.append('%s：耗时p50 %.2fms -> %.2fms（按本机速度系数%.2f折算，预期%.2fms）' % (
+                name, base['p50'] * 1000, result['p50'] * 1000, factor, expected * 1000))
+    return regressions
+
+
+def load_baseline(file_path, backend):
+    '''基线文件按后端分开保存：{"fake": {操作名: 结果}, "chrome": {...}}'''
+    if not os.path.exists(file_path):
+        return {}
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get(backend, {})
+
+
+def save_baseline(file_path, backend, results):
+    data = {}
+    if os.path.exists(file_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    data[backend] = results
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1, sort_keys=True)
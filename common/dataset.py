@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/20 15:20'
+import csv
+import hashlib
+import json
+import os
+import pickle
+import random
+import re
+from array import array
+
+import yaml
+
+# 有libyaml时用C实现的loader，快很多
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def iter_records(file_path):
+    '''
+    逐条读取数据文件，生成器，不会一次读入整个文件
+    .csv： 每行为一个dict（第一行为表头）
+    .jsonl： 每行一个json
+    .yaml/.yml： 多文档yaml（---分隔），每个文档一条数据
+    '''
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == '.csv':
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+            for row in csv.DictReader(f):
+                yield row
+    elif ext == '.jsonl':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif ext in ('.yaml', '.yml'):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for document in yaml.load_all(f, Loader=YamlLoader):
+                if document is not None:
+                    yield document
+    else:
+        raise Exception('不支持的数据文件格式：%s，只支持csv、jsonl、yaml' % file_path)
+
+
+def parse_slice(value):
+    '''
+    --data-slice参数：
+        start:stop[:step]   和python切片相同，如0:100、::50、-10:
+        random:N[:seed]     随机抽取N条，seed默认为0，xdist的每个worker抽到的相同
+    '''
+    parts = value.split(':')
+    try:
+        if parts[0] == 'random':
+            if len(parts) not in (2, 3):
+                raise ValueError
+            return ('random', int(parts[1]), int(parts[2]) if len(parts) == 3 else 0)
+        if not 2 <= len(parts) <= 3:
+            raise ValueError
+        return slice(*[int(part) if part else None for part in parts])
+    except ValueError:
+        raise ValueError('--data-slice参数格式错误：%s，如0:100、::10、random:50' % value)
+
+
+def select(count, selection):
+    '''按parse_slice的结果选出数据的序号，range或者排好序的列表，不会生成全部序号'''
+    if selection is None:
+        return range(count)
+    if isinstance(selection, slice):
+        return range(count)[selection]
+    _, size, seed = selection
+    return sorted(random.Random(seed).sample(range(count), min(size, count)))
+
+
+class Dataset:
+    '''
+    数据集：第一次使用时把数据文件逐条转存为二进制缓存（每条pickle一次，记录偏移），按文件内容hash命名
+    之后只读索引（偏移和id），每条数据在用例执行时才按偏移读取，收集用例的时间和内存只和id有关
+    file_path： 数据文件；id_field： 作为用例id的字段，不传时用序号
+    cache_dir： 缓存文件夹
+    '''
+    def __init__(self, file_path, cache_dir, id_field=None):
+        self.file_path = file_path
+        self.id_field = id_field
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        name = re.sub(r'[^\w.-]+', '_', os.path.basename(file_path))
+        key = '%s-%s-%s' % (name, self._file_hash(cache_dir, name), id_field or '')
+        self.data_path = os.path.join(cache_dir, key + '.bin')
+        index_path = os.path.join(cache_dir, key + '.idx')
+        if not (os.path.exists(index_path) and os.path.exists(self.data_path)):
+            self._build(index_path)
+        with open(index_path, 'rb') as f:
+            self.offsets, self.ids = pickle.load(f)
+
+    def _file_hash(self, cache_dir, name):
+        '''文件内容的sha1；文件大小和修改时间没变时用上次算的结果，不重新读整个文件'''
+        stat = os.stat(self.file_path)
+        memo_path = os.path.join(cache_dir, name + '.hash')
+        try:
+            with open(memo_path, 'r') as f:
+                memo = json.load(f)
+            if memo['path'] == os.path.abspath(self.file_path) and memo['size'] == stat.st_size \
+                    and memo['mtime'] == stat.st_mtime_ns:
+                return memo['sha1']
+        except (OSError, ValueError, KeyError):
+            pass
+        sha1 = hashlib.sha1()
+        with open(self.file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha1.update(chunk)
+        memo = {'path': os.path.abspath(self.file_path), 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                'sha1': sha1.hexdigest()}
+        self._write_atomic(memo_path, json.dumps(memo).encode('utf-8'))
+        return memo['sha1']
+
+    @staticmethod
+    def _write_atomic(path, data):
+        # xdist的多个worker可能同时生成，先写临时文件再改名
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _build(self, index_path):
+        '''逐条读取数据文件写入缓存，内存中只保留偏移和id'''
+        offsets, ids = array('Q'), []
+        tmp_path = '%s.%s.tmp' % (self.data_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            for number, record in enumerate(iter_records(self.file_path)):
+                offsets.append(f.tell())
+                pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+                value = record.get(self.id_field) if self.id_field and isinstance(record, dict) else None
+                ids.append(str(number) if value is None else str(value))
+        os.replace(tmp_path, self.data_path)
+        self._write_atomic(index_path, pickle.dumps((offsets, ids), protocol=pickle.HIGHEST_PROTOCOL))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def record(self, index):
+        '''按序号读取一条数据'''
+        with open(self.data_path, 'rb') as f:
+            f.seek(self.offsets[index])
+            return pickle.load(f)
+
+
+class DatasetPlugin:
+    '''
+    数据驱动插件：
+        @pytest.mark.dataset('data/search_terms.csv', id_field='term')
+        def test_search(handle, data):
+            handle.send_keys(BaiduHomePage.输入框, data['term'])
+    数据文件的路径相对用例文件，找不到时相对当前目录；每条数据生成一个用例，data为这条数据
+    参数化的值只是数据的序号，用例执行时才读取数据；selection为parse_slice的结果，只运行选中的数据
+    '''
+    def __init__(self, cache_dir, selection=None):
+        self.cache_dir = cache_dir
+        self.selection = selection
+        self.datasets = {}
+
+    def dataset(self, file_path, id_field=None):
+        key = (file_path, id_field)
+        if key not in self.datasets:
+            self.datasets[key] = Dataset(file_path, self.cache_dir, id_field)
+        return self.datasets[key]
+
+    def pytest_generate_tests(self, metafunc):
+        marker = metafunc.definition.get_closest_marker('dataset')
+        if marker is None:
+            return
+        file_path = marker.args[0] if marker.args else marker.kwargs['path']
+        if not os.path.isabs(file_path):
+            local_path = os.path.join(os.path.dirname(str(metafunc.definition.fspath)), file_path)
+            file_path = local_path if os.path.exists(local_path) else os.path.abspath(file_path)
+        id_field = marker.kwargs.get('id_field')
+        dataset = self.dataset(file_path, id_field)
+        indexes = select(len(dataset), self.selection)
+        metafunc.parametrize('data', [(file_path, id_field, index) for index in indexes],
+                             ids=[dataset.ids[index] for index in indexes], indirect=True)
+
+    def record(self, param):
+        file_path, id_field, index = param
+        return self.dataset(file_path, id_field).record(index)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/12 10:20'
+import queue
+import threading
+import time
+
+from common.base_selenium import Base
+
+
+class DriverPool:
+    '''
+    浏览器池：按需启动最多size个浏览器，每个用例租用一个Base实例，用例结束后归还
+    driver_factory： 无参函数，返回一个新的webdriver实例
+    logger： Base使用的logger
+    size： 池中浏览器的最大数量，默认为1
+    timeout： 池中浏览器全部被占用时，等待归还的最长时间（秒）
+    validate： 租用前检查空闲Base实例是否可用的函数，返回False的浏览器会被关闭并重新启动
+    reset： 归还时是否重置浏览器（关闭多余窗口、清空cookie和存储等，见Base.reset_context），重置失败的浏览器会被重启
+    recycle_after： 每个浏览器最多运行的用例数，达到后关闭，下次租用时重新启动；为1时即每个用例一个新浏览器
+    base_kwargs： 创建Base实例时的其他参数，如cache_elements=True
+    '''
+    def __init__(self, driver_factory, logger, size=1, timeout=300, validate=None, reset=False, recycle_after=None,
+                 **base_kwargs):
+        self.driver_factory = driver_factory
+        self.validate = validate
+        self.reset = reset
+        self.recycle_after = recycle_after
+        self._uses = {}  # {id(handle): 已运行的用例数}
+        self.base_kwargs = base_kwargs
+        self.logger = logger
+        self.size = max(int(size), 1)
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()  # 后进先出，优先复用刚归还的浏览器
+        self._handles = []
+        self._starting = 0  # 正在启动的浏览器数，启动时已占用池中的位置
+        self._lock = threading.Lock()
+
+    def _start_handle(self):
+        '''启动一个新的浏览器，池已满时返回None；锁内只预占位置，启动浏览器在锁外，多个线程可以同时启动'''
+        with self._lock:
+            if len(self._handles) + self._starting >= self.size:
+                return None
+            self._starting += 1
+        try:
+            driver = self.driver_factory()
+        except Exception:
+            with self._lock:
+                self._starting -= 1
+            raise
+        handle = Base(driver=driver, logger=self.logger, **self.base_kwargs)
+        with self._lock:
+            self._starting -= 1
+            self._handles.append(handle)
+            count = len(self._handles)
+        self.logger.info("浏览器池启动第%s个浏览器" % count)
+        return handle
+
+    def lease(self):
+        '''租用一个Base实例；有空闲的直接返回，否则启动新的浏览器，池满时等待归还'''
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                handle = self._idle.get_nowait()
+            except queue.Empty:
+                handle = self._start_handle()
+                if handle is None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.logger.error("浏览器池等待超时：%s秒内没有可用的浏览器" % self.timeout)
+                        raise Exception("浏览器池等待超时：%s秒内没有可用的浏览器" % self.timeout)
+                    # 每秒重试一次，其他线程关闭浏览器空出位置时可以启动新的
+                    try:
+                        handle = self._idle.get(timeout=min(remaining, 1))
+                    except queue.Empty:
+                        continue
+            if self.validate is None or self.validate(handle):
+                break
+            self.discard(handle)
+        # 上一个用例可能绕过switch_handle切换过窗口，记录的窗口不再可信
+        handle.forget_window()
+        if handle.home_window is None:
+            # 新浏览器只有一个窗口，即reset_context时保留的窗口；用例中切换、关闭窗口不影响
+            handle.home_window = handle.driver.current_window_handle
+        self.logger.info("租用浏览器")
+        return handle
+
+    def discard(self, handle):
+        '''关闭不可用的浏览器，从池中移除，空出的位置下次租用时重新启动'''
+        with self._lock:
+            if handle in self._handles:
+                self._handles.remove(handle)
+            self._uses.pop(id(handle), None)
+        try:
+            handle.driver.quit()
+        except Exception:
+            self.logger.error("关闭浏览器异常", exc_info=True)
+        self.logger.info("关闭浏览器，已从池中移除")
+
+    def release(self, handle):
+        '''归还Base实例；按reset、recycle_after重置或者关闭浏览器'''
+        uses = self._uses[id(handle)] = self._uses.get(id(handle), 0) + 1
+        if self.recycle_after and uses >= self.recycle_after:
+            self.logger.info("浏览器已运行%s个用例，关闭后重新启动" % uses)
+            self.discard(handle)
+            return
+        if self.reset and not handle.reset_context():
+            self.discard(handle)
+            return
+        self._idle.put(handle)
+        self.logger.info("归还浏览器")
+
+    def close(self):
+        '''关闭池中所有浏览器'''
+        with self._lock:
+            handles, self._handles = self._handles, []
+            self._uses.clear()
+        for handle in handles:
+            try:
+                handle.driver.quit()
+            except Exception:
+                self.logger.error("关闭浏览器异常", exc_info=True)
+        self._idle = queue.LifoQueue()
+        self.logger.info("关闭浏览器池，共%s个浏览器" % len(handles))
@@ -0,0 +1,512 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/16 10:15'
+import base64
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ELEMENT_KEY = 'element-6066-11e4-a52e-4f735466cecf'
+
+# 1x1的png，截图接口返回
+PIXEL_PNG = base64.b64encode(
+    b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x02\x00\x00\x00\x90wS\xde\x00\x00'
+    b'\x00\x0cIDATx\x9cc\xf8\xff\xff?\x00\x05\xfe\x02\xfe\xa7\x35\x81\x84\x00\x00\x00\x00IEND\xaeB`\x82'
+).decode('ascii')
+
+_ids = itertools.count(1)
+_ATTR_SELECTOR = re.compile(r'^(\w*)\[([\w-]+)\s*=\s*["\']?(.*?)["\']?\]$')
+_TEXT_XPATH = re.compile(r'^\.?//([\w*]+)\[normalize-space\(\.\)\s*=\s*["\'](.*)["\']\]$')
+# Base中滚动、聚焦、播放视频的简单脚本，假页面上没有效果，返回None
+_NOOP_SCRIPT = re.compile(r'^(window\.scrollTo\([^;]*\)|arguments\[0\]\.(scrollIntoView|play)\(\);)$')
+
+
+class FakeElement:
+    '''
+    假页面中的元素；按常见的定位写法自动生成可匹配的selector：
+    tag、#id、[id="id"]、[name="name"]、.class，以及xpaths、link_text中传入的值
+    '''
+    def __init__(self, tag='div', id=None, name=None, cls=None, text='', attrs=None, selected=False,
+                 enabled=True, children=(), frame=None, xpaths=(), selectors=()):
+        self.element_id = 'fake-%s' % next(_ids)
+        self.tag = tag
+        self.text = text
+        self.attrs = dict(attrs or {})
+        self.selected = selected
+        self.enabled = enabled
+        self.children = list(children)
+        self.frame = frame  # iframe元素对应的FakePage
+        self.value = self.attrs.get('value', '')
+        css = {tag}
+        if id:
+            css |= {'#%s' % id, '[id="%s"]' % id, '%s#%s' % (tag, id)}
+            self.attrs['id'] = id
+        if name:
+            css.add('[name="%s"]' % name)
+            self.attrs['name'] = name
+        if cls:
+            css.add('.%s' % cls)
+            self.attrs['class'] = cls
+        self.match = {'css selector': css | set(selectors), 'xpath': set(xpaths),
+                      'link text': {text} if tag == 'a' else set(),
+                      'partial link text': {text} if tag == 'a' else set()}
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            for element in child.walk():
+                yield element
+
+    def matches(self, using, value):
+        if using == 'partial link text':
+            return self.tag == 'a' and value in self.text
+        if value in self.match.get(using, ()):
+            return True
+        # 属性选择器，如option[value ="bj"]
+        attr = using == 'css selector' and _ATTR_SELECTOR.match(value)
+        if attr:
+            tag, name, expected = attr.groups()
+            return tag in ('', self.tag) and self.attrs.get(name) == expected
+        # 按文本的xpath，如.//option[normalize-space(.) = "北京"]
+        text = using == 'xpath' and _TEXT_XPATH.match(value)
+        if text:
+            tag, expected = text.groups()
+            return tag in ('*', self.tag) and self.text.strip() == expected
+        return False
+
+
+class FakePage:
+    '''假页面：title、url和元素树'''
+    def __init__(self, title='', url='about:blank', elements=()):
+        self.title = title
+        self.url = url
+        self.elements = list(elements)
+
+    def walk(self):
+        for element in self.elements:
+            for child in element.walk():
+                yield child
+
+    def find(self, using, value, root=None):
+        elements = root.children if root else self.elements
+        return [e for top in elements for e in top.walk() if e.matches(using, value)]
+
+
+class _FakeError(Exception):
+    def __init__(self, status, error, message=''):
+        self.status, self.error, self.message = status, error, message
+
+
+class _Session:
+    def __init__(self, page):
+        self.page = page
+        self.frames = []  # 当前frame路径上的FakePage
+        self.cookies = {}
+        self.window = 'window-1'
+        self.focus = None  # Actions最后点击的元素，键盘输入到这个元素
+
+    @property
+    def context(self):
+        return self.frames[-1] if self.frames else self.page
+
+    def element(self, element_id):
+        pages = [self.page]
+        while pages:
+            page = pages.pop()
+            for element in page.walk():
+                if element.element_id == element_id:
+                    return element
+                if element.frame:
+                    pages.append(element.frame)
+        raise _FakeError(404, 'no such element', element_id)
+
+
+def _ref(element):
+    return {ELEMENT_KEY: element.element_id}
+
+
+class FakeWebDriverServer:
+    '''
+    进程内的假WebDriver远程服务（W3C协议），不需要浏览器；记录每种命令的调用次数，可以注入固定延迟
+    用法：
+        server = FakeWebDriverServer(page_factory=lambda: FakePage(...)).start()
+        driver = webdriver.Remote(command_executor=server.url, desired_capabilities={'browserName': 'fake'})
+    page_factory： 每个新会话调用一次，返回FakePage
+    latency： 每个命令的延迟（秒），模拟网络和浏览器耗时
+    '''
+    def __init__(self, page_factory=FakePage, latency=0.0, host='127.0.0.1', port=0):
+        self.page_factory = page_factory
+        self.latency = latency
+        self.commands = Counter()
+        self.sessions = {}
+        self._script_table = None
+        self._lock = threading.Lock()
+        server = self
+        handler = type('_Handler', (_FakeHandler,), {'fake': server})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%s' % (host, port)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        '''清空命令计数'''
+        with self._lock:
+            self.commands.clear()
+
+    @property
+    def total(self):
+        return sum(self.commands.values())
+
+    def _count(self, name):
+        with self._lock:
+            self.commands[name] += 1
+
+    def dispatch(self, method, path, body):
+        '''处理一个命令，返回value'''
+        parts = path.strip('/').split('/')
+        if parts == ['status']:
+            return {'ready': True, 'message': 'fake'}
+        if parts == ['session'] and method == 'POST':
+            self._count('newSession')
+            session_id = uuid.uuid4().hex
+            self.sessions[session_id] = _Session(self.page_factory())
+            return {'sessionId': session_id, 'capabilities': {'browserName': 'fake'}}
+        if len(parts) < 2 or parts[1] not in self.sessions:
+            raise _FakeError(404, 'invalid session id', path)
+        session = self.sessions[parts[1]]
+        rest = parts[2:]
+        # 命令名：元素id替换成:id，便于统计同类命令
+        name = '%s /%s' % (method, '/'.join(':id' if p.startswith('fake-') else p for p in rest))
+        self._count(name)
+        if self.latency:
+            time.sleep(self.latency)
+        if not rest:
+            if method == 'DELETE':
+                del self.sessions[parts[1]]
+            return None
+        return self._session_command(session, method, rest, body)
+
+    def _session_command(self, session, method, rest, body):
+        head = rest[0]
+        if head in ('element', 'elements') and len(rest) == 1:
+            found = session.context.find(body['using'], body['value'])
+            if head == 'elements':
+                return [_ref(e) for e in found]
+            if not found:
+                raise _FakeError(404, 'no such element', body['value'])
+            return _ref(found[0])
+        if head == 'element':
+            return self._element_command(session, session.element(rest[1]), method, rest[2:], body)
+        if head == 'execute':
+            return self._execute(session, body.get('script', ''), body.get('args', []), rest[-1] == 'async')
+        if head == 'url':
+            if method == 'POST':
+                session.page.url = body['url']
+                session.frames = []
+                return None
+            return session.page.url
+        if head == 'title':
+            return session.context.title
+        if head in ('refresh', 'back', 'forward'):
+            session.frames = []
+            return None
+        if head == 'frame':
+            if rest[1:] == ['parent']:
+                session.frames = session.frames[:-1]
+                return None
+            frame_id = body.get('id')
+            if frame_id is None:
+                session.frames = []
+            elif isinstance(frame_id, dict):
+                session.frames.append(session.element(frame_id[ELEMENT_KEY]).frame)
+            else:
+                frames = [e.frame for e in session.context.walk() if e.frame]
+                if not isinstance(frame_id, int) or frame_id >= len(frames):
+                    raise _FakeError(404, 'no such frame', str(frame_id))
+                session.frames.append(frames[frame_id])
+            return None
+        if head == 'window':
+            if rest[1:] == ['handles']:
+                return [session.window]
+            if method == 'POST' and len(rest) == 1:
+                session.window = body['handle']
+                session.frames = []
+                return None
+            if rest[1:] == ['rect']:
+                return {'x': 0, 'y': 0, 'width': 1280, 'height': 800}
+            return session.window if method == 'GET' else None
+        if head == 'screenshot':
+            return PIXEL_PNG
+        if head == 'cookie':
+            if method == 'POST':
+                session.cookies[body['cookie']['name']] = body['cookie']
+                return None
+            if method == 'DELETE':
+                if len(rest) > 1:
+                    session.cookies.pop(rest[1], None)
+                else:
+                    session.cookies.clear()
+                return None
+            if len(rest) > 1:
+                if rest[1] not in session.cookies:
+                    raise _FakeError(404, 'no such cookie', rest[1])
+                return session.cookies[rest[1]]
+            return list(session.cookies.values())
+        if head == 'actions':
+            return self._actions(session, body.get('actions', [])) if method == 'POST' else None
+        if head == 'alert':
+            raise _FakeError(404, 'no such alert', 'no such alert')
+        # timeouts等没有返回值的命令
+        return None
+
+    def _element_command(self, session, element, method, rest, body):
+        head = rest[0] if rest else ''
+        if head in ('element', 'elements'):
+            found = session.context.find(body['using'], body['value'], root=element)
+            if head == 'elements':
+                return [_ref(e) for e in found]
+            if not found:
+                raise _FakeError(404, 'no such element', body['value'])
+            return _ref(found[0])
+        if head == 'click':
+            if element.tag == 'option':
+                element.selected = not element.selected
+            return None
+        if head == 'value':
+            element.value += ''.join(body.get('value') or body.get('text', ''))
+            return None
+        if head == 'clear':
+            element.value = ''
+            return None
+        if head == 'text':
+            return element.text
+        if head == 'name':
+            return element.tag
+        if head == 'selected':
+            return element.selected
+        if head == 'enabled':
+            return element.enabled
+        if head == 'attribute':
+            return element.attrs.get(rest[1])
+        if head == 'property':
+            return element.value if rest[1] == 'value' else element.attrs.get(rest[1])
+        if head == 'rect':
+            return {'x': 0, 'y': 0, 'width': 100, 'height': 20}
+        if head == 'screenshot':
+            return PIXEL_PNG
+        return None
+
+    def _scripts(self):
+        '''
+        框架注入的脚本 -> 处理函数(session, args)，按脚本全文匹配，脚本常量改动后自动跟着变
+        假服务不执行js，这里只模拟脚本的返回值；脚本的实际行为由tests/test_scripts.py在真实浏览器中检查
+        '''
+        if self._script_table is None:
+            from selenium.webdriver.remote.webelement import getAttribute_js, isDisplayed_js
+            from common import base_selenium, macro, snapshot, visual, waits
+
+            def observe(predicate):
+                return waits.LOCATE_JS + 'var predicate = ' + predicate + ';' + waits.OBSERVER_JS
+
+            def element_of(session, args):
+                found = self._find(session, args[0][0], args[0][1])
+                return found[0] if found else None
+
+            def contains(attribute):
+                def handler(session, args):
+                    element = element_of(session, args)
+                    return bool(element) and args[0][2] in getattr(element, attribute)
+                return handler
+
+            self._script_table = {
+                'return (%s).apply(null, arguments);' % getAttribute_js: self._get_attribute,
+                'return (%s).apply(null, arguments);' % isDisplayed_js: lambda session, args: True,
+                'return arguments[0][arguments[1]]': self._get_attribute,
+                base_selenium.FIND_MANY_JS: lambda session, args: [self._locate(session, by, value)
+                                                                    for by, value in args[0]],
+                base_selenium.RESET_JS: lambda session, args: None,
+                waits.IDLE_INSTRUMENT_JS: lambda session, args: None,
+                waits.PAGE_IDLE_JS: lambda session, args: 0,  # 假页面没有请求和DOM变化，总是空闲
+                macro.MACRO_JS: lambda session, args: self._macro(session, args[0]),
+                snapshot.SNAPSHOT_JS: lambda session, args: self._snapshot(session, args[0]),
+                # 视觉对比的忽略区域，和元素rect一样
+                visual.REGIONS_JS: lambda session, args: [[0, 0, 100, 20] for by, value in args[0]
+                                                          if self._find(session, by, value)],
+                observe(waits.PRESENCE_JS): lambda session, args: self._locate(session, args[0][0], args[0][1]),
+                observe(waits.ALL_PRESENCE_JS): lambda session, args: [
+                    _ref(e) for e in self._find(session, args[0][0], args[0][1])] or None,
+                observe(waits.TITLE_IS_JS): lambda session, args: session.context.title == args[0][0],
+                observe(waits.TITLE_CONTAINS_JS): lambda session, args: args[0][0] in session.context.title,
+                observe(waits.TEXT_IN_ELEMENT_JS): contains('text'),
+                observe(waits.VALUE_IN_ELEMENT_JS): contains('value'),
+                observe(waits.ABSENT_JS): lambda session, args: not self._find(session, args[0][0], args[0][1]),
+                # 假元素都是可见的，不存在即不可见
+                observe(waits.INVISIBLE_JS): lambda session, args: not self._find(session, args[0][0], args[0][1]),
+            }
+        return self._script_table
+
+    def _execute(self, session, script, args, is_async):
+        '''执行框架注入的脚本（见_scripts），滚动、播放等没有返回值的简单脚本返回None，其他脚本报错'''
+        args = [self._unwrap(session, arg) for arg in args]
+        handler = self._scripts().get(script)
+        if handler:
+            return handler(session, args)
+        if _NOOP_SCRIPT.match(script):
+            return None
+        raise _FakeError(500, 'javascript error', '假WebDriver不支持的脚本：%s' % script.strip()[:100])
+
+    @staticmethod
+    def _get_attribute(session, args):
+        '''selenium的getAttribute atom、get_property'''
+        element, name = args[0], args[1]
+        if name == 'value':
+            return element.value
+        if name in ('selected', 'checked'):
+            return 'true' if element.selected else None
+        if name == 'index' and element.tag == 'option':
+            parent = [e for e in session.context.walk() if element in e.children]
+            return str(parent[0].children.index(element)) if parent else '0'
+        return element.attrs.get(name)
+
+    def _macro(self, session, steps):
+        '''common.macro的动作序列脚本'''
+        elements = []
+        for index, (action, locator, arg) in enumerate(steps):
+            found = self._locate(session, *locator) if locator else None
+            if locator and not found:
+                return {'missing': index, 'results': []}
+            elements.append(session.element(found[ELEMENT_KEY]) if found else None)
+        results = []
+        for index, ((action, locator, arg), element) in enumerate(zip(steps, elements)):
+            result = None
+            if action == 'fill':
+                element.value = arg
+            elif action == 'clear':
+                element.value = ''
+            elif action == 'select':
+                by, expected = arg
+                options = [e for e in element.children if e.tag == 'option']
+                matched = [i for i, e in enumerate(options) if (by == 'index' and i == expected) or
+                           (by == 'value' and e.attrs.get('value') == expected) or
+                           (by == 'text' and e.text.strip() == expected)]
+                if not matched:
+                    results.append({'result': 'Error: Cannot locate option', 'duration': 0})
+                    return {'error': index, 'results': results}
+                for i, option in enumerate(options):
+                    option.selected = i == matched[0]
+                result = options[matched[0]].attrs.get('value')
+            results.append({'result': result, 'duration': 0})
+        return {'results': results}
+
+    def _actions(self, session, sources):
+        '''W3C Actions：按tick依次执行各输入源的动作，pointerUp视为点击，keyDown输入到最后点击的元素'''
+        target = None
+        for tick in range(max([len(source.get('actions', [])) for source in sources] or [0])):
+            for source in sources:
+                actions = source.get('actions', [])
+                if tick >= len(actions):
+                    continue
+                action = actions[tick]
+                origin = action.get('origin')
+                if action['type'] == 'pointerMove' and isinstance(origin, dict):
+                    target = session.element(origin[ELEMENT_KEY])
+                elif action['type'] == 'pointerUp' and target is not None:
+                    session.focus = target
+                    if target.tag == 'option':
+                        target.selected = not target.selected
+                elif action['type'] == 'keyDown' and session.focus is not None:
+                    session.focus.value += action['value']
+        return None
+
+    @staticmethod
+    def _unwrap(session, arg):
+        if isinstance(arg, dict) and ELEMENT_KEY in arg:
+            return session.element(arg[ELEMENT_KEY])
+        return arg
+
+    def _snapshot(self, session, locator):
+        def serialize(element):
+            attrs = dict(element.attrs)
+            if element.value:
+                attrs['value'] = element.value
+            if element.selected:
+                attrs['selected'] = 'true'
+            children = ([element.text] if element.text else []) + [serialize(child) for child in element.children]
+            return [element.tag, attrs, 1, [0, 0, 100, 20], children]
+        if locator:
+            found = self._locate(session, locator[0], locator[1])
+            return serialize(session.element(found[ELEMENT_KEY])) if found else None
+        return ['html', {}, 1, [0, 0, 1280, 800], [serialize(element) for element in session.context.elements]]
+
+    @staticmethod
+    def _find(session, by, value):
+        # 和selenium一样，id、name、class name、tag name转换成css selector
+        css = {'id': '[id="%s"]', 'name': '[name="%s"]', 'class name': '.%s', 'tag name': '%s'}
+        if by in css:
+            by, value = 'css selector', css[by] % value
+        return session.context.find(by, value)
+
+    def _locate(self, session, by, value):
+        found = self._find(session, by, value)
+        return _ref(found[0]) if found else None
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    fake = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+        try:
+            status, value = 200, self.fake.dispatch(self.command, self.path, body)
+        except _FakeError as e:
+            status, value = e.status, {'error': e.error, 'message': e.message, 'stacktrace': ''}
+        except Exception as e:
+            status, value = 500, {'error': 'unknown error', 'message': repr(e), 'stacktrace': ''}
+        data = json.dumps({'value': value}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_DELETE = _handle
+
+
+def demo_page():
+    '''基准测试用的假页面，结构和cases/site/index.html一致'''
+    frame_page = FakePage(title='frame', elements=[FakeElement('input', id='inner', text='inner')])
+    return FakePage(title='本地测试站点', url='http://fake/index.html', elements=[
+        FakeElement('form', id='search', children=[
+            FakeElement('input', id='kw', name='wd'),
+            FakeElement('input', id='su', attrs={'value': '搜索'}),
+        ]),
+        FakeElement('div', id='result', text='搜索结果 selenium'),
+        FakeElement('select', id='city', children=[
+            FakeElement('option', text='北京', attrs={'value': 'bj'}, selected=True),
+            FakeElement('option', text='上海', attrs={'value': 'sh'}),
+            FakeElement('option', text='广州', attrs={'value': 'gz'}),
+        ]),
+        FakeElement('iframe', id='frame', frame=frame_page),
+        FakeElement('img', id='logo'),
+    ])
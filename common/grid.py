@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/18 15:30'
+import http.client
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+import urllib3
+from _pytest.runner import runtestprotocol
+from py.xml import html
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+
+def parse_hosts(value):
+    '''
+    --host参数：多个Remote WebDriver节点用逗号分隔，*后为节点容量（同时运行的浏览器数，默认为1）
+    如 192.168.1.10:4444/wd/hub*4,192.168.1.11:4444/wd/hub*2
+    返回[(url, 容量), ...]
+    '''
+    nodes = []
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        url, _, capacity = entry.partition('*')
+        try:
+            capacity = int(capacity) if capacity else 1
+        except ValueError:
+            raise ValueError('--host参数格式错误：%s，容量必须是整数，如127.0.0.1:4444/wd/hub*2' % entry)
+        if capacity < 1:
+            raise ValueError('--host参数格式错误：%s，容量必须大于0' % entry)
+        if '://' not in url:
+            url = 'http://' + url
+        nodes.append((url.rstrip('/'), capacity))
+    return nodes
+
+
+def is_node_failure(exc):
+    '''节点不可达（连接失败、连接中断）或者会话已经失效的异常，这类失败换节点重跑'''
+    if isinstance(exc, (ConnectionError, urllib3.exceptions.HTTPError, urllib.error.URLError,
+                        http.client.HTTPException)):
+        return True
+    return isinstance(exc, WebDriverException) and 'invalid session id' in str(exc.msg)
+
+
+class Node:
+    def __init__(self, url, capacity, order):
+        self.url = url
+        self.capacity = capacity
+        self.order = order
+        self.active = 0  # 当前在这个节点上的会话数
+        self.healthy = True
+        self.checked = 0  # 上次健康检查的时间
+        self.sessions = 0
+        self.failures = 0
+
+    @property
+    def load(self):
+        return self.active / float(self.capacity)
+
+
+class _NodeSession(webdriver.Remote):
+    '''分配在某个节点上的会话，quit时归还节点的容量'''
+    def __init__(self, dispatcher, node, capabilities):
+        self.grid_node = node
+        self.dead = False
+        self._dispatcher = dispatcher
+        super(_NodeSession, self).__init__(command_executor=node.url, desired_capabilities=capabilities,
+                                           keep_alive=True)
+
+    def quit(self):
+        try:
+            if not self.dead:
+                super(_NodeSession, self).quit()
+        finally:
+            self._dispatcher._release(self.grid_node)
+
+
+class GridDispatcher:
+    '''
+    多节点分发插件：按负载（当前会话数/容量）把新会话分配到最空闲的健康节点
+    节点每隔health_interval秒检查一次/status，新建会话失败的节点标记为不健康并换下一个节点
+    用例因节点故障失败时，换节点重跑，最多retries次；每个节点的吞吐量在报告中展示
+    配合xdist时，每个worker进程按worker数分摊节点容量
+    '''
+    def __init__(self, nodes, retries=1, timeout=300, health_interval=30, worker_index=0, worker_count=1,
+                 logger=None):
+        self.nodes = [Node(url, self._share(capacity, order, worker_index, worker_count), order)
+                      for order, (url, capacity) in enumerate(nodes)]
+        if not any(node.capacity for node in self.nodes):
+            self.nodes[worker_index % len(self.nodes)].capacity = 1
+        self.nodes = [node for node in self.nodes if node.capacity]
+        self.retries = retries
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.logger = logger
+        self.results = {}  # {节点url: {"tests", "failed", "busy", "rescheduled"}}
+        self._start = time.time()
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def _share(capacity, order, worker_index, worker_count):
+        '''节点容量在worker之间平分，余数按节点错开分给不同的worker'''
+        share, rest = divmod(capacity, worker_count)
+        return share + (1 if (worker_index - order) % worker_count < rest else 0)
+
+    def _log(self, level, message):
+        if self.logger:
+            getattr(self.logger, level)(message)
+
+    # ---------- 节点 ----------
+    def check(self, node):
+        '''请求节点的/status，返回是否健康'''
+        try:
+            with urllib.request.urlopen(node.url + '/status', timeout=3) as response:
+                value = json.loads(response.read().decode('utf-8')).get('value') or {}
+            healthy = value.get('ready', True) is not False
+        except Exception:
+            healthy = False
+        if healthy != node.healthy:
+            self._log('info' if healthy else 'error', '节点%s：%s' % ('恢复' if healthy else '不可用', node.url))
+        node.healthy, node.checked = healthy, time.time()
+        return healthy
+
+    def _is_healthy(self, node):
+        if time.time() - node.checked >= self.health_interval:
+            return self.check(node)
+        return node.healthy
+
+    def _refresh(self, exclude):
+        '''检查到期的节点，在锁外执行，一个节点响应慢不会卡住其他线程的分配'''
+        for node in self.nodes:
+            if node not in exclude:
+                self._is_healthy(node)
+
+    def mark_failed(self, node):
+        node.healthy, node.checked = False, time.time()
+        node.failures += 1
+        self._log('error', '节点不可用：%s' % node.url)
+        with self._cond:
+            self._cond.notify_all()
+
+    def _pick(self, exclude):
+        '''在锁内调用，只看上次检查的结果，不发请求'''
+        candidates = [node for node in self.nodes
+                      if node not in exclude and node.active < node.capacity and node.healthy]
+        return min(candidates, key=lambda node: (node.load, node.order)) if candidates else None
+
+    def _release(self, node):
+        with self._cond:
+            node.active -= 1
+            self._cond.notify_all()
+
+    # ---------- 会话 ----------
+    def new_driver(self, capabilities):
+        '''在最空闲的健康节点上新建会话；节点都满时等待，新建失败时换下一个节点'''
+        tried = set()
+        deadline = time.time() + self.timeout
+        while True:
+            self._refresh(tried)
+            with self._cond:
+                node = self._pick(tried)
+                if node is None:
+                    # 所有节点都试过或者不健康，也没有会话可以等待归还
+                    if all(n in tried or not n.healthy for n in self.nodes) and not any(n.active for n in self.nodes):
+                        urls = ', '.join(n.url for n in self.nodes)
+                        self._log('error', '没有可用的节点：%s' % urls)
+                        raise Exception('没有可用的节点：%s' % urls)
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self._log('error', '等待节点超时：%s秒内没有空闲的节点' % self.timeout)
+                        raise Exception('等待节点超时：%s秒内没有空闲的节点' % self.timeout)
+                    # 有会话归还或者节点状态变化时被唤醒，回到锁外重新检查节点
+                    self._cond.wait(min(remaining, self.health_interval))
+                    continue
+                node.active += 1
+            try:
+                driver = _NodeSession(self, node, capabilities)
+            except Exception:
+                self._release(node)
+                self.mark_failed(node)
+                tried.add(node)
+                continue
+            node.sessions += 1
+            self._log('info', '在节点%s上新建会话，节点负载%s/%s' % (node.url, node.active, node.capacity))
+            return driver
+
+    def is_alive(self, driver):
+        '''池中的浏览器是否还能用：会话没有失效且节点健康'''
+        node = getattr(driver, 'grid_node', None)
+        return node is None or (not driver.dead and self._is_healthy(node))
+
+    # ---------- 用例重跑 ----------
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtest_protocol(self, item, nextitem):
+        '''因节点故障失败的用例不记录结果，重新租用浏览器（分配到其他节点）再跑一次'''
+        item.ihook.pytest_runtest_logstart(nodeid=item.nodeid, location=item.location)
+        for attempt in range(self.retries + 1):
+            item._node_failure = False
+            reports = runtestprotocol(item, nextitem=nextitem, log=False)
+            if not item._node_failure or attempt == self.retries:
+                break
+            self._log('info', '用例因节点故障失败，换节点重跑：%s' % item.nodeid)
+        for report in reports:
+            report.rescheduled = attempt
+            item.ihook.pytest_runtest_logreport(report=report)
+        item.ihook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
+        return True
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        report = outcome.get_result()
+        handle = (getattr(item, 'funcargs', None) or {}).get('handle')
+        driver = getattr(handle, 'driver', None)
+        node = getattr(driver, 'grid_node', None)
+        report.grid_node = node.url if node else None
+        if node and call.excinfo:
+            # Base的is_*等方法会吞掉异常，所以用例失败时都检查一下节点
+            alive = self.check(node)
+            if not alive or is_node_failure(call.excinfo.value):
+                item._node_failure = True
+                # 同一个会话在call、teardown阶段都可能失败，只算一次
+                if not driver.dead:
+                    driver.dead = True
+                    node.failures += 1
+
+    # ---------- 吞吐量 ----------
+    def pytest_runtest_logreport(self, report):
+        url = getattr(report, 'grid_node', None)
+        if not url:
+            return
+        result = self.results.setdefault(url, {'tests': 0, 'failed': 0, 'busy': 0.0, 'rescheduled': 0})
+        result['busy'] += report.duration
+        if report.when == 'call' or (report.when == 'setup' and not report.passed):
+            result['tests'] += 1
+            result['failed'] += report.failed
+            result['rescheduled'] += getattr(report, 'rescheduled', 0)
+
+    def summary(self):
+        minutes = max(time.time() - self._start, 1) / 60.0
+        return ['节点%s：用例%s个（失败%s，重跑%s），占用%.1f秒，吞吐量%.1f个/分钟' % (
+            url, r['tests'], r['failed'], r['rescheduled'], r['busy'], r['tests'] / minutes)
+            for url, r in sorted(self.results.items())]
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_html_results_summary(self, prefix, summary, postfix):
+        for line in self.summary():
+            prefix.append(html.p(line))
+
+    def pytest_terminal_summary(self, terminalreporter):
+        for line in self.summary():
+            terminalreporter.write_line(line)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/18 9:40'
+import shutil
+import threading
+import time
+
+import pytest
+from py.xml import html
+from selenium import webdriver
+from selenium.webdriver.chrome.remote_connection import ChromeRemoteConnection
+from selenium.webdriver.chrome.service import Service as ChromeService
+from selenium.webdriver.firefox.remote_connection import FirefoxRemoteConnection
+from selenium.webdriver.firefox.service import Service as FirefoxService
+from selenium.webdriver.remote.webdriver import WebDriver as RemoteWebDriver
+
+# 启动配置：--profile选择；headed为原来的有界面启动，不加任何参数；无头配置关闭gpu、扩展、首次运行页面，固定窗口大小
+WINDOW_SIZE = (1280, 800)
+PROFILES = {
+    'headed': {'headless': False},
+    'headless': {'headless': True},
+    # CI容器中没有沙箱权限、/dev/shm很小
+    'ci': {'headless': True, 'chrome_args': ['--no-sandbox', '--disable-dev-shm-usage']},
+}
+CHROME_ARGS = [
+    '--disable-gpu',
+    '--disable-extensions',
+    '--no-first-run',
+    '--no-default-browser-check',
+    '--disable-default-apps',
+    '--disable-background-networking',
+    '--window-size=%s,%s' % WINDOW_SIZE,
+]
+FIREFOX_PREFS = {
+    'browser.shell.checkDefaultBrowser': False,
+    'browser.startup.homepage_override.mstone': 'ignore',
+    'browser.startup.page': 0,
+    'startup.homepage_welcome_url': 'about:blank',
+    'datareporting.policy.dataSubmissionEnabled': False,
+    'toolkit.telemetry.reportingpolicy.firstRun': False,
+    'extensions.update.enabled': False,
+    'app.update.auto': False,
+}
+
+
+class _ChromeSession(webdriver.Chrome):
+    '''连接已启动的chromedriver服务的Chrome，保留execute_cdp_cmd等chrome专有方法；quit时不停止共享的服务'''
+    def __init__(self, service, capabilities):
+        self.service = service
+        RemoteWebDriver.__init__(self, command_executor=ChromeRemoteConnection(service.service_url, keep_alive=True),
+                                 desired_capabilities=capabilities)
+        self._is_remote = False
+
+    def quit(self):
+        RemoteWebDriver.quit(self)
+
+
+class _FirefoxSession(webdriver.Firefox):
+    '''连接已启动的geckodriver服务的Firefox；quit时不停止共享的服务，只清理临时profile'''
+    def __init__(self, service, capabilities, profile):
+        self.service = service
+        self.binary = None
+        self.profile = profile
+        RemoteWebDriver.__init__(self, command_executor=FirefoxRemoteConnection(service.service_url, keep_alive=True),
+                                 desired_capabilities=capabilities)
+        self._is_remote = False
+
+    def quit(self):
+        try:
+            RemoteWebDriver.quit(self)
+        finally:
+            shutil.rmtree(self.profile.path, ignore_errors=True)
+            if self.profile.tempfolder:
+                shutil.rmtree(self.profile.tempfolder, ignore_errors=True)
+
+
+class BrowserLauncher:
+    '''
+    浏览器启动器：chromedriver/geckodriver服务进程只启动一次，之后每个浏览器都通过这个服务新建会话，不再重新拉起driver进程
+    browser： chrome或者firefox
+    driver_path： chromedriver/geckodriver的路径
+    profile： 启动配置，见PROFILES
+    proxy： 代理地址host:port
+    startup_times： 每次新建会话的耗时（秒）；service_times为启动driver服务的耗时，xdist时每个worker各启动一次
+    注册为pytest插件时，在html报告和终端结果中展示启动耗时；xdist的worker通过workeroutput把耗时传回主进程汇总
+    '''
+    def __init__(self, browser, driver_path, profile='headed', proxy=None, logger=None):
+        if profile not in PROFILES:
+            raise Exception('profile参数错误，必须是%s其中一个' % '/'.join(sorted(PROFILES)))
+        self.browser = browser.lower()
+        self.driver_path = driver_path
+        self.profile = profile
+        self.proxy = proxy
+        self.logger = logger
+        self.service = None
+        self.service_times = []
+        self.startup_times = []
+        self._lock = threading.Lock()
+
+    def _start_service(self):
+        with self._lock:
+            if self.service is None:
+                start = time.perf_counter()
+                if self.browser == 'firefox':
+                    service = FirefoxService(self.driver_path, log_path=None)
+                else:
+                    service = ChromeService(self.driver_path)
+                service.start()
+                self.service = service
+                duration = time.perf_counter() - start
+                self.service_times.append(duration)
+                if self.logger:
+                    self.logger.info("启动%s服务：%s，耗时%.2f秒" % (self.browser, service.service_url, duration))
+        return self.service
+
+    def capabilities(self):
+        '''按启动配置生成desired_capabilities，返回(capabilities, firefox的profile)'''
+        config = PROFILES[self.profile]
+        if self.browser == 'firefox':
+            options = webdriver.FirefoxOptions()
+            profile = webdriver.FirefoxProfile()
+            if config['headless']:
+                for name, value in FIREFOX_PREFS.items():
+                    profile.set_preference(name, value)
+                options.add_argument('-headless')
+                options.add_argument('--width=%s' % WINDOW_SIZE[0])
+                options.add_argument('--height=%s' % WINDOW_SIZE[1])
+            if self.proxy:
+                proxy_host, proxy_port = self.proxy.split(':')
+                profile.set_preference('network.proxy.type', 1)
+                for scheme in ('http', 'ssl'):
+                    profile.set_preference('network.proxy.%s' % scheme, proxy_host)
+                    profile.set_preference('network.proxy.%s_port' % scheme, int(proxy_port))
+                profile.set_preference('network.proxy.allow_hijacking_localhost', True)
+            options.profile = profile
+            return options.to_capabilities(), profile
+        options = webdriver.ChromeOptions()
+        if config['headless']:
+            options.add_argument('--headless')
+            for arg in CHROME_ARGS + config.get('chrome_args', []):
+                options.add_argument(arg)
+        if self.proxy:
+            options.add_argument('--proxy-server=http://%s' % self.proxy)
+            options.add_argument('--proxy-bypass-list=<-loopback>')  # 本地站点也走代理
+        return options.to_capabilities(), None
+
+    def new_driver(self):
+        '''通过已启动的driver服务新建一个浏览器会话'''
+        service = self._start_service()
+        start = time.perf_counter()
+        capabilities, profile = self.capabilities()
+        if self.browser == 'firefox':
+            driver = _FirefoxSession(service, capabilities, profile)
+        else:
+            driver = _ChromeSession(service, capabilities)
+        duration = time.perf_counter() - start
+        self.startup_times.append(duration)
+        if self.logger:
+            self.logger.info("新建浏览器会话，耗时%.2f秒" % duration)
+        return driver
+
+    def summary(self):
+        '''启动耗时汇总，没有启动过浏览器返回None'''
+        times = self.startup_times
+        if not times:
+            return None
+        return '浏览器启动（%s）：driver服务%s个，最长%.2f秒，新建会话%s次，平均%.2f秒，最长%.2f秒' % (
+            self.profile, len(self.service_times), max(self.service_times or [0]), len(times),
+            sum(times) / len(times), max(times))
+
+    def pytest_sessionfinish(self, session):
+        workeroutput = getattr(session.config, 'workeroutput', None)
+        if workeroutput is not None:
+            workeroutput['browser_launcher'] = {'service_times': self.service_times,
+                                                'startup_times': self.startup_times}
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        '''xdist主进程：合并worker的启动耗时'''
+        output = getattr(node, 'workeroutput', {}).get('browser_launcher')
+        if output:
+            self.service_times.extend(output['service_times'])
+            self.startup_times.extend(output['startup_times'])
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_html_results_summary(self, prefix, summary, postfix):
+        line = self.summary()
+        if line:
+            prefix.append(html.p(line))
+
+    def pytest_terminal_summary(self, terminalreporter):
+        line = self.summary()
+        if line:
+            terminalreporter.write_line(line)
+
+    def stop(self):
+        '''停止driver服务，在所有浏览器quit之后调用'''
+        with self._lock:
+            service, self.service = self.service, None
+        if service:
+            service.stop()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/14 17:30'
+import functools
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# 本地静态测试站点的默认根目录
+SITE_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cases', 'site')
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalSite:
+    '''
+    本地静态站点，离线跑用例用：在后台线程启动http服务，url为http://127.0.0.1:端口
+    root： 站点根目录，默认为cases/site
+    '''
+    def __init__(self, root=SITE_ROOT, host='127.0.0.1', port=0):
+        handler = functools.partial(_QuietHandler, directory=root)
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%s' % (host, port)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
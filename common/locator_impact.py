@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/15 16:00'
+import ast
+import json
+import os
+import subprocess
+
+import yaml
+
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# 页面对象所在的模块，用例从这些模块导入页面类
+PAGE_MODULES = ('pages.page_objects', 'pages.generated')
+
+
+def _page_aliases(tree):
+    '''用例文件中导入的页面类：{本地名: 类名}'''
+    aliases = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.module and node.module.startswith(PAGE_MODULES):
+            for alias in node.names:
+                if alias.name != '*':
+                    aliases[alias.asname or alias.name] = alias.name
+    return aliases
+
+
+def _refs(node, aliases):
+    '''节点中引用的页面locator：{"类名.属性名"}；直接引用整个类（如find_all(Page)）记为"类名.*"'''
+    refs, attr_bases = set(), set()
+    for n in ast.walk(node):
+        if isinstance(n, ast.Attribute) and isinstance(n.value, ast.Name) and n.value.id in aliases:
+            refs.add('%s.%s' % (aliases[n.value.id], n.attr))
+            attr_bases.add(id(n.value))
+    for n in ast.walk(node):
+        if isinstance(n, ast.Name) and n.id in aliases and id(n) not in attr_bases:
+            refs.add('%s.*' % aliases[n.id])
+    return refs
+
+
+def scan_file(file_path, rel_path):
+    '''
+    静态扫描一个用例文件，返回{"rel_path::用例名": ["类名.属性名", ...]}
+    模块级的非用例代码（辅助函数、fixture等）引用的locator算到该文件的所有用例上
+    '''
+    with open(file_path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), file_path)
+    aliases = _page_aliases(tree)
+    tests, shared = {}, set()
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith('test'):
+            tests['%s::%s' % (rel_path, node.name)] = _refs(node, aliases)
+        elif isinstance(node, ast.ClassDef) and node.name.startswith('Test'):
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)) and child.name.startswith('test'):
+                    tests['%s::%s::%s' % (rel_path, node.name, child.name)] = _refs(child, aliases)
+                else:
+                    shared |= _refs(child, aliases)
+        else:
+            shared |= _refs(node, aliases)
+    return dict((name, sorted(refs | shared)) for name, refs in tests.items())
+
+
+def scan_cases(cases_path, root_path):
+    '''静态扫描cases文件夹下所有test_*.py'''
+    index = {}
+    for fpath, dirname, fnames in os.walk(cases_path):
+        for name in fnames:
+            if name.startswith('test') and name.endswith('.py'):
+                file_path = os.path.join(fpath, name)
+                rel_path = os.path.relpath(file_path, root_path).replace(os.sep, '/')
+                index.update(scan_file(file_path, rel_path))
+    return index
+
+
+def _locators_of(pages):
+    '''yaml内容转换成{"类名.属性名": (type, value)}'''
+    result = {}
+    for page, value in (pages or {}).items():
+        for locator in (value or {}).get('locators') or []:
+            result['%s.%s' % (page, locator['name'])] = (locator.get('type'), str(locator.get('value')))
+    return result
+
+
+def _git(root_path, *args):
+    return subprocess.run(['git', '-C', root_path] + list(args), stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL, check=False).stdout.decode('utf-8')
+
+
+def changed_locators(root_path, yaml_path, baseline='HEAD'):
+    '''对比baseline版本和当前工作区的yaml文件，返回新增、删除、修改过的{"类名.属性名"}'''
+    rel_dir = os.path.relpath(yaml_path, root_path).replace(os.sep, '/')
+    files = set(path for path in _git(root_path, 'ls-tree', '-r', '--name-only', baseline, rel_dir).splitlines()
+                if path.endswith('.yaml'))
+    for fpath, dirname, fnames in os.walk(yaml_path):
+        for name in fnames:
+            if name.endswith('.yaml'):
+                files.add(os.path.relpath(os.path.join(fpath, name), root_path).replace(os.sep, '/'))
+    old, new = {}, {}
+    for rel_path in files:
+        old.update(_locators_of(yaml.load(_git(root_path, 'show', '%s:%s' % (baseline, rel_path)) or '{}',
+                                          Loader=YamlLoader)))
+        file_path = os.path.join(root_path, rel_path)
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                new.update(_locators_of(yaml.load(f, Loader=YamlLoader)))
+    return set(name for name in set(old) | set(new) if old.get(name) != new.get(name))
+
+
+def is_affected(refs, changed):
+    changed_pages = set(name.split('.', 1)[0] for name in changed)
+    for ref in refs:
+        page, attr = ref.split('.', 1)
+        if ref in changed or (attr == '*' and page in changed_pages):
+            return True
+    return False
+
+
+class LocatorImpact:
+    '''
+    locator影响分析插件：建立 页面locator -> 用例 的依赖索引，只运行改动过的locator影响到的用例
+    静态索引每次收集时扫描cases；运行时索引记录每个用例实际通过Base使用的locator，补充静态扫描不到的用法
+    changed： 改动过的{"类名.属性名"}，为None时不筛选用例，只更新运行时索引
+    index_path： 运行时索引文件
+    worker_id： xdist的worker编号，worker进程先写各自的索引文件，由主进程合并
+    '''
+    def __init__(self, root_path, cases_path, index_path, changed=None, worker_id=None):
+        self.root_path = root_path
+        self.cases_path = cases_path
+        self.index_path = index_path
+        self.changed = changed
+        self.worker_id = worker_id
+        self.runtime = {}
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                self.runtime = json.load(f)
+        self._locator_names = None
+        self._current = None
+
+    def refs_of(self, static_index, nodeid):
+        base = nodeid.split('[', 1)[0]  # 参数化用例共用静态索引
+        return set(static_index.get(base, ())) | set(self.runtime.get(nodeid, ()))
+
+    def pytest_collection_modifyitems(self, session, config, items):
+        if self.changed is None:
+            return
+        static_index = scan_cases(self.cases_path, self.root_path)
+        selected, deselected = [], []
+        for item in items:
+            # 不在索引中的用例（不是cases下的用例）无法判断，保守起见照常运行
+            known = item.nodeid.split('[', 1)[0] in static_index or item.nodeid in self.runtime
+            if not known or is_affected(self.refs_of(static_index, item.nodeid), self.changed):
+                selected.append(item)
+            else:
+                deselected.append(item)
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+        items[:] = selected
+
+    def _names(self, locator):
+        '''locator元组对应的"类名.属性名"，第一次使用时从页面对象模块建立映射'''
+        if self._locator_names is None:
+            from pages import page_objects
+            self._locator_names = {}
+            for page_name, page in vars(page_objects).items():
+                if isinstance(page, type):
+                    for name, value in vars(page).items():
+                        if isinstance(value, tuple):
+                            self._locator_names.setdefault(value, set()).add('%s.%s' % (page_name, name))
+        return self._locator_names.get(locator, ())
+
+    def on_locator(self, locator):
+        '''Base使用locator时的回调'''
+        if self._current is not None:
+            self._current.update(self._names(locator))
+
+    def pytest_runtest_setup(self, item):
+        self._current = set()
+        self.runtime[item.nodeid] = self._current
+
+    def pytest_runtest_teardown(self, item):
+        self.runtime[item.nodeid] = sorted(self._current or ())
+        self._current = None
+
+    def pytest_sessionfinish(self, session):
+        if self.worker_id:
+            with open('%s.%s' % (self.index_path, self.worker_id), 'w', encoding='utf-8') as f:
+                json.dump(self.runtime, f, ensure_ascii=False)
+            return
+        # 合并各个worker进程的索引
+        dir_path, file_name = os.path.split(self.index_path)
+        for name in os.listdir(dir_path or '.'):
+            if name.startswith(file_name + '.'):
+                worker_path = os.path.join(dir_path, name)
+                with open(worker_path, 'r', encoding='utf-8') as f:
+                    self.runtime.update(json.load(f))
+                os.remove(worker_path)
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            json.dump(self.runtime, f, ensure_ascii=False, indent=1, sort_keys=True)
@@ -1,9 +1,77 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 import sys
+import threading
 import time
 
 
+class _DeferredFlushMixin:
+    '''队列模式下emit时不flush，由后台线程按批flush'''
+    deferred = False
+
+    def flush(self):
+        if not self.deferred:
+            super().flush()
+
+    def force_flush(self):
+        super().flush()
+
+
+class _FileHandler(_DeferredFlushMixin, logging.FileHandler):
+    pass
+
+
+class _RotatingFileHandler(_DeferredFlushMixin, logging.handlers.RotatingFileHandler):
+    pass
+
+
+class _TimedRotatingFileHandler(_DeferredFlushMixin, logging.handlers.TimedRotatingFileHandler):
+    pass
+
+
+class _BatchQueueListener(logging.handlers.QueueListener):
+    '''后台写日志线程：每flush_every条或者队列空闲时flush一次'''
+    def __init__(self, log_queue, *handlers, flush_every=100):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_every = flush_every
+        self._pending = 0
+
+    def dequeue(self, block):
+        if block and self._pending and self.queue.empty():
+            self.flush()
+        return self.queue.get(block)
+
+    def handle(self, record):
+        super().handle(record)
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        for handler in self.handlers:
+            getattr(handler, 'force_flush', handler.flush)()
+        self._pending = 0
+
+
+# 日志文件路径 -> 后台写日志线程，同一个文件只有一个线程在写
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+
+@atexit.register
+def _stop_listeners():
+    '''进程退出前写完队列中剩余的日志'''
+    with _listeners_lock:
+        listeners = list(_listeners.values())
+        _listeners.clear()
+    for listener in listeners:
+        listener.stop()
+        listener.flush()
+
+
 class Logger:
     def __init__(
             self,
@@ -13,6 +81,11 @@ class Logger:
             name=os.path.split(os.path.splitext(sys.argv[0])[0])[-1],
             file_name=time.strftime("%Y-%m-%d.log", time.localtime()),
             dir_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "log"),
+            use_queue=False,
+            max_bytes=0,
+            when=None,
+            backup_count=5,
+            flush_every=100,
     ):
         '''
             set_level： 设置日志的打印级别，默认为DEBUG
@@ -20,6 +93,12 @@ class Logger:
             file_name： 日志文件的名字，默认为当前时间（年-月-日.log）
             dir_path： 日志文件夹的路径，默认为logger.py同级目录中的log文件夹
             console： 是否在控制台打印，默认为True
+            use_queue： 是否使用队列模式，打日志只是入队，由后台线程批量写文件，默认为False
+            max_bytes： 日志文件超过该大小（字节）时切割，默认为0不切割
+            when： 按时间切割日志文件，如"midnight"、"H"，默认为None不切割；与max_bytes同时传时max_bytes优先
+            backup_count： 切割后保留的日志文件数量，默认为5
+            flush_every： 队列模式下每写多少条日志flush一次，队列空闲时也会flush，默认为100
+        同一个name、同一个日志文件重复创建Logger时，不会重复添加handler
         '''
 
         self.logger = logging.getLogger(name)
@@ -39,15 +118,56 @@ class Logger:
 
         if not os.path.exists(dir_path):
             os.makedirs(dir_path)
-        log_dir_path = os.path.join(dir_path, file_name)
-        log_handler = logging.FileHandler(log_dir_path)
-        log_handler.setFormatter(formatter)
-        self.logger.addHandler(log_handler)
+        log_dir_path = os.path.abspath(os.path.join(dir_path, file_name))
+
+        if use_queue:
+            self._add_queue_handler(log_dir_path, formatter, console, max_bytes, when, backup_count, flush_every)
+            return
+
+        if not self._has_handler(('file', log_dir_path)):
+            log_handler = self._create_file_handler(log_dir_path, max_bytes, when, backup_count)
+            log_handler.setFormatter(formatter)
+            self._add_handler(log_handler, ('file', log_dir_path))
 
-        if console:
+        if console and not self._has_handler(('console',)):
             console_handler = logging.StreamHandler()
             console_handler.setFormatter(formatter)
-            self.logger.addHandler(console_handler)
+            self._add_handler(console_handler, ('console',))
+
+    @staticmethod
+    def _create_file_handler(log_dir_path, max_bytes, when, backup_count):
+        if max_bytes:
+            return _RotatingFileHandler(log_dir_path, maxBytes=max_bytes, backupCount=backup_count)
+        if when:
+            return _TimedRotatingFileHandler(log_dir_path, when=when, backupCount=backup_count)
+        return _FileHandler(log_dir_path)
+
+    def _has_handler(self, key):
+        return any(getattr(h, '_logger_key', None) == key for h in self.logger.handlers)
+
+    def _add_handler(self, handler, key):
+        handler._logger_key = key
+        self.logger.addHandler(handler)
+
+    def _add_queue_handler(self, log_dir_path, formatter, console, max_bytes, when, backup_count, flush_every):
+        '''队列模式：logger上只挂QueueHandler，文件/控制台handler由后台线程调用'''
+        key = ('queue', log_dir_path)
+        if self._has_handler(key):
+            return
+        with _listeners_lock:
+            listener = _listeners.get(log_dir_path)
+            if listener is None:
+                file_handler = self._create_file_handler(log_dir_path, max_bytes, when, backup_count)
+                file_handler.deferred = True
+                handlers = [file_handler]
+                if console:
+                    handlers.append(logging.StreamHandler())
+                for handler in handlers:
+                    handler.setFormatter(formatter)
+                listener = _BatchQueueListener(queue.Queue(-1), *handlers, flush_every=flush_every)
+                listener.start()
+                _listeners[log_dir_path] = listener
+        self._add_handler(logging.handlers.QueueHandler(listener.queue), key)
 
     def addHandler(self, hdlr):
         self.logger.addHandler(hdlr)
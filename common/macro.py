@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/17 15:10'
+import time
+
+from selenium.webdriver.common.action_chains import ActionChains
+
+from common.waits import LOCATE_JS
+
+# 一次execute_script执行整个动作序列，arguments[0]为[[动作, [定位方式, value值]或null, 参数], ...]
+# 先定位全部元素，有没定位到的则一个动作都不执行，返回{missing: 步骤序号}；执行中出错返回{error: 步骤序号}
+MACRO_JS = LOCATE_JS + '''
+function macro(steps) {
+    var elements = [], results = [];
+    for (var i = 0; i < steps.length; i++) {
+        var el = steps[i][1] ? locate(steps[i][1][0], steps[i][1][1], false) : null;
+        if (steps[i][1] && !el) return {missing: i, results: results};
+        elements.push(el);
+    }
+    function fire(el, type) { el.dispatchEvent(new Event(type, {bubbles: true})); }
+    for (var i = 0; i < steps.length; i++) {
+        var action = steps[i][0], el = elements[i], arg = steps[i][2], start = performance.now(), result = null;
+        try {
+            switch (action) {
+                case "fill":
+                    el.focus(); el.value = arg; fire(el, "input"); fire(el, "change"); break;
+                case "clear":
+                    el.value = ""; fire(el, "input"); fire(el, "change"); break;
+                case "click":
+                    el.click(); break;
+                case "select":
+                    var options = el.options, matched = -1;
+                    for (var j = 0; j < options.length; j++) {
+                        if ((arg[0] === "index" && j === arg[1]) || (arg[0] === "value" && options[j].value === arg[1]) ||
+                            (arg[0] === "text" && options[j].text.trim() === arg[1])) { matched = j; break; }
+                    }
+                    if (matched < 0) throw new Error("Cannot locate option with " + arg[0] + ": " + arg[1]);
+                    el.selectedIndex = matched; fire(el, "input"); fire(el, "change"); result = options[matched].value; break;
+                case "scroll":
+                    if (el) el.scrollIntoView();
+                    else window.scrollTo(0, arg === "end" ? document.body.scrollHeight : 0);
+                    break;
+            }
+        } catch (e) {
+            results.push({result: String(e), duration: performance.now() - start});
+            return {error: i, results: results};
+        }
+        results.push({result: result, duration: performance.now() - start});
+    }
+    return {results: results};
+}
+return macro(arguments[0]);
+'''
+
+MACRO_MODES = ('script', 'actions')
+
+
+class ActionMacro:
+    '''
+    动作序列：先记录fill/click/select/clear/scroll步骤，run()时编译成一次请求执行，返回每一步的结果和耗时
+    用法：
+        handle.macro().fill(loc_kw, 'selenium').select(loc_city, value='gz').click(loc_su).run()
+    mode：
+        script： 编译成一个注入脚本，一次execute_script执行全部步骤；事件由js触发（isTrusted为false）
+        actions： 编译成一个W3C Actions请求（先用一次脚本批量定位元素），只有click、fill能编进去，其他步骤逐步执行；
+                  事件是浏览器原生事件，fill不会清空原有内容
+    native=True的步骤（需要原生事件的，如上传文件、依赖isTrusted的按钮）不编译，用Base的方法逐步执行
+    script模式下所有元素在执行前一次定位，页面变化后才出现的元素（如点击后弹出的菜单）需要拆成两个序列或者用native
+    '''
+    def __init__(self, base, driver=None, mode='script'):
+        if mode not in MACRO_MODES:
+            raise Exception('mode参数错误，必须是%s其中一个' % '/'.join(MACRO_MODES))
+        self.base = base
+        self.driver = base._get_driver(driver)
+        self.mode = mode
+        self.steps = []
+        self.duration = None
+
+    def _add(self, action, locator, arg=None, native=False):
+        if locator is not None and not isinstance(locator, tuple):
+            self.base.logger.error('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
+            raise Exception('locator参数类型错误，必须传元祖类型：loc = ("id", "value1")')
+        self.steps.append({'action': action, 'locator': locator, 'arg': arg, 'native': native})
+        return self
+
+    def fill(self, locator, text, native=False):
+        '''输入框填入text（script模式覆盖原有内容）'''
+        return self._add('fill', locator, text, native)
+
+    def click(self, locator, native=False):
+        return self._add('click', locator, native=native)
+
+    def clear(self, locator, native=False):
+        return self._add('clear', locator, native=native)
+
+    def select(self, locator, value=None, index=None, text=None, native=False):
+        '''下拉框选择，value、index、text传其中一个'''
+        for by, arg in (('value', value), ('index', index), ('text', text)):
+            if arg is not None:
+                return self._add('select', locator, [by, arg], native)
+        raise Exception('select需要传value、index、text其中一个')
+
+    def scroll(self, locator=None, to='top', native=False):
+        '''滚动到元素位置；不传locator时滚动到顶部(top)或底部(end)'''
+        return self._add('scroll', locator, to, native)
+
+    def _compilable(self, step):
+        if step['native']:
+            return False
+        return self.mode == 'script' or step['action'] in ('click', 'fill')
+
+    def _segments(self):
+        '''连续的可编译步骤合成一段，其他步骤每步一段'''
+        segments = []
+        for step in self.steps:
+            if self._compilable(step) and segments and segments[-1][0]:
+                segments[-1][1].append(step)
+            else:
+                segments.append((self._compilable(step), [step]))
+        return segments
+
+    def run(self):
+        '''执行动作序列，返回[{"action", "locator", "result", "duration"}, ...]，duration单位为秒'''
+        if self.base.locator_listener:
+            for step in self.steps:
+                if step['locator']:
+                    self.base.locator_listener(step['locator'])
+        start = time.perf_counter()
+        results = []
+        for compiled, steps in self._segments():
+            if not compiled:
+                results.append(self._run_native(steps[0]))
+            elif self.mode == 'script':
+                results.extend(self._run_script(steps))
+            else:
+                results.extend(self._run_actions(steps))
+        self.duration = time.perf_counter() - start
+        self.base.logger.info("执行动作序列：共%s步，耗时%.3f秒" % (len(self.steps), self.duration))
+        return results
+
+    def _fail(self, step, message):
+        locator = step['locator'] or ('', '')
+        self.base.logger.error("动作序列执行失败：%s->%s, value值->%s，%s" % (step['action'], locator[0], locator[1], message))
+        raise Exception("动作序列执行失败：%s->%s, value值->%s，%s" % (step['action'], locator[0], locator[1], message))
+
+    def _run_script(self, steps):
+        payload = [[step['action'], list(step['locator']) if step['locator'] else None, step['arg']] for step in steps]
+        deadline = time.time() + self.base.timeout
+        while True:
+            value = self.driver.execute_script(MACRO_JS, payload)
+            # 没定位到元素时一个动作都没有执行，可以安全重试
+            if value.get('missing') is None or time.time() >= deadline:
+                break
+            time.sleep(self.base.t)
+        if value.get('missing') is not None:
+            self._fail(steps[value['missing']], '没定位到元素')
+        results = [{'action': step['action'], 'locator': step['locator'], 'result': result['result'],
+                    'duration': result['duration'] / 1000.0} for step, result in zip(steps, value['results'])]
+        if value.get('error') is not None:
+            self._fail(steps[value['error']], results[-1]['result'])
+        return results
+
+    def _run_actions(self, steps):
+        start = time.perf_counter()
+        locators = [step['locator'] for step in steps]
+        found = self.base.find_many(locators, self.driver)
+        for index, step in enumerate(steps):
+            if found[index] is None:
+                self._fail(step, '没定位到元素')
+        chain = ActionChains(self.driver)
+        for index, step in enumerate(steps):
+            chain.click(found[index])
+            if step['action'] == 'fill':
+                chain.send_keys(step['arg'])
+        chain.perform()
+        # 原生事件一次提交，拿不到每一步的耗时，平均分摊
+        duration = (time.perf_counter() - start) / len(steps)
+        return [{'action': step['action'], 'locator': step['locator'], 'result': None, 'duration': duration}
+                for step in steps]
+
+    def _run_native(self, step):
+        base, locator, arg = self.base, step['locator'], step['arg']
+        start = time.perf_counter()
+        result = None
+        if step['action'] == 'fill':
+            base.clear(locator, driver=self.driver)
+            base.send_keys(locator, arg, driver=self.driver)
+        elif step['action'] == 'click':
+            base.click(locator, driver=self.driver)
+        elif step['action'] == 'clear':
+            base.clear(locator, driver=self.driver)
+        elif step['action'] == 'select':
+            by, value = arg
+            getattr(base, 'select_by_%s' % by)(locator, value, driver=self.driver)
+            result = value if by == 'value' else None
+        elif locator:
+            base.move_to_element(locator, driver=self.driver)
+        elif arg == 'end':
+            base.js_scroll_end(driver=self.driver)
+        else:
+            base.js_scroll_top(driver=self.driver)
+        return {'action': step['action'], 'locator': locator, 'result': result,
+                'duration': time.perf_counter() - start}
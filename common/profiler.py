@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/17 10:30'
+import functools
+import html
+import json
+import os
+import threading
+import time
+import types
+
+import pytest
+from py.xml import raw
+from selenium.webdriver.remote.remote_connection import RemoteConnection
+
+from common.base_selenium import Base
+
+
+def histogram(durations):
+    '''耗时列表的统计：次数、总耗时、p50、p95、最大值（秒）'''
+    values = sorted(durations)
+    if not values:
+        return {'count': 0, 'total': 0, 'p50': 0, 'p95': 0, 'max': 0}
+
+    def percentile(percent):
+        return values[min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))]
+    return {
+        'count': len(values),
+        'total': round(sum(values), 4),
+        'p50': round(percentile(50), 4),
+        'p95': round(percentile(95), 4),
+        'max': round(values[-1], 4),
+    }
+
+
+def _locator_text(locator):
+    '''("id", "kw")显示为id=kw；不是locator的参数（如switch_to_frames的frame路径）返回None'''
+    if isinstance(locator, tuple) and len(locator) >= 2 and all(isinstance(x, str) for x in locator[:2]):
+        return '%s=%s' % locator[:2]
+    return None
+
+
+def _group(spans):
+    '''按"类型:名称"分组，如base:click、command:findElement'''
+    groups = {}
+    for span in spans:
+        groups.setdefault('%s:%s' % (span['kind'], span['name']), []).append(span['duration'])
+    return groups
+
+
+class Profiler:
+    '''
+    耗时分析插件：记录每个Base方法调用、每个WebDriver http命令的耗时
+    开启时才给Base的方法和RemoteConnection.execute套上计时，关闭时没有任何额外开销
+    每个用例的记录随report传回主进程（兼容xdist），在html报告中展示最慢的步骤，结束时汇总写入file_path
+    top： 每个用例、整个运行展示最慢的步骤数
+    write： 是否写入file_path，xdist的worker进程不写，由主进程统一写
+    '''
+    def __init__(self, file_path, top=5, write=True):
+        self.file_path = file_path
+        self.top = top
+        self.write = write
+        self.spans = []
+        self.tests = {}
+        self.run_groups = {}
+        self.run_steps = []
+        self._setup_spans = []
+        self._pending = {}  # {nodeid: 还没到teardown的记录}
+        self._local = threading.local()
+        self._patched = []
+
+    # ---------- 计时 ----------
+    def install(self):
+        for name, fn in list(vars(Base).items()):
+            if isinstance(fn, types.FunctionType) and not name.startswith('_'):
+                self._patch(Base, name, self._wrap(fn, 'base', name))
+        self._patch(RemoteConnection, 'execute', self._wrap_command(RemoteConnection.execute))
+
+    def uninstall(self):
+        for owner, name, original, wrapper in reversed(self._patched):
+            # 之后安装的插件（如TraceRecorder）又包了一层时不能还原，否则会把它的包装一起去掉：
+            # 只标记为stale，停用后直接调用原方法，外层插件卸载时跳过stale的包装
+            if vars(owner).get(name) is wrapper:
+                while getattr(original, 'stale', False):
+                    original = original.__wrapped__
+                setattr(owner, name, original)
+            else:
+                wrapper.stale = True
+        self._patched = []
+
+    def _patch(self, owner, name, wrapper):
+        self._patched.append((owner, name, getattr(owner, name), wrapper))
+        setattr(owner, name, wrapper)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _wrap(self, fn, kind, name):
+        profiler = self
+
+        @functools.wraps(fn)
+        def wrapper(base, *args, **kwargs):
+            if not profiler._patched:
+                return fn(base, *args, **kwargs)
+            locator = kwargs.get('locator', args[0] if args else None)
+            span = {'kind': kind, 'name': name, 'locator': _locator_text(locator),
+                    'commands': 0, 'command_time': 0.0}
+            return profiler._timed(span, fn, base, *args, **kwargs)
+        return wrapper
+
+    def _wrap_command(self, fn):
+        profiler = self
+
+        @functools.wraps(fn)
+        def wrapper(connection, command, params):
+            if not profiler._patched:
+                return fn(connection, command, params)
+            stack = profiler._stack()
+            span = {'kind': 'command', 'name': command, 'locator': stack[-1]['locator'] if stack else None}
+            return profiler._timed(span, fn, connection, command, params)
+        return wrapper
+
+    def _timed(self, span, fn, *args, **kwargs):
+        stack = self._stack()
+        span['depth'] = len(stack)
+        stack.append(span)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            span['duration'] = time.perf_counter() - start
+            stack.pop()
+            if span['kind'] == 'command':
+                for parent in stack:
+                    parent['commands'] += 1
+                    parent['command_time'] += span['duration']
+            self.spans.append(span)
+
+    # ---------- 汇总 ----------
+    def _steps(self, spans, nodeid=None):
+        '''最外层的Base调用即用例中的步骤，按耗时从大到小；wait为除去http命令以外的时间（等待、sleep等），phase为所在阶段'''
+        steps = []
+        for span in spans:
+            if span['kind'] == 'base' and span['depth'] == 0:
+                step = {'name': span['name'], 'locator': span['locator'], 'duration': round(span['duration'], 4),
+                        'commands': span['commands'], 'wait': round(span['duration'] - span['command_time'], 4),
+                        'phase': span.get('phase', 'call')}
+                if nodeid:
+                    step['nodeid'] = nodeid
+                steps.append(step)
+        return sorted(steps, key=lambda x: -x['duration'])
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        report = outcome.get_result()
+        # 每个阶段（setup、call、teardown）的记录都随该阶段的report传回，teardown包括fixture的清理（如归还、重置浏览器）
+        # 会话级fixture（启动浏览器等）在第一个用例的setup中执行，算到第一个用例上
+        spans, self.spans = self.spans, []
+        for span in spans:
+            span['phase'] = report.when
+        report.step_profile = [dict(span) for span in spans]
+        if report.when == 'setup':
+            self._setup_spans = spans
+        # html报告中展示setup、call阶段最慢的步骤；setup没有通过时没有call阶段，在setup阶段展示
+        if report.when == 'call' or (report.when == 'setup' and not report.passed):
+            steps = self._steps(self._setup_spans + spans if report.when == 'call' else spans)[:self.top]
+            self._setup_spans = []
+            pytest_html = item.config.pluginmanager.getplugin('html')
+            if pytest_html and steps:
+                extra = getattr(report, 'extra', [])
+                extra.append(pytest_html.extras.html(self._render_steps(steps)))
+                report.extra = extra
+
+    def pytest_runtest_logreport(self, report):
+        spans = getattr(report, 'step_profile', None)
+        if spans is None:
+            return
+        nodeid = getattr(report, 'item_nodeid', report.nodeid)
+        # 一个用例的各阶段合并统计，teardown结束时汇总
+        pending = self._pending.setdefault(nodeid, [])
+        pending.extend(spans)
+        if report.when != 'teardown':
+            return
+        del self._pending[nodeid]
+        groups = _group(pending)
+        steps = self._steps(pending, nodeid)
+        self.tests[nodeid] = {
+            'histogram': dict((name, histogram(values)) for name, values in sorted(groups.items())),
+            'slowest': steps[:self.top],
+        }
+        for name, values in groups.items():
+            self.run_groups.setdefault(name, []).extend(values)
+        self.run_steps = sorted(self.run_steps + steps[:self.top], key=lambda x: -x['duration'])[:self.top * 4]
+
+    def profile(self):
+        return {
+            'run': {
+                'histogram': dict((name, histogram(values)) for name, values in sorted(self.run_groups.items())),
+                'slowest': self.run_steps,
+            },
+            'tests': self.tests,
+        }
+
+    def pytest_sessionfinish(self, session):
+        if not self.write:
+            return
+        dir_path = os.path.dirname(os.path.abspath(self.file_path))
+        if not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+        with open(self.file_path, 'w', encoding='utf-8') as f:
+            json.dump(self.profile(), f, ensure_ascii=False, indent=1, sort_keys=True)
+
+    def pytest_unconfigure(self, config):
+        self.uninstall()
+
+    # ---------- 展示 ----------
+    @staticmethod
+    def _render_steps(steps, with_nodeid=False):
+        head = '<th>Test_nodeid</th>' if with_nodeid else ''
+        rows = ''.join(
+            '<tr>%s<td>%s</td><td>%s</td><td>%.0fms</td><td>%s</td><td>%.0fms</td></tr>' % (
+                '<td>%s</td>' % html.escape(step['nodeid']) if with_nodeid else '',
+                html.escape(step['name']), html.escape(step['locator'] or ''),
+                step['duration'] * 1000, step['commands'], step['wait'] * 1000)
+            for step in steps)
+        return '<div><p>最慢的步骤：</p><table class="step-profile"><tr>%s<th>步骤</th><th>locator</th><th>耗时</th>' \
+               '<th>命令数</th><th>等待</th></tr>%s</table></div>' % (head, rows)
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_html_results_summary(self, prefix, summary, postfix):
+        if self.run_steps:
+            postfix.append(raw(self._render_steps(self.run_steps, with_nodeid=True)))
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if not self.run_steps:
+            return
+        terminalreporter.section('slowest steps')
+        for step in self.run_steps[:self.top]:
+            terminalreporter.write_line('%8.0fms  %-24s %-30s %s' % (
+                step['duration'] * 1000, step['name'], step['locator'] or '', step['nodeid']))
+        terminalreporter.write_line('耗时分析已写入：%s' % self.file_path)
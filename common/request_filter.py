@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/14 15:10'
+import http.client
+import os
+import select
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# 按url后缀判断资源类型
+RESOURCE_TYPES = {
+    'image': ('png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico', 'bmp'),
+    'font': ('woff', 'woff2', 'ttf', 'otf', 'eot'),
+    'media': ('mp4', 'webm', 'ogg', 'ogv', 'mp3', 'wav', 'm3u8', 'ts', 'flv', 'm4a'),
+    'stylesheet': ('css',),
+    'script': ('js',),
+}
+_EXT_TYPES = dict((ext, rtype) for rtype, exts in RESOURCE_TYPES.items() for ext in exts)
+
+# 转发时不能透传的逐跳头
+_HOP_HEADERS = ('connection', 'keep-alive', 'proxy-connection', 'proxy-authorization', 'proxy-authenticate',
+                'te', 'trailers', 'transfer-encoding', 'upgrade')
+
+
+def guess_resource_type(url, accept=''):
+    '''根据url后缀和Accept请求头判断资源类型，判断不了返回None'''
+    ext = os.path.splitext(urlsplit(url).path)[1][1:].lower()
+    if ext in _EXT_TYPES:
+        return _EXT_TYPES[ext]
+    if accept.startswith('image/'):
+        return 'image'
+    if accept.startswith('text/css'):
+        return 'stylesheet'
+    return None
+
+
+def _host_in(host, domains):
+    host = (host or '').lower()
+    return any(host == d or host.endswith('.' + d) for d in domains)
+
+
+class RequestFilter:
+    '''
+    请求过滤规则及拦截统计
+    block_types： 拦截的资源类型，见RESOURCE_TYPES，如['image', 'font', 'media']
+    block_domains： 拦截的域名（包括子域名），如['hm.baidu.com']
+    allow_domains： 域名白名单，不为空时只放行白名单内的域名
+    代理模式下https请求是CONNECT隧道，只能看到域名，block_types只对http请求生效
+    stats只在代理模式下统计拦截的请求数（按原因），不向被拦截的地址发请求，所以不统计节省的流量；CDP模式没有统计
+    '''
+    def __init__(self, block_types=(), block_domains=(), allow_domains=()):
+        self.block_types = set(block_types)
+        self.block_domains = [d.lower() for d in block_domains]
+        self.allow_domains = [d.lower() for d in allow_domains]
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def __bool__(self):
+        return bool(self.block_types or self.block_domains or self.allow_domains)
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'blocked': 0, 'by_reason': {}}
+
+    def match(self, url, resource_type=None, accept=''):
+        '''判断是否拦截，拦截时返回原因（domain或者资源类型），放行返回None'''
+        host = urlsplit(url).hostname if '://' in url else url.split(':')[0]
+        if self.allow_domains and not _host_in(host, self.allow_domains):
+            return 'domain'
+        if _host_in(host, self.block_domains):
+            return 'domain'
+        rtype = resource_type or guess_resource_type(url, accept)
+        if rtype in self.block_types:
+            return rtype
+        return None
+
+    def record(self, reason):
+        with self._lock:
+            self.stats['blocked'] += 1
+            self.stats['by_reason'][reason] = self.stats['by_reason'].get(reason, 0) + 1
+
+    def cdp_patterns(self):
+        '''
+        转换成chrome的Network.setBlockedURLs规则；白名单无法用url规则表示，不包含在内
+        chrome按通配符匹配整个url，后缀规则以.ext结尾或者.ext?开头查询参数，不会匹配域名和路径中间的.js
+        查询参数的值以.ext结尾时（如?file=a.js）仍会匹配
+        '''
+        patterns = []
+        for rtype in sorted(self.block_types):
+            for ext in RESOURCE_TYPES.get(rtype, ()):
+                patterns.extend(['*.%s' % ext, '*.%s?*' % ext])
+        for domain in self.block_domains:
+            patterns.extend(['*://%s/*' % domain, '*://*.%s/*' % domain])
+        return patterns
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    '''过滤代理：http请求按规则拦截或者转发；https只能看到域名，按域名拦截后原样转发隧道'''
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_CONNECT(self):
+        host, _, port = self.path.partition(':')
+        reason = self.server.request_filter.match(host)
+        if reason:
+            self.server.request_filter.record(reason)
+            self.send_error(403, 'Blocked by request filter')
+            return
+        try:
+            upstream = socket.create_connection((host, int(port or 443)), timeout=30)
+        except OSError:
+            self.send_error(502)
+            return
+        self.send_response(200, 'Connection Established')
+        self.end_headers()
+        sockets = [self.connection, upstream]
+        try:
+            while True:
+                readable, _, errored = select.select(sockets, [], sockets, 60)
+                if errored or not readable:
+                    break
+                for sock in readable:
+                    data = sock.recv(65536)
+                    if not data:
+                        return
+                    (upstream if sock is self.connection else self.connection).sendall(data)
+        except OSError:
+            pass
+        finally:
+            upstream.close()
+
+    def _forward(self):
+        request_filter = self.server.request_filter
+        reason = request_filter.match(self.path, accept=self.headers.get('Accept', ''))
+        if reason:
+            request_filter.record(reason)
+            self.send_response(204)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        parts = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers['Content-Length'])) if self.headers.get('Content-Length') else None
+        headers = dict((k, v) for k, v in self.headers.items() if k.lower() not in _HOP_HEADERS)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            conn.request(self.command, path, body, headers)
+            response = conn.getresponse()
+        except OSError:
+            self.send_error(502)
+            return
+        self.send_response(response.status, response.reason)
+        for key, value in response.getheaders():
+            if key.lower() not in _HOP_HEADERS:
+                self.send_header(key, value)
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        while True:
+            chunk = response.read(65536)
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+        conn.close()
+
+    do_GET = do_HEAD = do_POST = do_PUT = do_DELETE = do_PATCH = do_OPTIONS = _forward
+
+
+class FilteringProxy:
+    '''
+    本地过滤代理，浏览器通过--proxy-server等配置使用；不支持CDP的浏览器也能拦截请求
+    https请求只能按域名过滤（CONNECT隧道里看不到url和请求类型），按资源类型过滤只对http请求生效
+    request_filter： 当前生效的RequestFilter，可以在用例之间替换
+    被拦截的请求直接返回204（https返回403），不会连接被拦截的地址
+    '''
+    def __init__(self, request_filter=None, host='127.0.0.1', port=0):
+        self.server = ThreadingHTTPServer((host, port), _ProxyHandler)
+        self.server.daemon_threads = True
+        self.server.request_filter = RequestFilter() if request_filter is None else request_filter
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return '%s:%s' % (host, port)
+
+    @property
+    def request_filter(self):
+        return self.server.request_filter
+
+    @request_filter.setter
+    def request_filter(self, request_filter):
+        self.server.request_filter = request_filter
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def apply_cdp(driver, request_filter, logger=None):
+    '''
+    chrome通过CDP设置拦截规则，不支持时返回False；传空规则即取消拦截
+    拦截由浏览器完成，selenium收不到CDP事件（如Network.loadingFailed），所以CDP模式没有拦截统计，报告中Blocked列为空
+    '''
+    if not hasattr(driver, 'execute_cdp_cmd'):
+        return False
+    if request_filter.allow_domains and logger:
+        logger.warning('CDP模式不支持域名白名单，已忽略：%s' % request_filter.allow_domains)
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': request_filter.cdp_patterns()})
+    return True
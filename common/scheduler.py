@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/15 10:30'
+import heapq
+import json
+import os
+
+
+class TimingStore:
+    '''
+    用例耗时记录：{nodeid: {"setup": 秒, "call": 秒}}，保存为json文件
+    每次运行后按指数移动平均更新，alpha越大越看重最近一次的耗时
+    '''
+    def __init__(self, file_path, alpha=0.5):
+        self.file_path = file_path
+        self.alpha = alpha
+        self.timings = {}
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                self.timings = json.load(f)
+
+    def update(self, nodeid, when, duration):
+        phases = self.timings.setdefault(nodeid, {})
+        old = phases.get(when)
+        phases[when] = round(duration if old is None else self.alpha * duration + (1 - self.alpha) * old, 3)
+
+    def duration(self, nodeid):
+        '''用例的预计耗时（setup + call），没有记录返回None'''
+        phases = self.timings.get(nodeid)
+        if not phases:
+            return None
+        return phases.get('setup', 0) + phases.get('call', 0)
+
+    def save(self):
+        with open(self.file_path, 'w', encoding='utf-8') as f:
+            json.dump(self.timings, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+def lpt_shards(durations, shard_count):
+    '''
+    最长处理时间优先（LPT）：按耗时从大到小，每个用例分给当前总耗时最小的分片
+    durations： [(nodeid, 耗时)]
+    返回[(分片总耗时, [nodeid, ...]), ...]，每个分片内按耗时从大到小排列
+    '''
+    shards = [(0.0, index, []) for index in range(shard_count)]
+    heapq.heapify(shards)
+    # 耗时相同时按nodeid排序，保证不同机器上的分片结果一致
+    for nodeid, duration in sorted(durations, key=lambda x: (-x[1], x[0])):
+        total, index, nodeids = heapq.heappop(shards)
+        nodeids.append(nodeid)
+        heapq.heappush(shards, (total + duration, index, nodeids))
+    return [(total, nodeids) for total, index, nodeids in sorted(shards, key=lambda x: x[1])]
+
+
+def shards_for_budget(durations, time_budget):
+    '''
+    每个分片的LPT总耗时都不超过time_budget时最少需要的分片数
+    单个用例就超出预算时返回None
+    '''
+    if not durations or max(d for _, d in durations) > time_budget:
+        return None
+    count = max(1, int(sum(d for _, d in durations) // time_budget))
+    while max(total for total, _ in lpt_shards(durations, count)) > time_budget:
+        count += 1
+    return count
+
+
+def parse_shard(value):
+    '''--shard=i/N，i从1开始，返回(i, N)'''
+    try:
+        index, count = [int(x) for x in value.split('/')]
+    except ValueError:
+        raise ValueError('--shard参数格式错误，应为i/N，如1/4')
+    if not 1 <= index <= count:
+        raise ValueError('--shard参数错误：i必须在1到N之间')
+    return index, count
+
+
+class Scheduler:
+    '''
+    按历史耗时调度用例的插件
+    每次运行记录每个用例setup、call阶段的耗时；传了--shard=i/N时用LPT算法把用例分成N个总耗时均衡的分片，只运行第i个
+    store： TimingStore
+    shard： (i, N)或者None
+    reorder： 是否按耗时从大到小重新排列用例（配合xdist时最长的先跑），否则保持收集顺序
+    record： 是否记录本次耗时，xdist的worker进程不记录，由主进程统一写
+    time_budget： 每个分片的时间预算（秒），预计耗时超出时只在结果中提示，并给出满足预算需要的分片数，不影响运行
+    '''
+    def __init__(self, store, shard=None, reorder=False, record=True, time_budget=None, default_duration=1.0):
+        self.store = store
+        self.shard = shard
+        self.reorder = reorder
+        self.record = record
+        self.time_budget = time_budget
+        self.default_duration = default_duration
+        self.estimate = None
+        self.suggested_shards = None
+
+    def _durations(self, items):
+        known = [d for d in (self.store.duration(item.nodeid) for item in items) if d is not None]
+        # 没有记录的新用例按已知耗时的中位数估算
+        fallback = sorted(known)[len(known) // 2] if known else self.default_duration
+        durations = []
+        for item in items:
+            duration = self.store.duration(item.nodeid)
+            durations.append((item.nodeid, fallback if duration is None else duration))
+        return durations
+
+    def pytest_collection_modifyitems(self, session, config, items):
+        if not items or not (self.shard or self.reorder or self.time_budget):
+            return
+        durations = self._durations(items)
+        if self.shard:
+            index, count = self.shard
+            self.estimate, selected = lpt_shards(durations, count)[index - 1]
+        else:
+            self.estimate = sum(d for _, d in durations)
+            selected = [nodeid for nodeid, _ in sorted(durations, key=lambda x: (-x[1], x[0]))]
+        if self.time_budget and self.estimate > self.time_budget:
+            self.suggested_shards = shards_for_budget(durations, self.time_budget)
+        selected_set = set(selected)
+        deselected = [item for item in items if item.nodeid not in selected_set]
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+        if self.reorder:
+            by_nodeid = dict((item.nodeid, item) for item in items)
+            items[:] = [by_nodeid[nodeid] for nodeid in selected]
+        else:
+            items[:] = [item for item in items if item.nodeid in selected_set]
+
+    def pytest_runtest_logreport(self, report):
+        if self.record and report.when in ('setup', 'call') and not report.skipped:
+            # conftest会把report.nodeid转码用于展示，这里用转码前的nodeid，和item.nodeid一致
+            self.store.update(getattr(report, 'item_nodeid', report.nodeid), report.when, report.duration)
+
+    def pytest_sessionfinish(self, session):
+        if self.record:
+            self.store.save()
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.estimate is None:
+            return
+        shard = '分片%s/%s，' % self.shard if self.shard else ''
+        terminalreporter.write_line('%s按历史耗时预计：%.1f秒' % (shard, self.estimate))
+        if self.time_budget and self.estimate > self.time_budget:
+            if self.suggested_shards:
+                advice = '按当前用例至少需要%s个分片' % self.suggested_shards
+            else:
+                advice = '有单个用例超出预算，增加分片数也无法满足'
+            terminalreporter.write_line('预计耗时超出时间预算%s秒，%s' % (self.time_budget, advice), yellow=True)
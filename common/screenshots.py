@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/13 11:05'
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # 没有安装Pillow时，原样保存png
+    Image = None
+
+
+class ScreenshotWriter:
+    '''
+    失败截图后台处理：用例线程只负责截图拿到png，解码、缩放、重新编码、写文件都在后台线程池完成
+    同样内容的截图按sha1去重，文件名即内容hash；每张截图保存原尺寸和缩略图两份
+    dir_path： 截图保存的文件夹
+    image_format： 重新编码的格式，jpeg/webp，没有安装Pillow时固定为png
+    thumb_size： 缩略图的最大尺寸
+    quality： jpeg/webp的压缩质量
+    max_workers： 后台线程数
+    logger： 后台线程处理截图失败时记录日志，失败的截图直接丢弃
+    '''
+    def __init__(self, dir_path, image_format='jpeg', thumb_size=(600, 300), quality=80, max_workers=2, logger=None):
+        self.dir_path = dir_path
+        self.image_format = image_format.lower() if Image else 'png'
+        self.ext = 'jpg' if self.image_format == 'jpeg' else self.image_format
+        self.thumb_size = thumb_size
+        self.quality = quality
+        self.logger = logger
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(self, png):
+        '''
+        提交一张png截图，立即返回(原图文件名, 缩略图文件名)，文件在后台写入
+        '''
+        digest = hashlib.sha1(png).hexdigest()
+        full_name = '%s.%s' % (digest, self.ext)
+        thumb_name = '%s_thumb.%s' % (digest, self.ext)
+        with self._lock:
+            if digest in self._seen or os.path.exists(os.path.join(self.dir_path, full_name)):
+                return full_name, thumb_name
+            self._seen.add(digest)
+        self._executor.submit(self._write, png, full_name, thumb_name)
+        return full_name, thumb_name
+
+    def _write(self, png, full_name, thumb_name):
+        try:
+            # 第一张截图写入时才创建文件夹，没有失败用例时不创建
+            if not os.path.exists(self.dir_path):
+                os.makedirs(self.dir_path, exist_ok=True)
+            if Image is None:
+                for name in (full_name, thumb_name):
+                    with open(os.path.join(self.dir_path, name), 'wb') as f:
+                        f.write(png)
+                return
+            image = Image.open(io.BytesIO(png))
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            self._save(image, thumb_name, thumb=True)
+            self._save(image, full_name)
+        except Exception:
+            # 后台线程的异常没有人取结果，不记录就会被静默丢弃
+            if self.logger:
+                self.logger.error("截图编码或写入失败，丢弃：%s" % full_name, exc_info=True)
+            with self._lock:
+                self._seen.discard(os.path.splitext(full_name)[0])  # 同样的截图再次提交时重试
+
+    def _save(self, image, name, thumb=False):
+        if thumb:
+            image = image.copy()
+            image.thumbnail(self.thumb_size)
+        # 先写临时文件再改名，避免报告打开时读到半截图片
+        path = os.path.join(self.dir_path, name)
+        try:
+            image.save(path + '.tmp', format=self.image_format.upper(), quality=self.quality)
+            os.replace(path + '.tmp', path)
+        except Exception:
+            if os.path.exists(path + '.tmp'):
+                os.remove(path + '.tmp')
+            raise
+
+    def close(self):
+        '''等待后台截图全部写完'''
+        self._executor.shutdown(wait=True)
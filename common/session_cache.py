@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/14 10:40'
+import json
+import os
+import re
+import time
+
+# 一次性读取当前页面的url、localStorage、sessionStorage
+CAPTURE_JS = '''
+function dump(storage) {
+    var data = {};
+    for (var i = 0; i < storage.length; i++) {
+        var key = storage.key(i);
+        data[key] = storage.getItem(key);
+    }
+    return data;
+}
+return {url: location.href, localStorage: dump(window.localStorage), sessionStorage: dump(window.sessionStorage)};
+'''
+
+# 一次性写回localStorage、sessionStorage和非httpOnly的cookie
+# 浏览器只允许写当前域名及其上级域名的cookie，其他域名的不写，返回当前域名和没写的cookie
+RESTORE_JS = '''
+var state = arguments[0], host = location.hostname, skipped = [];
+["localStorage", "sessionStorage"].forEach(function (name) {
+    var storage = window[name], data = state[name] || {};
+    for (var key in data) storage.setItem(key, data[key]);
+});
+state.cookies.forEach(function (c) {
+    var domain = (c.domain || "").replace(/^\\./, "");
+    if (domain && host !== domain && host.slice(-domain.length - 1) !== "." + domain) {
+        skipped.push(c.name + "@" + c.domain);
+        return;
+    }
+    var cookie = c.name + "=" + c.value + "; path=" + (c.path || "/");
+    if (domain && domain !== host) cookie += "; domain=" + c.domain;
+    if (c.expiry) cookie += "; expires=" + new Date(c.expiry * 1000).toUTCString();
+    if (c.secure) cookie += "; secure";
+    if (c.sameSite) cookie += "; samesite=" + c.sameSite;
+    document.cookie = cookie;
+});
+return {host: host, skipped: skipped};
+'''
+
+
+def _domain_matches(host, domain):
+    '''cookie的domain是否为host本身或者上级域名，不是时当前页面写不了这个cookie'''
+    domain = (domain or '').lstrip('.').lower()
+    return not domain or host == domain or host.endswith('.' + domain)
+
+
+class SessionCache:
+    '''
+    登录态缓存：登录流程执行一次后，保存cookies、localStorage、sessionStorage到磁盘，
+    之后的用例直接恢复到浏览器，跳过登录页面
+    dir_path： 缓存文件夹
+    logger： 日志
+    ttl： 缓存有效期（秒），cookie更早过期时以cookie为准
+    '''
+    def __init__(self, dir_path, logger, ttl=3600):
+        self.dir_path = dir_path
+        self.logger = logger
+        self.ttl = ttl
+        if not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+
+    def _path(self, name):
+        return os.path.join(self.dir_path, re.sub(r'[^\w.-]', '_', name) + '.json')
+
+    def capture(self, handle, name):
+        '''保存当前浏览器的登录态，handle为Base实例'''
+        driver = handle.driver
+        state = driver.execute_script(CAPTURE_JS)
+        state['cookies'] = driver.get_cookies()
+        expiries = [c['expiry'] for c in state['cookies'] if c.get('expiry')]
+        state['expires_at'] = min([time.time() + self.ttl] + expiries)
+        # xdist的多个worker可能同时保存同一个登录态，先写临时文件再改名，其他进程读不到写了一半的文件
+        path = self._path(name)
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self.logger.info('保存登录态：%s，cookies%s个' % (name, len(state['cookies'])))
+        return state
+
+    def load(self, name):
+        '''读取没有过期的登录态，不存在、已过期或者文件损坏返回None'''
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (ValueError, OSError) as e:
+            self.logger.error('读取登录态缓存失败：%s，%s' % (name, e))
+            self.invalidate(name)
+            return None
+        if state.get('expires_at', 0) <= time.time():
+            self.logger.info('登录态已过期：%s' % name)
+            self.invalidate(name)
+            return None
+        return state
+
+    def restore(self, handle, name):
+        '''把登录态恢复到浏览器：先打开保存时的页面，再一次脚本写回storage和cookie；成功返回True'''
+        state = self.load(name)
+        if state is None:
+            return False
+        driver = handle.driver
+        handle.get(state['url'])
+        cookies = [c for c in state['cookies'] if not c.get('httpOnly')]
+        result = driver.execute_script(RESTORE_JS, {
+            'localStorage': state['localStorage'],
+            'sessionStorage': state['sessionStorage'],
+            'cookies': cookies,
+        })
+        host, skipped = result['host'].lower(), list(result['skipped'])
+        # httpOnly的cookie js写不了，只能逐个add_cookie
+        for cookie in state['cookies']:
+            if not cookie.get('httpOnly'):
+                continue
+            label = '%s@%s' % (cookie['name'], cookie.get('domain'))
+            if not _domain_matches(host, cookie.get('domain')):
+                skipped.append(label)
+                continue
+            try:
+                driver.add_cookie(dict((k, v) for k, v in cookie.items() if k != 'sameSite'))
+            except Exception:
+                self.logger.warning('恢复cookie失败：%s' % label, exc_info=True)
+                skipped.append(label)
+        if skipped:
+            # 其他域名的cookie需要打开该域名的页面才能写入，这里只记录，依赖这些cookie时请在对应页面重新登录
+            self.logger.warning('登录态%s有%s个cookie未恢复（当前域名%s）：%s' % (
+                name, len(skipped), host, ', '.join(skipped)))
+        self.logger.info('恢复登录态：%s' % name)
+        return True
+
+    def invalidate(self, name):
+        '''删除登录态缓存'''
+        path = self._path(name)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        self.logger.info('删除登录态缓存：%s' % name)
+
+    def login(self, handle, name, flow, check=None):
+        '''
+        有缓存时直接恢复登录态，否则执行flow(handle)登录并保存
+        check(handle)： 恢复后判断是否仍是登录状态，返回False时删除缓存，重新执行登录流程
+        执行了登录流程返回True，直接恢复返回False
+        '''
+        if self.restore(handle, name):
+            handle.refresh()
+            if check is None or check(handle):
+                return False
+            self.logger.info('登录态已失效：%s，重新登录' % name)
+            self.invalidate(name)
+            handle.delete_cookies()
+            handle.execute_js('window.localStorage.clear(); window.sessionStorage.clear();')
+        flow(handle)
+        self.capture(handle, name)
+        return True
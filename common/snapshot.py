@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/19 16:10'
+import re
+import threading
+from types import MappingProxyType
+
+try:
+    from lxml import etree
+except ImportError:  # 没有安装lxml时只能遍历快照，不能用css/xpath查询
+    etree = None
+
+from common.waits import LOCATE_JS
+
+_XML_INVALID = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f]')  # xml不允许的控制字符
+
+# 一次execute_script序列化整个DOM子树，arguments[0]为locator，null时为整个页面
+# 每个元素为[标签, 属性, 是否可见, [x, y, 宽, 高], 子节点]，子节点是文本字符串或者元素
+# 表单元素的value、checked、selected取当前状态，而不是html里的初始属性
+SNAPSHOT_JS = LOCATE_JS + '''
+var SKIP = {SCRIPT: 1, STYLE: 1, NOSCRIPT: 1, TEMPLATE: 1};
+function serialize(el, parentVisible) {
+    var attrs = {}, children = [];
+    for (var i = 0; i < el.attributes.length; i++) attrs[el.attributes[i].name] = el.attributes[i].value;
+    if (typeof el.value === "string") attrs.value = el.value;
+    if (el.type === "checkbox" || el.type === "radio") { delete attrs.checked; if (el.checked) attrs.checked = "true"; }
+    if (el.tagName === "OPTION") { delete attrs.selected; if (el.selected) attrs.selected = "true"; }
+    var r = el.getBoundingClientRect(), style = window.getComputedStyle(el);
+    var visible = parentVisible && style.display !== "none" && style.visibility !== "hidden" && el.getClientRects().length > 0;
+    for (var node = el.firstChild; node; node = node.nextSibling) {
+        if (node.nodeType === 3) children.push(node.nodeValue);
+        else if (node.nodeType === 1 && !SKIP[node.tagName]) children.push(serialize(node, visible));
+    }
+    return [el.tagName.toLowerCase(), attrs, visible ? 1 : 0, [r.left, r.top, r.width, r.height], children];
+}
+var root = arguments[0] ? locate(arguments[0][0], arguments[0][1], false) : document.documentElement;
+return root ? serialize(root, true) : null;
+'''
+
+
+class SnapshotNode:
+    '''
+    快照中的一个元素，只读
+    tag： 标签名；attrs： 属性（只读字典）；visible： 是否可见；rect： (x, y, 宽, 高)
+    children： 子元素；text： 所有后代文本，连续空白合并为一个空格
+    '''
+    __slots__ = ('tag', 'attrs', 'visible', 'rect', 'children', 'parts', '_text')
+
+    def __init__(self, tag, attrs, visible, rect, parts):
+        set_ = object.__setattr__
+        set_(self, 'tag', tag)
+        set_(self, 'attrs', MappingProxyType(attrs))
+        set_(self, 'visible', bool(visible))
+        set_(self, 'rect', tuple(rect))
+        set_(self, 'parts', tuple(parts))  # 按顺序的文本和子元素
+        set_(self, 'children', tuple(part for part in parts if isinstance(part, SnapshotNode)))
+        set_(self, '_text', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('快照是只读的，不能修改%s' % name)
+
+    @property
+    def text(self):
+        if self._text is None:
+            object.__setattr__(self, '_text', re.sub(r'\s+', ' ', ''.join(self._iter_text())).strip())
+        return self._text
+
+    def _iter_text(self):
+        for part in self.parts:
+            if isinstance(part, SnapshotNode):
+                for text in part._iter_text():
+                    yield text
+            else:
+                yield part
+
+    def get(self, name, default=None):
+        '''获取属性'''
+        return self.attrs.get(name, default)
+
+    def iter(self):
+        '''自身和所有后代元素，文档顺序'''
+        yield self
+        for child in self.children:
+            for node in child.iter():
+                yield node
+
+    def __repr__(self):
+        return '<SnapshotNode %s %s>' % (self.tag, dict(self.attrs))
+
+
+def _build(data):
+    tag, attrs, visible, rect, children = data
+    return SnapshotNode(tag, attrs, visible, rect,
+                        [_build(child) if isinstance(child, list) else child for child in children])
+
+
+class DomSnapshot:
+    '''
+    DOM快照：一次脚本取回的元素树，之后的断言都在本地查询，不再请求浏览器
+    快照只读，可以在多个断言之间共享；select/xpath查询需要安装lxml（css查询还需要cssselect）
+        snap = handle.snapshot(('id', 'result-table'))
+        assert [row.text for row in snap.select('tbody tr')] == expected
+    '''
+    def __init__(self, data):
+        self.root = _build(data)
+        self._tree = None
+        self._nodes = None
+        self._lock = threading.Lock()
+
+    def _lxml(self):
+        '''按快照构建lxml树，第一次查询时才构建；_nodes为lxml元素到快照元素的映射'''
+        if etree is None:
+            raise Exception('快照查询需要安装lxml：pip install lxml cssselect')
+        with self._lock:
+            if self._tree is None:
+                self._nodes = {}
+                self._tree = self._build_lxml(self.root, None)
+        return self._tree
+
+    def _build_lxml(self, node, parent):
+        element = etree.Element(node.tag) if parent is None else etree.SubElement(parent, node.tag)
+        for name, value in node.attrs.items():
+            try:
+                element.set(name, _XML_INVALID.sub('', value))
+            except ValueError:  # lxml不支持的属性名，如@click
+                pass
+        last = None
+        for part in node.parts:
+            if isinstance(part, SnapshotNode):
+                last = self._build_lxml(part, element)
+            elif last is None:
+                element.text = (element.text or '') + _XML_INVALID.sub('', part)
+            else:
+                last.tail = (last.tail or '') + _XML_INVALID.sub('', part)
+        self._nodes[element] = node
+        return element
+
+    def xpath(self, expression):
+        '''xpath查询，返回快照元素元组；表达式结果为文本、数字时原样返回'''
+        result = self._lxml().xpath(expression)
+        if not isinstance(result, list):
+            return result
+        return tuple(self._nodes.get(item, item) for item in result)
+
+    def select(self, css):
+        '''css查询，返回快照元素元组'''
+        try:
+            from lxml.cssselect import CSSSelector
+        except ImportError:
+            raise Exception('快照css查询需要安装cssselect：pip install cssselect')
+        tree = self._lxml()
+        return tuple(self._nodes[element] for element in CSSSelector(css, translator='html')(tree))
+
+    def select_one(self, css):
+        '''css查询第一个元素，没有则返回None'''
+        found = self.select(css)
+        return found[0] if found else None
+
+    def texts(self, css):
+        '''css查询到的所有元素的文本'''
+        return [node.text for node in self.select(css)]
+
+    def __iter__(self):
+        return self.root.iter()
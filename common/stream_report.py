@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/13 16:20'
+import html
+import json
+import os
+import time
+
+
+class StreamReport:
+    '''
+    流式测试报告插件：每个用例结束立即追加一行json到results.jsonl并flush，进程被杀也能保留已执行的结果
+    全部执行完后，逐行读取jsonl生成分页的html（index.html + 每页page_N.html），内存占用与用例数量无关
+    dir_path： 报告文件夹
+    page_size： 每页的用例数
+    screenshot_url： 截图文件夹相对报告文件夹的路径
+    '''
+    def __init__(self, dir_path, page_size=500, screenshot_url='../screenshots'):
+        self.dir_path = dir_path
+        self.page_size = page_size
+        self.screenshot_url = screenshot_url.replace(os.sep, '/')
+        self.jsonl_path = os.path.join(dir_path, 'results.jsonl')
+        if not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+        self._file = open(self.jsonl_path, 'w', encoding='utf-8')
+        self._start = time.time()
+
+    def pytest_runtest_logreport(self, report):
+        # 每个用例只记录一行：call阶段，或者setup/teardown阶段没有通过
+        if report.when != 'call' and report.passed:
+            return
+        if report.when == 'teardown' and not report.failed:
+            return
+        outcome = 'xfailed' if hasattr(report, 'wasxfail') and report.skipped else report.outcome
+        row = {
+            'nodeid': report.nodeid,
+            'when': report.when,
+            'outcome': outcome,
+            'duration': round(report.duration, 3),
+            'description': getattr(report, 'description', ''),
+            'screenshot': getattr(report, 'screenshot', None),
+            'blocked': getattr(report, 'blocked', ''),
+            'longrepr': report.longreprtext if report.failed else '',
+        }
+        self._file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def pytest_sessionfinish(self, session):
+        self._file.close()
+        self.render()
+
+    def _rows(self):
+        with open(self.jsonl_path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    def render(self):
+        '''把results.jsonl逐页渲染成html'''
+        counts = {}
+        page, page_file, row_count = 0, None, 0
+        for row in self._rows():
+            if row_count % self.page_size == 0:
+                if page_file:
+                    self._end_page(page_file, page, has_next=True)
+                page += 1
+                page_file = open(os.path.join(self.dir_path, 'page_%s.html' % page), 'w', encoding='utf-8')
+                self._begin_page(page_file, page)
+            page_file.write(self._render_row(row))
+            counts[row['outcome']] = counts.get(row['outcome'], 0) + 1
+            row_count += 1
+        if page_file:
+            self._end_page(page_file, page, has_next=False)
+        self._render_index(counts, row_count, page)
+
+    def _begin_page(self, f, page):
+        f.write('<!DOCTYPE html><html><head><meta charset="utf-8"><title>第%s页</title>%s</head><body>'
+                '<p><a href="index.html">返回汇总</a></p><table><tr><th>Result</th><th>Description</th>'
+                '<th>Test_nodeid</th><th>Duration</th><th>Blocked</th><th>Screenshot</th></tr>' % (page, _STYLE))
+
+    def _end_page(self, f, page, has_next):
+        f.write('</table><p>%s%s</p></body></html>' % (
+            '<a href="page_%s.html">上一页</a> ' % (page - 1) if page > 1 else '',
+            '<a href="page_%s.html">下一页</a>' % (page + 1) if has_next else '',
+        ))
+        f.close()
+
+    def _render_row(self, row):
+        screenshot = ''
+        if row.get('screenshot'):
+            full_name, thumb_name = row['screenshot']
+            # loading="lazy"：滚动到可见时才加载缩略图
+            screenshot = '<a href="%s/%s" target="_blank"><img loading="lazy" src="%s/%s" ' \
+                         'style="max-width:300px;max-height:150px;"/></a>' % (
+                self.screenshot_url, full_name, self.screenshot_url, thumb_name)
+        longrepr = '<pre>%s</pre>' % html.escape(row['longrepr']) if row.get('longrepr') else ''
+        return '<tr class="%s"><td>%s</td><td>%s</td><td>%s%s</td><td>%s</td><td>%s</td><td>%s</td></tr>' % (
+            row['outcome'], row['outcome'], html.escape(str(row['description'])), html.escape(row['nodeid']),
+            longrepr, row['duration'], html.escape(row.get('blocked') or ''), screenshot)
+
+    def _render_index(self, counts, total, pages):
+        summary = ''.join('<li>%s：%s</li>' % (outcome, count) for outcome, count in sorted(counts.items()))
+        links = ' '.join('<a href="page_%s.html">第%s页</a>' % (i, i) for i in range(1, pages + 1))
+        with open(os.path.join(self.dir_path, 'index.html'), 'w', encoding='utf-8') as f:
+            f.write('<!DOCTYPE html><html><head><meta charset="utf-8"><title>测试报告</title>%s</head><body>'
+                    '<h1>测试报告</h1><p>共%s个用例，耗时%.1f秒</p><ul>%s</ul><p>%s</p></body></html>'
+                    % (_STYLE, total, time.time() - self._start, summary, links))
+
+
+_STYLE = '<style>table{border-collapse:collapse}td,th{border:1px solid #ccc;padding:4px}' \
+         'tr.failed td:first-child{color:red}tr.passed td:first-child{color:green}pre{white-space:pre-wrap}</style>'
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/20 10:30'
+import argparse
+import contextlib
+import functools
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import types
+
+import pytest
+
+from common.base_selenium import Base
+
+# 索引：每个用例每次执行一行，记录所在的段文件和字节位置，按nodeid查询只需要一次索引查找和一次seek
+INDEX_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS traces (
+    nodeid TEXT, segment TEXT, offset INTEGER, length INTEGER, compressed INTEGER,
+    outcome TEXT, start REAL, duration REAL, records INTEGER
+);
+CREATE INDEX IF NOT EXISTS traces_nodeid ON traces (nodeid);
+CREATE INDEX IF NOT EXISTS traces_segment ON traces (segment);
+'''
+
+
+class TraceStore:
+    '''
+    用例轨迹存储：每个用例的记录写成一段连续的JSONL，段文件超过max_bytes时切割
+    切割后的旧段在后台压缩，每个用例单独压缩为一个gzip成员，整个文件仍然可以用zcat查看，也可以按偏移读取单个用例
+    sqlite索引记录nodeid -> (段文件, 偏移, 长度)，查询一个用例不需要扫描日志
+    索引由后台线程按批写入，压缩也在这个线程中按顺序执行，用例线程只写段文件；close时等待写完
+    dir_path： 存储文件夹
+    prefix： 段文件名前缀，xdist的每个worker用不同的前缀，各写各的段文件，共用一个索引
+    backup_count： 保留的段文件数量（按前缀），超过时删除最旧的段和索引
+    '''
+    def __init__(self, dir_path, prefix='trace', max_bytes=64 * 1024 * 1024, backup_count=20):
+        self.dir_path = dir_path
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        if not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+        self.index_path = os.path.join(dir_path, 'index.sqlite')
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()  # 索引行(nodeid, ...)、待压缩的段名，None为结束
+        self._writer = None
+        self._file = None
+        self._segment = None
+        with self._connect() as db:
+            db.executescript(INDEX_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        '''索引连接，正常结束时提交；xdist的多个worker同时写时等待锁'''
+        db = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _segments(self):
+        '''本前缀的段文件编号，从小到大'''
+        pattern = re.compile(r'^%s-(\d+)\.jsonl(\.gz)?$' % re.escape(self.prefix))
+        numbers = set()
+        for name in os.listdir(self.dir_path):
+            match = pattern.match(name)
+            if match:
+                numbers.add(int(match.group(1)))
+        return sorted(numbers)
+
+    def _open_segment(self):
+        numbers = self._segments()
+        self._segment = '%s-%05d.jsonl' % (self.prefix, (numbers[-1] + 1) if numbers else 1)
+        self._file = open(os.path.join(self.dir_path, self._segment), 'ab')
+
+    # ---------- 写入 ----------
+    def write(self, nodeid, records, outcome, start, duration):
+        '''写入一个用例的记录，索引交给后台线程写'''
+        data = ''.join(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+                       for record in records).encode('utf-8')
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            offset = self._file.tell()
+            self._file.write(data)
+            self._file.flush()
+            self._submit((nodeid, self._segment, offset, len(data), outcome, start, duration, len(records)))
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+
+    def compress_leftovers(self):
+        '''上次运行中断时没有压缩的段（本前缀），在后台压缩；在打开新段之前调用'''
+        with self._lock:
+            for number in self._segments():
+                segment = '%s-%05d.jsonl' % (self.prefix, number)
+                if segment != self._segment and os.path.exists(os.path.join(self.dir_path, segment)):
+                    self._submit(segment)
+
+    def _submit(self, item):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_index, daemon=True)
+            self._writer.start()
+        self._queue.put(item)
+
+    def _write_index(self):
+        '''后台线程：攒一批索引行一次提交；遇到待压缩的段时先提交之前的行，保证压缩时索引完整'''
+        while True:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = []
+            for item in items:
+                if isinstance(item, tuple):
+                    rows.append(item)
+                    continue
+                self._insert(rows)
+                rows = []
+                if item is None:
+                    return
+                try:
+                    self._compress(item)
+                except Exception:
+                    pass  # 压缩失败时保留原文件，下次启动时再压缩
+            self._insert(rows)
+
+    def _insert(self, rows):
+        if rows:
+            with self._connect() as db:
+                db.executemany('INSERT INTO traces VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?)', rows)
+
+    def _rotate(self):
+        self._file.close()
+        segment, self._file = self._segment, None
+        self._submit(segment)
+
+    def _compress(self, segment):
+        '''旧段压缩：按索引中的顺序，每个用例压缩为一个gzip成员，更新索引后删除原文件'''
+        source = os.path.join(self.dir_path, segment)
+        target = segment + '.gz'
+        with self._connect() as db:
+            rows = db.execute('SELECT rowid, offset, length FROM traces WHERE segment = ? ORDER BY offset',
+                              (segment,)).fetchall()
+            updates = []
+            with open(source, 'rb') as f, open(os.path.join(self.dir_path, target), 'wb') as out:
+                for rowid, offset, length in rows:
+                    f.seek(offset)
+                    member = gzip.compress(f.read(length))
+                    updates.append((target, out.tell(), len(member), rowid))
+                    out.write(member)
+            db.executemany('UPDATE traces SET segment = ?, offset = ?, length = ?, compressed = 1 WHERE rowid = ?',
+                           updates)
+        os.remove(source)
+        self._prune(int(segment[len(self.prefix) + 1:-len('.jsonl')]))
+
+    def _prune(self, upto):
+        '''删除超出backup_count的最旧的段；只删除编号不大于upto（刚压缩完）的段，更新的段的索引可能还没写入'''
+        numbers = self._segments()
+        for number in [n for n in numbers[:max(len(numbers) - self.backup_count, 0)] if n <= upto]:
+            for segment in ('%s-%05d.jsonl' % (self.prefix, number), '%s-%05d.jsonl.gz' % (self.prefix, number)):
+                path = os.path.join(self.dir_path, segment)
+                if os.path.exists(path) and segment != self._segment:
+                    with self._connect() as db:
+                        db.execute('DELETE FROM traces WHERE segment = ?', (segment,))
+                    os.remove(path)
+
+    def close(self):
+        '''关闭段文件，等待后台线程写完索引、压缩完切割的段'''
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+            writer, self._writer = self._writer, None
+        if writer:
+            self._queue.put(None)
+            writer.join()
+
+    # ---------- 查询 ----------
+    def find(self, pattern='', failed=False, limit=20):
+        '''
+        按nodeid查询，返回最近的limit次执行，新的在前
+        pattern为完整的nodeid时走索引，否则按nodeid包含pattern查询
+        '''
+        rows = self._query('nodeid = ?', pattern, failed, limit)
+        if not rows:
+            rows = self._query('nodeid LIKE ?', '%' + pattern + '%', failed, limit)
+        keys = ('nodeid', 'outcome', 'start', 'duration', 'records', 'segment', 'offset', 'length', 'compressed')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def _query(self, where, value, failed, limit):
+        if failed:
+            where += " AND outcome != 'passed'"
+        with self._connect() as db:
+            return db.execute('SELECT nodeid, outcome, start, duration, records, segment, offset, length, compressed '
+                              'FROM traces WHERE %s ORDER BY start DESC LIMIT ?' % where, (value, limit)).fetchall()
+
+    def read(self, entry):
+        '''读取find返回的一次执行的所有记录'''
+        try:
+            with open(os.path.join(self.dir_path, entry['segment']), 'rb') as f:
+                f.seek(entry['offset'])
+                data = f.read(entry['length'])
+        except FileNotFoundError:
+            # 读取时这个段刚好被压缩，重新查一次索引
+            with self._connect() as db:
+                row = db.execute('SELECT segment, offset, length, compressed FROM traces WHERE nodeid = ? AND start = ?',
+                                 (entry['nodeid'], entry['start'])).fetchone()
+            if row is None or row[0] == entry['segment']:
+                raise
+            return self.read(dict(entry, segment=row[0], offset=row[1], length=row[2], compressed=row[3]))
+        if entry['compressed']:
+            data = gzip.decompress(data)
+        return [json.loads(line) for line in data.decode('utf-8').splitlines()]
+
+    def latest(self, nodeid):
+        '''一个用例最近一次执行的记录，没有则返回None'''
+        found = self.find(nodeid, limit=1)
+        return self.read(found[0]) if found else None
+
+
+class _TraceHandler(logging.Handler):
+    def __init__(self, recorder):
+        super(_TraceHandler, self).__init__()
+        self.recorder = recorder
+
+    def emit(self, record):
+        self.recorder.add({'level': record.levelname, 'msg': record.getMessage()})
+
+
+class TraceRecorder:
+    '''
+    用例轨迹插件：记录每个用例的阶段、Base步骤（方法名、locator、耗时、异常）和日志，用例结束后写入TraceStore
+    日志文件中不同用例的记录是交错的，轨迹按用例分开存储，可以直接查某个用例做了什么：
+        python -m common.trace logs/trace test_baidu.py::test_01
+    '''
+    def __init__(self, store):
+        self.store = store
+        self.count = 0
+        self._records = None
+        self._start = None
+        self._outcome = 'passed'
+        self._local = threading.local()
+        self._patched = []
+        self._handler = _TraceHandler(self)
+
+    def install(self):
+        for name, fn in list(vars(Base).items()):
+            if isinstance(fn, types.FunctionType) and not name.startswith('_'):
+                wrapper = self._wrap(fn, name)
+                self._patched.append((name, fn, wrapper))
+                setattr(Base, name, wrapper)
+        # 挂在根logger上，Base等所有logger的日志都会传到这里
+        logging.getLogger().addHandler(self._handler)
+
+    def uninstall(self):
+        for name, fn, wrapper in reversed(self._patched):
+            # Base上已经不是自己的包装（之后安装的Profiler又包了一层）时不还原，标记为stale，见Profiler.uninstall
+            if vars(Base).get(name) is wrapper:
+                while getattr(fn, 'stale', False):
+                    fn = fn.__wrapped__
+                setattr(Base, name, fn)
+            else:
+                wrapper.stale = True
+        self._patched = []
+        logging.getLogger().removeHandler(self._handler)
+
+    def _wrap(self, fn, name):
+        recorder = self
+
+        @functools.wraps(fn)
+        def wrapper(base, *args, **kwargs):
+            local = recorder._local
+            # 只记录最外层的调用，即用例中的步骤
+            if getattr(local, 'step', None) is not None or recorder._records is None or not recorder._patched:
+                return fn(base, *args, **kwargs)
+            locator = kwargs.get('locator', args[0] if args else None)
+            record = {'step': name}
+            # switch_to_frames等方法的第一个参数不是locator
+            if isinstance(locator, tuple) and len(locator) >= 2 and all(isinstance(x, str) for x in locator[:2]):
+                record['locator'] = '%s=%s' % locator[:2]
+            recorder.add(record)
+            local.step = name
+            start = time.perf_counter()
+            try:
+                return fn(base, *args, **kwargs)
+            except Exception as e:
+                record['error'] = '%s: %s' % (type(e).__name__, e)
+                raise
+            finally:
+                record['ms'] = round((time.perf_counter() - start) * 1000, 1)
+                local.step = None
+        return wrapper
+
+    def add(self, record):
+        '''添加一条记录，t为距离用例开始的秒数；用例之外的记录丢弃'''
+        records = self._records
+        if records is None:
+            return
+        record['t'] = round(time.time() - self._start, 3)
+        step = getattr(self._local, 'step', None)
+        if step and 'step' not in record:
+            record['in'] = step
+        records.append(record)
+
+    def pytest_runtest_logstart(self, nodeid, location):
+        self._records, self._start, self._outcome = [], time.time(), 'passed'
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        report = outcome.get_result()
+        record = {'phase': report.when, 'outcome': report.outcome, 'ms': round(report.duration * 1000, 1)}
+        if report.failed:
+            self._outcome = 'failed'
+            record['error'] = call.excinfo.exconly() if call.excinfo else ''
+        elif report.skipped and self._outcome == 'passed':
+            self._outcome = 'skipped'
+        self.add(record)
+
+    def pytest_runtest_logfinish(self, nodeid, location):
+        records, self._records = self._records, None
+        if records is None:
+            return
+        self.store.write(nodeid, records, self._outcome, self._start, time.time() - self._start)
+        self.count += 1
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.count:
+            terminalreporter.write_line('用例轨迹：%s个用例，查看：python -m common.trace %s <nodeid>' % (
+                self.count, self.store.dir_path))
+
+    def pytest_unconfigure(self, config):
+        self.uninstall()
+        self.store.close()
+
+
+def format_records(records):
+    '''一次执行的记录格式化为文本行'''
+    lines = []
+    for record in records:
+        if 'phase' in record:
+            line = '---- %s %s %.0fms' % (record['phase'], record['outcome'], record['ms'])
+        elif 'step' in record:
+            line = '%s %s %s' % (record['step'], record.get('locator', ''), '%.0fms' % record['ms'] if 'ms' in record else '')
+        else:
+            line = '    [%s] %s' % (record['level'], record['msg'])
+        if record.get('error'):
+            line += '  !! %s' % record['error']
+        lines.append('%8.3fs  %s' % (record['t'], line.rstrip()))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='查看用例轨迹')
+    parser.add_argument('dir_path', help='轨迹文件夹，即--trace-dir')
+    parser.add_argument('nodeid', nargs='?', default='', help='用例nodeid或者其中一部分')
+    parser.add_argument('--failed', action='store_true', help='只看失败的用例')
+    parser.add_argument('--list', action='store_true', help='只列出匹配的执行，不输出记录')
+    parser.add_argument('--limit', type=int, default=20, help='最多列出的执行次数')
+    args = parser.parse_args(argv)
+    store = TraceStore(args.dir_path)
+    entries = store.find(args.nodeid, failed=args.failed, limit=args.limit)
+    if not entries:
+        print('没有找到用例轨迹：%s' % args.nodeid)
+        return 1
+    if args.list or len(set(entry['nodeid'] for entry in entries)) > 1:
+        for entry in entries:
+            print('%s  %-7s %6.2fs  %4s条  %s' % (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['start'])),
+                                              entry['outcome'], entry['duration'], entry['records'], entry['nodeid']))
+        return 0
+    entry = entries[0]
+    print('%s  %s  %.2fs' % (entry['nodeid'], entry['outcome'], entry['duration']))
+    for line in format_records(store.read(entry)):
+        print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
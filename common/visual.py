@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/19 10:20'
+import hashlib
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:  # 没有安装numpy、Pillow时不能做视觉对比
+    np = Image = None
+
+from common.waits import LOCATE_JS
+
+# 一次脚本取所有忽略区域的位置，乘以devicePixelRatio换算成截图上的像素
+REGIONS_JS = LOCATE_JS + '''
+var ratio = window.devicePixelRatio || 1, regions = [];
+arguments[0].forEach(function (loc) {
+    (locate(loc[0], loc[1], true) || []).forEach(function (el) {
+        var r = el.getBoundingClientRect();
+        regions.push([r.left * ratio, r.top * ratio, r.right * ratio, r.bottom * ratio]);
+    });
+});
+return regions;
+'''
+
+
+def _dhash(gray):
+    '''差异哈希：缩小到9x8灰度图，相邻像素比较得到64位'''
+    small = np.asarray(Image.fromarray(gray).resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    return (small[:, 1:] > small[:, :-1]).flatten()
+
+
+def compare_images(job):
+    '''
+    在进程池中执行的对比任务，job为dict：
+    png、baseline、diff_path、regions、tolerance（单通道允许的差值）、max_ratio（允许不同的像素比例）、reject_bits
+    返回{"status": "passed"/"failed"/"created", "ratio", "message", "diff"}；感知哈希直接判定不同时ratio为None
+    '''
+    baseline, png = job['baseline'], job['png']
+    if not os.path.exists(baseline):
+        os.makedirs(os.path.dirname(baseline), exist_ok=True)
+        with open(baseline, 'wb') as f:
+            f.write(png)
+        return {'status': 'created', 'ratio': 0.0, 'message': '新建基线', 'diff': None}
+    with open(baseline, 'rb') as f:
+        expected_png = f.read()
+    # 内容完全一样时不用解码
+    if hashlib.sha1(expected_png).digest() == hashlib.sha1(png).digest():
+        return {'status': 'passed', 'ratio': 0.0, 'message': '', 'diff': None}
+    expected = np.asarray(Image.open(io.BytesIO(expected_png)).convert('RGB'))
+    actual = np.asarray(Image.open(io.BytesIO(png)).convert('RGB'))
+    if expected.shape != actual.shape:
+        return {'status': 'failed', 'ratio': 1.0, 'diff': None,
+                'message': '截图尺寸不同：基线%sx%s，当前%sx%s' % (expected.shape[1], expected.shape[0],
+                                                         actual.shape[1], actual.shape[0])}
+    mask = np.ones(expected.shape[:2], dtype=bool)
+    height, width = mask.shape
+    for left, top, right, bottom in job['regions']:
+        mask[max(int(top), 0):min(int(bottom + 1), height), max(int(left), 0):min(int(right + 1), width)] = False
+    expected = np.where(mask[..., None], expected, 0).astype(np.uint8)
+    actual = np.where(mask[..., None], actual, 0).astype(np.uint8)
+    # 感知哈希差得很多时直接判定不同，不再逐像素对比，当前截图代替差异图
+    distance = int(np.count_nonzero(_dhash(expected.mean(axis=2).astype(np.uint8)) !=
+                                    _dhash(actual.mean(axis=2).astype(np.uint8))))
+    if distance > job['reject_bits']:
+        os.makedirs(os.path.dirname(job['diff_path']), exist_ok=True)
+        with open(job['diff_path'], 'wb') as f:
+            f.write(png)
+        return {'status': 'failed', 'ratio': None, 'diff': job['diff_path'],
+                'message': '感知哈希差%s位，截图明显不同（未逐像素对比，链接为当前截图）' % distance}
+    changed = np.abs(expected.astype(np.int16) - actual.astype(np.int16)).max(axis=2) > job['tolerance']
+    ratio = float(changed.mean())
+    if ratio <= job['max_ratio']:
+        return {'status': 'passed', 'ratio': ratio, 'message': '', 'diff': None}
+    # 差异图：基线变暗，不同的像素标红
+    diff = (expected * 0.3).astype(np.uint8)
+    diff[changed] = (255, 0, 0)
+    os.makedirs(os.path.dirname(job['diff_path']), exist_ok=True)
+    Image.fromarray(diff).save(job['diff_path'])
+    return {'status': 'failed', 'ratio': ratio, 'message': '%.2f%%的像素不同' % (ratio * 100),
+            'diff': job['diff_path']}
+
+
+def _safe_name(name):
+    return re.sub(r'[^\w.-]+', '_', name).strip('_')
+
+
+class VisualChecker:
+    '''一个用例的视觉对比：check()只截图并提交到进程池，用例结束后统一等待结果'''
+    def __init__(self, plugin, nodeid):
+        self.plugin = plugin
+        self.nodeid = nodeid
+        self.pending = []
+        self.results = []
+
+    def check(self, handle, step, ignore=()):
+        '''
+        截图和基线对比，不等待对比结果
+        handle： Base实例
+        step： 步骤名，同一个用例的每一步分别保存基线
+        ignore： 忽略区域的locator列表，如时间、广告等每次都不同的元素
+        '''
+        driver = handle.driver
+        regions = driver.execute_script(REGIONS_JS, [list(locator) for locator in ignore]) if ignore else []
+        png = driver.get_screenshot_as_png()
+        self.pending.append((step, self.plugin.submit(self.nodeid, step, png, regions)))
+        handle.logger.info("视觉对比：%s" % step)
+
+    def wait(self):
+        for step, future in self.pending:
+            result = future.result()
+            result['step'] = step
+            self.results.append(result)
+        self.pending = []
+        return self.results
+
+
+class VisualRegression:
+    '''
+    视觉回归插件：每个用例每个步骤保存一张基线截图，之后的截图和基线逐像素对比（numpy向量化），对比在进程池中执行
+    baseline_dir： 基线文件夹，按用例、步骤保存
+    output_dir： 差异图文件夹；output_url为报告中引用差异图的相对路径
+    update： 为True时用当前截图覆盖基线
+    tolerance： 单个通道允许的差值，抗锯齿等细微差别不算不同
+    max_ratio： 允许不同的像素比例
+    reject_bits： 感知哈希相差超过这个位数时直接判定不同，不逐像素对比；没有超过时只按max_ratio判断
+    '''
+    def __init__(self, baseline_dir, output_dir, output_url='visual', update=False, max_workers=None,
+                 tolerance=16, max_ratio=0.001, reject_bits=20):
+        if np is None:
+            raise Exception('视觉对比需要安装numpy和Pillow：pip install numpy Pillow')
+        self.baseline_dir = baseline_dir
+        self.output_dir = output_dir
+        self.output_url = output_url.replace(os.sep, '/')
+        self.update = update
+        self.tolerance = tolerance
+        self.max_ratio = max_ratio
+        self.reject_bits = reject_bits
+        self.max_workers = max_workers
+        self._executor = None
+
+    def submit(self, nodeid, step, png, regions):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        name = _safe_name(nodeid)
+        baseline = os.path.join(self.baseline_dir, name, '%s.png' % _safe_name(step))
+        if self.update and os.path.exists(baseline):
+            os.remove(baseline)
+        return self._executor.submit(compare_images, {
+            'png': png, 'baseline': baseline, 'regions': regions,
+            'diff_path': os.path.join(self.output_dir, '%s__%s.png' % (name, _safe_name(step))),
+            'tolerance': self.tolerance, 'max_ratio': self.max_ratio, 'reject_bits': self.reject_bits,
+        })
+
+    def checker(self, item):
+        item._visual_checker = VisualChecker(self, item.nodeid)
+        return item._visual_checker
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_runtest_call(self, item):
+        '''用例函数执行完后等待对比结果，有不同时用例失败'''
+        __tracebackhide__ = True
+        checker = getattr(item, '_visual_checker', None)
+        if checker is None:
+            return
+        failed = [r for r in checker.wait() if r['status'] == 'failed']
+        if failed:
+            raise AssertionError('视觉对比不通过：\n' + '\n'.join(
+                '%s：%s' % (r['step'], r['message']) for r in failed))
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        report = outcome.get_result()
+        checker = getattr(item, '_visual_checker', None)
+        if report.when != 'call' or checker is None:
+            return
+        # 用例自身报错时没有等待过对比结果
+        results = checker.wait()
+        report.visual = [dict((k, r[k]) for k in ('step', 'status', 'ratio', 'message')) for r in results]
+        pytest_html = item.config.pluginmanager.getplugin('html')
+        links = ['<a href="%s/%s" target="_blank">%s：%s</a>' % (
+            self.output_url, os.path.basename(r['diff']), r['step'], r['message'])
+            for r in results if r['diff']]
+        if pytest_html and links:
+            extra = getattr(report, 'extra', [])
+            extra.append(pytest_html.extras.html('<div>视觉差异：%s</div>' % ' '.join(links)))
+            report.extra = extra
+
+    def pytest_unconfigure(self, config):
+        if self._executor:
+            self._executor.shutdown()
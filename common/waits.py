@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/12 15:30'
+import time
+import weakref
+
+from selenium.webdriver.support.wait import WebDriverWait
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException, \
+    WebDriverException
+
+# 等待引擎，支持三种模式：
+#     poll：      selenium的WebDriverWait，固定间隔轮询（默认）
+#     backoff：   自适应退避轮询，从很短的间隔开始，逐步增大到interval
+#     observer：  页面内MutationObserver监听DOM变化，条件成立立即返回；没有js条件或者脚本被中断时，退回backoff
+
+WAIT_MODES = ('poll', 'backoff', 'observer')
+
+# 页面内定位元素的js函数：all为true时返回元素数组（没有则返回null），否则返回第一个元素或null
+LOCATE_JS = '''
+function locate(by, value, all) {
+    var doc = document, found = [];
+    switch (by) {
+        case "id": var el = doc.getElementById(value); found = el ? [el] : []; break;
+        case "css selector": found = doc.querySelectorAll(value); break;
+        case "xpath":
+            var snapshot = doc.evaluate(value, doc, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            for (var j = 0; j < snapshot.snapshotLength; j++) found.push(snapshot.snapshotItem(j));
+            break;
+        case "name": found = doc.getElementsByName(value); break;
+        case "class name": found = doc.getElementsByClassName(value); break;
+        case "tag name": found = doc.getElementsByTagName(value); break;
+        case "link text":
+        case "partial link text":
+            var links = doc.getElementsByTagName("a");
+            for (var i = 0; i < links.length; i++) {
+                var text = links[i].textContent.trim();
+                if (by === "link text" ? text === value : text.indexOf(value) !== -1) found.push(links[i]);
+            }
+            break;
+    }
+    found = Array.prototype.slice.call(found);
+    if (all) return found.length ? found : null;
+    return found[0] || null;
+}
+'''
+
+# 常用条件对应的页面内js判断函数，参数args为python传入的列表
+PRESENCE_JS = 'function (args) { return locate(args[0], args[1], false); }'
+ALL_PRESENCE_JS = 'function (args) { return locate(args[0], args[1], true); }'
+TITLE_IS_JS = 'function (args) { return document.title === args[0]; }'
+TITLE_CONTAINS_JS = 'function (args) { return document.title.indexOf(args[0]) !== -1; }'
+TEXT_IN_ELEMENT_JS = '''function (args) {
+    var el = locate(args[0], args[1], false);
+    return !!el && (el.innerText || el.textContent || "").indexOf(args[2]) !== -1;
+}'''
+VALUE_IN_ELEMENT_JS = '''function (args) {
+    var el = locate(args[0], args[1], false);
+    return !!el && el.value !== undefined && el.value !== null && String(el.value).indexOf(args[2]) !== -1;
+}'''
+ABSENT_JS = 'function (args) { return !locate(args[0], args[1], false); }'
+INVISIBLE_JS = '''function (args) {
+    return (locate(args[0], args[1], true) || []).every(function (el) {
+        return !el.getClientRects().length || window.getComputedStyle(el).visibility === "hidden";
+    });
+}'''
+
+# MutationObserver等待脚本：每次DOM变化或者input事件时重新判断，条件成立立即回调，超时回调null
+OBSERVER_JS = '''
+var args = arguments[0], timeout = arguments[1], done = arguments[arguments.length - 1];
+var finished = false, observer = null, timer = null;
+function finish(result) {
+    if (finished) return;
+    finished = true;
+    if (observer) observer.disconnect();
+    document.removeEventListener("input", check, true);
+    clearTimeout(timer);
+    done(result);
+}
+function check() {
+    var result = null;
+    try { result = predicate(args); } catch (e) {}
+    if (result) finish(result);
+}
+check();
+if (!finished) {
+    observer = new MutationObserver(check);
+    observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+    document.addEventListener("input", check, true);
+    timer = setTimeout(function () { finish(null); }, timeout * 1000);
+}
+'''
+
+# 页面空闲检测的埋点：统计进行中的fetch/XHR请求数，记录最后一次DOM变化或请求开始结束的时间；重复执行不会重复埋点
+IDLE_INSTRUMENT_JS = '''
+(function () {
+    if (window.__pageIdle) return;
+    var state = window.__pageIdle = {inflight: 0, lastChange: Date.now()};
+    function touch() { state.lastChange = Date.now(); }
+    function done() { state.inflight = Math.max(state.inflight - 1, 0); touch(); }
+    if (window.fetch) {
+        var fetch = window.fetch;
+        window.fetch = function () {
+            state.inflight++; touch();
+            try {
+                return fetch.apply(this, arguments).then(function (r) { done(); return r; },
+                                                         function (e) { done(); throw e; });
+            } catch (e) { done(); throw e; }
+        };
+    }
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        state.inflight++; touch();
+        this.addEventListener("loadend", done);
+        try { return send.apply(this, arguments); } catch (e) { done(); throw e; }
+    };
+    new MutationObserver(touch).observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+})();
+'''
+
+# 等待页面空闲：readyState为complete、没有进行中的请求、DOM连续quiet毫秒没有变化，回调耗时（毫秒），超时回调null
+# 页面还没有埋点时（如点击跳转后的新页面）先埋点，之前已经发出的请求统计不到，只能靠readyState和DOM静默判断
+PAGE_IDLE_JS = IDLE_INSTRUMENT_JS + '''
+var quiet = arguments[0], timeout = arguments[1], done = arguments[arguments.length - 1], start = Date.now();
+function pageIdle() {
+    var state = window.__pageIdle, now = Date.now();
+    if (document.readyState === "complete" && state.inflight === 0 && now - state.lastChange >= quiet) return done(now - start);
+    if (now - start >= timeout) return done(null);
+    setTimeout(pageIdle, 50);
+}
+pageIdle();
+'''
+
+# 已设置过的脚本超时时间，避免每次等待都多发一次命令
+_script_timeouts = weakref.WeakKeyDictionary()
+_implicit_waits = weakref.WeakKeyDictionary()  # 已经把隐式等待设为0的driver
+
+
+def backoff_until(driver, condition, timeout, interval=0.5, first_interval=0.05, factor=1.5):
+    '''自适应退避轮询：间隔从first_interval开始按factor增长，最大为interval；超时抛TimeoutException'''
+    deadline = time.time() + timeout
+    delay = first_interval
+    while True:
+        try:
+            value = condition(driver)
+            if value:
+                return value
+        except NoSuchElementException:
+            pass
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise TimeoutException('等待超时：%s秒' % timeout)
+        time.sleep(min(delay, remaining))
+        delay = min(delay * factor, interval)
+
+
+def probe(driver, locator):
+    '''不等待的定位：隐式等待设为0后find_elements，立即返回当前匹配的元素，没有则返回[]'''
+    if driver not in _implicit_waits:
+        driver.implicitly_wait(0)
+        _implicit_waits[driver] = 0
+    return driver.find_elements(*locator)
+
+
+def absence_of(locator):
+    '''条件：页面上没有匹配locator的元素'''
+    return lambda driver: not probe(driver, locator)
+
+
+def invisibility_of(locator):
+    '''条件：匹配locator的元素都不可见（或者不存在）；判断时元素被移除也算不可见'''
+    def condition(driver):
+        for element in probe(driver, locator):
+            try:
+                if element.is_displayed():
+                    return False
+            except StaleElementReferenceException:
+                pass
+        return True
+    return condition
+
+
+def _ensure_script_timeout(driver, timeout):
+    script_timeout = timeout + 1
+    if _script_timeouts.get(driver, 0) < script_timeout:
+        driver.set_script_timeout(script_timeout)
+        _script_timeouts[driver] = script_timeout
+
+
+def observe_until(driver, predicate, args, timeout):
+    '''页面内MutationObserver等待，返回js判断函数的结果，超时返回None'''
+    _ensure_script_timeout(driver, timeout)
+    script = LOCATE_JS + 'var predicate = ' + predicate + ';' + OBSERVER_JS
+    return driver.execute_async_script(script, list(args), timeout)
+
+
+def page_idle(driver, timeout, quiet=0.5):
+    '''等待页面空闲，返回等待的秒数，超时返回None；等待中页面跳转时在新页面上继续等'''
+    start = time.time()
+    while True:
+        remaining = start + timeout - time.time()
+        if remaining <= 0:
+            return None
+        _ensure_script_timeout(driver, remaining)
+        try:
+            result = driver.execute_async_script(PAGE_IDLE_JS, int(quiet * 1000), int(remaining * 1000))
+        except WebDriverException:
+            # 页面跳转中断了脚本
+            time.sleep(0.05)
+            continue
+        return None if result is None else time.time() - start
+
+
+def wait_until(driver, condition, timeout, interval=0.5, mode='poll', predicate=None, args=()):
+    '''
+    按mode等待condition成立，返回condition的结果，超时抛TimeoutException
+    condition： selenium的expected_conditions条件
+    predicate、args： observer模式使用的页面内js判断函数及其参数，没有时退回backoff
+    '''
+    if mode == 'poll':
+        return WebDriverWait(driver, timeout, interval).until(condition)
+    if mode == 'observer' and predicate:
+        start = time.time()
+        try:
+            result = observe_until(driver, predicate, args, timeout)
+        except WebDriverException:
+            # 页面跳转等原因中断了脚本，剩余时间退回轮询
+            result = None
+        if result:
+            return result
+        if time.time() - start >= timeout:
+            raise TimeoutException('等待超时：%s秒' % timeout)
+        return backoff_until(driver, condition, max(timeout - (time.time() - start), 0), interval)
+    return backoff_until(driver, condition, timeout, interval)
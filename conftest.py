@@ -4,30 +4,264 @@ __date__ = '2019/2/10 18:03'
 import os
 import time
 
-from selenium import webdriver
 import pytest
 from py.xml import html
 
 from common.parse_yaml import get_yaml_info
 from common.logger import Logger
-from common.base_selenium import Base
+from common.driver_pool import DriverPool
+from common.screenshots import ScreenshotWriter
+from common.stream_report import StreamReport
+from common.session_cache import SessionCache
+from common.request_filter import RequestFilter, FilteringProxy, apply_cdp
+from common.local_site import LocalSite
+from common.scheduler import TimingStore, Scheduler, parse_shard
+from common.locator_impact import LocatorImpact, changed_locators
+from common.profiler import Profiler
+from common.launcher import BrowserLauncher, PROFILES
+from common.grid import GridDispatcher, parse_hosts
+from common.visual import VisualRegression
+from common.trace import TraceStore, TraceRecorder
+from common.dataset import DatasetPlugin, parse_slice
 
 cwd = os.getcwd()  # 当前目录路径
 
 
-_driver = None
-
 def pytest_addoption(parser):
-    '''添加命令行参数--browser、--host'''
+    '''添加命令行参数--browser、--host等'''
     parser.addoption(
         "--browser", action="store", default="firefox", help="browser option: firefox or chrome"
              )
-    # 添加host参数，设置默认测试环境地址
+    # Remote WebDriver节点，多个用逗号分隔，*后为节点容量；不传则在本机启动浏览器
+    parser.addoption(
+        "--host", action="store", default="",
+        help="remote webdriver nodes, e.g. 192.168.1.10:4444/wd/hub*4,192.168.1.11:4444/wd/hub*2"
+    )
+    parser.addoption(
+        "--grid-retries", action="store", default=1, type=int, help="reruns of a test failed by a broken node: 1"
+    )
+    # 浏览器启动配置：headed有界面；headless无头并关闭gpu、扩展、首次运行页面；ci在headless基础上适配容器
+    parser.addoption(
+        "--profile", action="store", default="headed", choices=sorted(PROFILES),
+        help="browser launch profile: headed, headless or ci"
+    )
+    # 浏览器池大小，为每个进程的浏览器数量；pytest在一个进程内顺序执行用例，并行用pytest-xdist的-n，
+    # 每个worker进程一个池，大于1只在同一进程内有用例并发（如多线程）时才有用
+    parser.addoption(
+        "--pool-size", action="store", default=1, type=int,
+        help="browser pool size per process: 1, run in parallel with pytest-xdist -n"
+    )
+    # 用例之间的隔离：none共用浏览器不做处理；recycle归还时重置浏览器（关闭多余窗口、清空cookie和存储），
+    # 每--recycle-after个用例或者重置失败时重启；restart每个用例一个新浏览器
+    parser.addoption(
+        "--isolation", action="store", default="none", choices=("none", "recycle", "restart"),
+        help="browser isolation between tests: none, recycle or restart"
+    )
+    parser.addoption(
+        "--recycle-after", action="store", default=50, type=int, help="restart a browser after N tests in recycle mode"
+    )
+    # 开启元素缓存，页面不变时复用已定位到的元素
+    parser.addoption(
+        "--cache-elements", action="store_true", default=False, help="cache located elements per page"
+    )
+    # 等待模式：poll固定间隔轮询，backoff自适应退避轮询，observer页面内监听DOM变化
+    parser.addoption(
+        "--wait-mode", action="store", default="poll", choices=("poll", "backoff", "observer"),
+        help="wait mode option: poll, backoff or observer"
+    )
+    # 失败截图的压缩格式，截图保存在报告同级的screenshots文件夹
+    parser.addoption(
+        "--screenshot-format", action="store", default="jpeg", choices=("jpeg", "webp", "png"),
+        help="failure screenshot format: jpeg, webp or png"
+    )
+    # 流式报告文件夹，每个用例结束立即写入，不传则不生成；不能和--self-contained-html同时使用
+    parser.addoption(
+        "--stream-report", action="store", default=None,
+        help="streaming report dir, e.g. ./reports/stream; cannot be combined with --self-contained-html"
+    )
+    # 请求过滤：proxy通过本地过滤代理（所有浏览器，https请求只能按域名过滤），cdp通过chrome的Network.setBlockedURLs
+    parser.addoption(
+        "--request-filter", action="store", default="none", choices=("none", "proxy", "cdp"),
+        help="request filter mode: none, proxy or cdp (blocked counts are only reported in proxy mode)"
+    )
+    parser.addoption(
+        "--block-types", action="store", default="",
+        help="blocked resource types, e.g. image,font,media (proxy mode: http requests only)"
+    )
+    parser.addoption(
+        "--block-domains", action="store", default="", help="blocked domains, e.g. hm.baidu.com"
+    )
+    parser.addoption(
+        "--allow-domains", action="store", default="", help="only allow these domains (proxy mode)"
+    )
+    # 按历史耗时调度：--shard=i/N只跑第i个分片（i从1开始），--schedule按耗时从大到小排列用例
+    parser.addoption(
+        "--shard", action="store", default=None, help="run shard i of N balanced by timings, e.g. 1/4"
+    )
+    parser.addoption(
+        "--schedule", action="store_true", default=False, help="run longest tests first by timings"
+    )
+    parser.addoption(
+        "--time-budget", action="store", default=None, type=float,
+        help="time budget per shard in seconds, only reports the shard count needed when exceeded"
+    )
+    parser.addoption(
+        "--timings-file", action="store", default=os.path.join(cwd, ".test_timings.json"),
+        help="test timings store"
+    )
+    # 只运行改动过的locator影响到的用例，对比的基线默认为HEAD，如--changed-locators=origin/master
+    parser.addoption(
+        "--changed-locators", action="store", nargs="?", const="HEAD", default=None,
+        help="only run tests using locators changed since a git ref (default HEAD)"
+    )
+    # 记录每个用例运行时实际使用的locator，写入.locator_index.json，补充--changed-locators的静态扫描
+    parser.addoption(
+        "--locator-index", action="store_true", default=False, help="record the locators used by each test"
+    )
+    # 记录每个Base调用、WebDriver命令的耗时，html报告中展示最慢的步骤，汇总写入json文件；不传则不记录
+    parser.addoption(
+        "--step-profile", action="store", default=None, help="step timings profile file, e.g. ./reports/profile.json"
+    )
+    # 按用例存储的轨迹（步骤、locator、耗时、日志），python -m common.trace查看；不传则不记录
+    parser.addoption(
+        "--trace-dir", action="store", default=None, help="per-test trace store directory, e.g. ./logs/trace"
+    )
+    parser.addoption(
+        "--trace-max-bytes", action="store", default=64 * 1024 * 1024, type=int,
+        help="rotate trace segments larger than this, old segments are compressed"
+    )
+    # 数据驱动用例（@pytest.mark.dataset）只运行部分数据，如0:100、::10、random:50
+    parser.addoption(
+        "--data-slice", action="store", default=None, help="run part of each dataset: start:stop[:step] or random:N[:seed]"
+    )
+    parser.addoption(
+        "--data-cache", action="store", default=os.path.join(cwd, ".dataset_cache"), help="parsed dataset cache directory"
+    )
+    # 视觉回归：基线按用例、步骤保存，差异图保存在报告同级的visual文件夹
+    parser.addoption(
+        "--visual-baselines", action="store", default=os.path.join(cwd, "visual_baselines"),
+        help="visual regression baseline directory"
+    )
+    parser.addoption(
+        "--visual-update", action="store_true", default=False, help="overwrite visual baselines with new screenshots"
+    )
+    parser.addoption(
+        "--visual-threshold", action="store", default=0.001, type=float,
+        help="allowed ratio of different pixels, 0.001 means 0.1%%"
+    )
+    # 基准测试（benchmarks文件夹）：fake为进程内假WebDriver，统计命令数；chrome为无头chrome访问本地站点
+    parser.addoption(
+        "--bench-backend", action="store", default="fake", choices=("fake", "chrome"),
+        help="benchmark backend: fake or chrome"
+    )
+    parser.addoption(
+        "--bench-latency", action="store", default=0.0, type=float,
+        help="latency per command of the fake webdriver in seconds"
+    )
+    parser.addoption(
+        "--bench-tolerance", action="store", default=0.5, type=float,
+        help="allowed latency regression relative to the other benchmarks, 0.5 means +50%%"
+    )
     parser.addoption(
-        "--host", action="store", default="127.0.0.1:4723", help="test host->127.0.0.1:4723"
+        "--bench-save", action="store_true", default=False, help="save benchmark results as the new baseline"
     )
 
 
+def pytest_configure(config):
+    '''失败截图保存到html报告同级的screenshots文件夹，报告里用相对路径引用'''
+    html_path = config.getoption("htmlpath", None)
+    report_dir = os.path.dirname(os.path.abspath(html_path)) if html_path else os.path.join(cwd, 'reports')
+    screenshot_dir = os.path.join(report_dir, 'screenshots')
+    config._report_dir = report_dir
+    config._logger = _session_logger(config)
+    config._screenshot_writer = ScreenshotWriter(
+        dir_path=screenshot_dir,
+        image_format=config.getoption("--screenshot-format"),
+        logger=config._logger,
+    )
+    config.addinivalue_line(
+        "markers", "block_resources(types=(), domains=(), allow=()): 用例级别的请求过滤规则，覆盖命令行参数")
+    config.addinivalue_line(
+        "markers", "dataset(path, id_field=None): 数据驱动，数据文件（csv/jsonl/多文档yaml）的每条数据生成一个用例，用data参数取数据")
+    data_slice = config.getoption("--data-slice")
+    try:
+        selection = parse_slice(data_slice) if data_slice else None
+    except ValueError as e:
+        raise pytest.UsageError(str(e))
+    config.pluginmanager.register(DatasetPlugin(config.getoption("--data-cache"), selection), 'dataset')
+    shard = config.getoption("--shard")
+    try:
+        shard = parse_shard(shard) if shard else None
+    except ValueError as e:
+        raise pytest.UsageError(str(e))
+    config.pluginmanager.register(Scheduler(
+        TimingStore(config.getoption("--timings-file")),
+        shard=shard,
+        reorder=config.getoption("--schedule"),
+        record=not hasattr(config, 'workerinput'),
+        time_budget=config.getoption("--time-budget"),
+    ), 'scheduler')
+    baseline = config.getoption("--changed-locators")
+    # 只在需要时记录运行时索引：--locator-index更新索引，--changed-locators按索引筛选用例
+    if baseline or config.getoption("--locator-index"):
+        config.pluginmanager.register(LocatorImpact(
+            root_path=cwd,
+            cases_path=os.path.join(cwd, 'cases'),
+            index_path=os.path.join(cwd, '.locator_index.json'),
+            changed=changed_locators(cwd, os.path.join(cwd, 'pages', 'locators'), baseline) if baseline else None,
+            worker_id=getattr(config, 'workerinput', {}).get('workerid'),
+        ), 'locator_impact')
+    hosts = config.getoption("--host")
+    if hosts:
+        try:
+            nodes = parse_hosts(hosts)
+        except ValueError as e:
+            raise pytest.UsageError(str(e))
+        workerinput = getattr(config, 'workerinput', {})
+        config.pluginmanager.register(GridDispatcher(
+            nodes,
+            retries=config.getoption("--grid-retries"),
+            worker_index=int(workerinput.get('workerid', 'gw0')[2:]),
+            worker_count=workerinput.get('workercount', 1),
+        ), 'grid')
+    else:
+        # 在pytest_configure注册，xdist的主进程也有这个插件，汇总各worker的启动耗时展示在报告中
+        browser = config.getoption("--browser")
+        config.pluginmanager.register(
+            BrowserLauncher(browser, _driver_path(browser), profile=config.getoption("--profile")), 'browser_launcher')
+    profile_path = config.getoption("--step-profile")
+    if profile_path:
+        profiler = Profiler(os.path.abspath(profile_path), write=not hasattr(config, 'workerinput'))
+        profiler.install()
+        config.pluginmanager.register(profiler, 'profiler')
+    trace_dir = config.getoption("--trace-dir")
+    # xdist的主进程不运行用例，只在worker进程（或者没有用xdist时）记录
+    if trace_dir and (hasattr(config, 'workerinput') or getattr(config.option, 'dist', 'no') == 'no'):
+        # xdist的每个worker写自己的段文件，共用一个索引
+        worker_id = getattr(config, 'workerinput', {}).get('workerid')
+        store = TraceStore(os.path.abspath(trace_dir), prefix='trace-%s' % worker_id if worker_id else 'trace',
+                           max_bytes=config.getoption("--trace-max-bytes"))
+        store.compress_leftovers()
+        recorder = TraceRecorder(store)
+        recorder.install()
+        config.pluginmanager.register(recorder, 'trace')
+    stream_dir = config.getoption("--stream-report")
+    if stream_dir and config.getoption("self_contained_html", False):
+        # 流式报告用于大批量用例，单文件的html会把所有结果都放进内存和一个文件里；两个报告引用的失败截图也都是单独的文件
+        raise pytest.UsageError("--stream-report不能和--self-contained-html同时使用，请去掉--self-contained-html")
+    # xdist的worker进程不生成，由主进程统一写
+    if stream_dir and not hasattr(config, 'workerinput'):
+        stream_dir = os.path.abspath(stream_dir)
+        config.pluginmanager.register(
+            StreamReport(stream_dir, screenshot_url=os.path.relpath(screenshot_dir, stream_dir)), 'stream_report')
+
+
+def pytest_unconfigure(config):
+    writer = getattr(config, '_screenshot_writer', None)
+    if writer:
+        writer.close()
+
+
 @pytest.fixture(scope='session')
 def host(request):
     '''全局host参数'''
@@ -40,39 +274,158 @@ def browser(request):
     return request.config.getoption("--browser")
 
 
-@pytest.fixture(scope='session')
-def logger(request):
-    '''全局logger'''
+def _session_logger(config):
     date = time.strftime("%Y-%m-%d_", time.localtime())
-    browser = request.config.getoption("--browser")
+    browser = config.getoption("--browser")
     dir_path = os.path.join(cwd, 'logs')
-    _logger = Logger(file_name=date+browser+'.log', dir_path=dir_path, console=False)
-    return _logger
+    # 队列模式：用例线程打日志只是入队，后台线程批量写文件
+    return Logger(file_name=date+browser+'.log', dir_path=dir_path, console=False, use_queue=True)
+
+
+@pytest.fixture(scope='session')
+def logger(request):
+    '''全局logger，pytest_configure时创建，截图等后台线程也用这个logger'''
+    return request.config._logger
+
+
+def _driver_path(browser):
+    return os.path.join(cwd, "driver", "geckodriver" if browser.lower() == "firefox" else "chromedriver")
+
+
+def _split_option(config, name):
+    return [value.strip() for value in config.getoption(name).split(',') if value.strip()]
 
 
 @pytest.fixture(scope='session')
-def handle(request, logger):
-    '''定义全局driver参数'''
-    global _driver
+def request_proxy(request, logger):
+    '''--request-filter=proxy时启动本地过滤代理，否则为None'''
+    if request.config.getoption("--request-filter") != "proxy":
+        return None
+    proxy = FilteringProxy().start()
+    logger.info("启动请求过滤代理：%s" % proxy.address)
+    if _split_option(request.config, "--block-types"):
+        logger.warning("代理模式下https请求只能按域名过滤，--block-types只对http请求生效")
+    request.addfinalizer(proxy.stop)
+    return proxy
+
+
+@pytest.fixture(scope='session')
+def driver_pool(request, logger, request_proxy):
+    '''全局浏览器池'''
     browser = request.config.getoption("--browser")
-    if browser.lower() == "firefox":
-        _driver = webdriver.Firefox(executable_path=os.path.join(cwd, "driver", "geckodriver"))
-    elif browser.lower() == "chrome":
-        _driver = webdriver.Chrome(executable_path=os.path.join(cwd, "driver", "chromedriver"))
+    size = request.config.getoption("--pool-size")
+    proxy = request_proxy.address if request_proxy else None
+    grid = request.config.pluginmanager.get_plugin('grid')
+    if grid:
+        # 传了--host时分发到Remote节点，节点故障的浏览器租用时丢弃重建
+        grid.logger = logger
+        launcher = BrowserLauncher(browser, _driver_path(browser), profile=request.config.getoption("--profile"),
+                                   proxy=proxy, logger=logger)
+        capabilities = launcher.capabilities()[0]
+        driver_factory, validate = lambda: grid.new_driver(capabilities), lambda handle: grid.is_alive(handle.driver)
     else:
-        _driver = webdriver.Chrome(executable_path=os.path.join(cwd, "driver", "chromedriver"))
-    handle = Base(driver=_driver, logger=logger)
-    logger.info("正在启动浏览器：%s" % browser)
-
+        # driver服务只启动一次，池中的浏览器都通过它新建会话
+        launcher = request.config.pluginmanager.get_plugin('browser_launcher')
+        launcher.proxy, launcher.logger = proxy, logger
+        driver_factory, validate = launcher.new_driver, None
+    isolation = request.config.getoption("--isolation")
+    recycle_after = {'recycle': request.config.getoption("--recycle-after"), 'restart': 1}.get(isolation)
+    pool = DriverPool(driver_factory=driver_factory, logger=logger, size=size, validate=validate,
+                      reset=isolation == 'recycle', recycle_after=recycle_after,
+                      cache_elements=request.config.getoption("--cache-elements"),
+                      wait_mode=request.config.getoption("--wait-mode"))
+    logger.info("正在启动浏览器池：%s，大小：%s" % (browser, size))
 
     def fn():
         logger.info("当全部用例执行完：teardown quit driver！")
-        _driver.quit()
+        pool.close()
+        launcher.stop()
+
+    request.addfinalizer(fn)
+    return pool
+
+
+def _get_request_filter(request):
+    '''命令行的请求过滤规则，用例有block_resources标记时以标记为准'''
+    config = request.config
+    kwargs = {
+        'block_types': _split_option(config, "--block-types"),
+        'block_domains': _split_option(config, "--block-domains"),
+        'allow_domains': _split_option(config, "--allow-domains"),
+    }
+    marker = request.node.get_closest_marker('block_resources')
+    if marker:
+        for key, name in (('block_types', 'types'), ('block_domains', 'domains'), ('allow_domains', 'allow')):
+            if name in marker.kwargs:
+                kwargs[key] = marker.kwargs[name]
+    return RequestFilter(**kwargs)
+
+
+@pytest.fixture(scope='function')
+def handle(request, driver_pool, request_proxy, logger):
+    '''每个用例从浏览器池租用一个Base实例，用例结束后归还'''
+    handle = driver_pool.lease()
+    locator_impact = request.config.pluginmanager.get_plugin('locator_impact')
+    if locator_impact:
+        handle.locator_listener = locator_impact.on_locator
+    mode = request.config.getoption("--request-filter")
+    if mode == "proxy":
+        request_proxy.request_filter = request.node._request_filter = _get_request_filter(request)
+    elif mode == "cdp":
+        # 每个用例都重新设置，空规则即取消上一个用例的拦截
+        if not apply_cdp(handle.driver, _get_request_filter(request), logger):
+            logger.warning("当前浏览器不支持CDP，请求过滤未生效")
+
+    def fn():
+        driver_pool.release(handle)
 
     request.addfinalizer(fn)
     return handle
 
 
+@pytest.fixture(scope='function')
+def visual(request):
+    '''
+    视觉回归，用法：
+        visual.check(handle, '首页', ignore=[BaiduHomePage.热搜])
+    截图在进程池中和基线对比，用例结束后有不同则失败，报告中链接差异图
+    '''
+    config = request.config
+    plugin = config.pluginmanager.get_plugin('visual')
+    if plugin is None:
+        plugin = VisualRegression(
+            baseline_dir=os.path.abspath(config.getoption("--visual-baselines")),
+            output_dir=os.path.join(config._report_dir, 'visual'),
+            update=config.getoption("--visual-update"),
+            max_ratio=config.getoption("--visual-threshold"),
+        )
+        config.pluginmanager.register(plugin, 'visual')
+    return plugin.checker(request.node)
+
+
+@pytest.fixture(scope='function')
+def data(request):
+    '''@pytest.mark.dataset用例的一条数据，用例执行时才从缓存读取'''
+    return request.config.pluginmanager.get_plugin('dataset').record(request.param)
+
+
+@pytest.fixture(scope='session')
+def session_cache(logger):
+    '''
+    全局登录态缓存，用法：
+        session_cache.login(handle, 'admin', flow=login_admin, check=is_logged_in)
+    '''
+    return SessionCache(dir_path=os.path.join(cwd, '.session_cache'), logger=logger)
+
+
+@pytest.fixture(scope='session')
+def local_site(request):
+    '''本地静态测试站点（cases/site），离线跑用例用，返回站点url'''
+    site = LocalSite().start()
+    request.addfinalizer(site.stop)
+    return site.url
+
+
 @pytest.fixture(scope="module", autouse=True)
 def module_log(request, logger):
     logger.info('开始执行module: %s' % request.module.__name__)
@@ -106,23 +459,38 @@ def pytest_runtest_makereport(item):
     if report.when == 'call' or report.when == "setup":
         xfail = hasattr(report, 'wasxfail')
         if (report.skipped and xfail) or (report.failed and not xfail):
-            file_name = report.nodeid.replace("::", "_")+".png"
-            screen_img = _capture_screenshot()
-            if file_name:
-                html = '<div><img src="data:image/png;base64,%s" alt="screenshot" style="width:600px;height:300px;" ' \
-                       'onclick="window.open(this.src)" align="right"/></div>' % screen_img
+            screen_img = _capture_screenshot(item)
+            if screen_img:
+                full_name, thumb_name = item.config._screenshot_writer.submit(screen_img)
+                report.screenshot = [full_name, thumb_name]
+                html = '<div><a href="screenshots/%s" target="_blank"><img src="screenshots/%s" alt="screenshot" ' \
+                       'style="max-width:600px;max-height:300px;" align="right"/></a></div>' % (full_name, thumb_name)
                 extra.append(pytest_html.extras.html(html))
         report.extra = extra
         report.description = str(item.function.__doc__)
+        request_filter = getattr(item, '_request_filter', None)
+        if request_filter:
+            # 只有代理模式有统计，CDP模式拦截在浏览器内完成，没有统计
+            stats = request_filter.stats
+            report.blocked = '%s个请求%s' % (stats['blocked'], ''.join(
+                '，%s:%s' % item for item in sorted(stats['by_reason'].items())))
+        report.item_nodeid = report.nodeid  # 转码前的nodeid，按用例记录数据时使用
         report.nodeid = report.nodeid.encode("utf-8").decode("unicode_escape")
 
 
-def _capture_screenshot():
+def _capture_screenshot(item):
     '''
-    截图保存为base64
+    用例租用的浏览器截图，返回png的bytes，没有使用handle的用例返回None
     :return:
     '''
-    return _driver.get_screenshot_as_base64()
+    handle = (getattr(item, 'funcargs', None) or {}).get('handle')
+    if handle is None:
+        return None
+    try:
+        return handle.driver.get_screenshot_as_png()
+    except Exception:
+        # 浏览器或者节点已经不可用
+        return None
 
 
 @pytest.mark.optionalhook
@@ -130,12 +498,14 @@ def pytest_html_results_table_header(cells):
     cells.insert(1, html.th('Description'))
     cells.insert(2, html.th('Test_nodeid'))
     cells.pop(2)
+    cells.append(html.th('Blocked'))
 
 
 @pytest.mark.optionalhook
 def pytest_html_results_table_row(report, cells):
-    cells.insert(1, html.td(report.description))
+    cells.insert(1, html.td(getattr(report, 'description', '')))
     cells.insert(2, html.td(report.nodeid))
     cells.pop(2)
+    cells.append(html.td(getattr(report, 'blocked', '')))
 
 
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+
+
+
+class BaiduHomePage:
+    输入框 = ("id", "kw")
+    搜索按钮 = ("id", "su")
+
+
+
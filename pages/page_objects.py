@@ -1,10 +1,3 @@
 # -*- coding: utf-8 -*-
-
-
-
-class BaiduHomePage:
-    输入框 = ("id", "kw")
-    搜索按钮 = ("id", "su")
-
-
-
+# 自动生成，请勿手动修改：修改pages/locators下的yaml文件后运行pages/tools.py
+from pages.generated.baiduhomepage import *
@@ -2,7 +2,11 @@
 __author__ = 'dongwenda'
 __date__ = '2019/2/10 2:28'
 
+import hashlib
+import json
 import os
+import re
+import sys
 
 import yaml
 import jinja2
@@ -11,35 +15,167 @@ import jinja2
 current_path = os.path.dirname(os.path.realpath(__file__))
 # yaml文件夹路径
 yaml_path = os.path.join(current_path, 'locators')
+# 生成的页面对象模块文件夹，每个yaml文件对应一个模块
+generated_path = os.path.join(current_path, 'generated')
+# 记录每个yaml文件内容hash的清单
+manifest_path = os.path.join(generated_path, 'manifest.json')
 
-def parseyaml():
-    '''遍历读取所有yaml文件'''
-    pageElements = {}
+# 有libyaml时用C实现的loader，快很多
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+PAGE_OBJECTS_HEADER = '''# -*- coding: utf-8 -*-
+# 自动生成，请勿手动修改：修改pages/locators下的yaml文件后运行pages/tools.py
+'''
+
+
+def _file_hash(file_path):
+    with open(file_path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _module_name(yaml_file_path):
+    '''yaml文件相对locators的路径转换成模块名：a/BaiduHomePage.yaml -> a_baiduhomepage'''
+    rel_path = os.path.splitext(os.path.relpath(yaml_file_path, yaml_path))[0]
+    name = re.sub(r'\W', '_', rel_path.replace(os.sep, '_')).lower()
+    return name if not name[:1].isdigit() else '_' + name
+
+
+def _yaml_files():
+    '''遍历所有yaml文件，返回{模块名: 绝对路径}'''
+    files = {}
     for fpath, dirname, fnames in os.walk(yaml_path):
         for name in fnames:
             yaml_file_path = os.path.join(fpath, name)  # 绝对路径
             if yaml_file_path.endswith(".yaml"):    # 筛选.yaml文件
-                with open(yaml_file_path, 'r', encoding='utf-8') as f:
-                    page = yaml.load(f)
-                    pageElements.update(page)
+                files[_module_name(yaml_file_path)] = yaml_file_path
+    return files
+
+
+def _load_yaml(yaml_file_path):
+    with open(yaml_file_path, 'r', encoding='utf-8') as f:
+        return yaml.load(f, Loader=YamlLoader) or {}
+
+
+def parseyaml():
+    '''遍历读取所有yaml文件'''
+    pageElements = {}
+    for yaml_file_path in _yaml_files().values():
+        pageElements.update(_load_yaml(yaml_file_path))
     return pageElements
 
 
-def create_pages_py(pageElements):
+def _get_template():
     template_loader = jinja2.FileSystemLoader(searchpath=current_path)
     template_env = jinja2.Environment(loader=template_loader)
+    return template_env.get_template("template")
+
+
+def _write_if_changed(file_path, content):
+    '''内容不变时不写文件，避免pyc缓存失效'''
+    if os.path.exists(file_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                return False
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return True
+
+
+def create_pages_py(pageElements, file_path=os.path.join(current_path, "page_objects.py")):
+    '''把pageElements渲染成一个页面对象模块'''
     templateVars = {
         'pageElements': pageElements
     }
-    template = template_env.get_template("template")
-    with open(os.path.join(current_path, "page_objects.py"), 'w', encoding='utf-8') as f:
-        f.write(template.render(templateVars))
+    return _write_if_changed(file_path, _get_template().render(templateVars))
+
+
+def _load_manifest():
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _expected_manifest(files):
+    manifest = dict((name, _file_hash(path)) for name, path in files.items())
+    # 模板变化时全部重新生成
+    manifest['__template__'] = _file_hash(os.path.join(current_path, 'template'))
+    return manifest
+
+
+def _module_outdated(module_path, yaml_file_path):
+    '''生成的模块不存在，或者内容和重新渲染的不一致（被手动修改过）'''
+    if not os.path.exists(module_path):
+        return True
+    with open(module_path, 'r', encoding='utf-8') as f:
+        return f.read() != _get_template().render({'pageElements': _load_yaml(yaml_file_path)})
+
+
+def _page_objects_content(module_names):
+    lines = ['from pages.generated.%s import *\n' % name for name in sorted(module_names)]
+    return PAGE_OBJECTS_HEADER + ''.join(lines)
+
+
+def check_page_objects():
+    '''只检查不生成：返回需要重新生成的模块名列表，空列表表示生成的代码是最新的'''
+    files = _yaml_files()
+    old, new = _load_manifest(), _expected_manifest(files)
+    stale = sorted(name for name in set(old) | set(new) if name != '__template__' and old.get(name) != new.get(name))
+    if old.get('__template__') != new['__template__']:
+        stale = sorted(files)
+    else:
+        # 清单是最新的也要对比生成的模块，防止模块被删除或者手动修改
+        stale = sorted(stale + [name for name, yaml_file_path in files.items() if name not in stale and
+                                _module_outdated(os.path.join(generated_path, name + '.py'), yaml_file_path)])
+    page_objects_path = os.path.join(current_path, "page_objects.py")
+    if not os.path.exists(page_objects_path):
+        stale.append('page_objects')
+    else:
+        with open(page_objects_path, 'r', encoding='utf-8') as f:
+            if f.read() != _page_objects_content(files):
+                stale.append('page_objects')
+    return stale
 
 
 def yamlLocator_to_pageObject():
-    create_pages_py(parseyaml())
+    '''
+    增量生成页面对象：每个yaml文件生成pages/generated下的一个模块，只重新生成内容hash变化、模块缺失或被改动的文件
+    page_objects.py汇总导入所有模块，用例里依然from pages.page_objects import XxxPage
+    返回重新生成的模块名列表
+    '''
+    files = _yaml_files()
+    old, new = _load_manifest(), _expected_manifest(files)
+    template_changed = old.get('__template__') != new['__template__']
+    if not os.path.exists(generated_path):
+        os.makedirs(generated_path)
+    _write_if_changed(os.path.join(generated_path, '__init__.py'), '# -*- coding: utf-8 -*-\n')
+
+    changed = []
+    for name, yaml_file_path in sorted(files.items()):
+        module_path = os.path.join(generated_path, name + '.py')
+        if template_changed or old.get(name) != new[name] or _module_outdated(module_path, yaml_file_path):
+            create_pages_py(_load_yaml(yaml_file_path), module_path)
+            changed.append(name)
+    for name in set(old) - set(new):    # yaml文件已删除
+        module_path = os.path.join(generated_path, name + '.py')
+        if os.path.exists(module_path):
+            os.remove(module_path)
+        changed.append(name)
+
+    _write_if_changed(os.path.join(current_path, "page_objects.py"), _page_objects_content(files))
+    if changed or old != new:
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(new, f, indent=2, sort_keys=True)
+    return changed
+
 
 if __name__ == '__main__':
-    create_pages_py(parseyaml())
-    p = parseyaml()
-    print(p)
\ No newline at end of file
+    # python pages/tools.py --check：只检查生成的代码是否最新，不是最新时退出码为1，用于CI
+    if '--check' in sys.argv:
+        stale = check_page_objects()
+        if stale:
+            print('页面对象需要重新生成：%s' % ', '.join(stale))
+            sys.exit(1)
+        print('页面对象是最新的')
+    else:
+        print('重新生成：%s' % yamlLocator_to_pageObject())
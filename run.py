@@ -7,11 +7,16 @@ import time
 from pages.tools import yamlLocator_to_pageObject
 
 # ?collapsed=Passed,XFailed,Skipped
+# -n为并行的worker进程数（pytest-xdist），每个worker租用自己的浏览器
+# 排查问题时按需加上：--step-profile=./reports/profile.json（步骤耗时）、--trace-dir=./logs/trace（用例轨迹）、
+# --locator-index（更新locator索引，配合--changed-locators只跑受影响的用例）
 yamlLocator_to_pageObject()
 datetime = time.strftime("%Y_%m_%d_%H_%I_%S", time.localtime(time.time()))
 
 os.system('cd C:/autotest_selenium')
 os.system('pytest \
---host=127.0.0.1:4723 --browser=chrome \
---html=./reports/{}report.html --self-contained-html \
+--browser=chrome \
+-n 2 \
+--html=./reports/{0}report.html \
+--stream-report=./reports/{0}stream \
 -q ./cases/test_baidu.py'.format(datetime))
\ No newline at end of file
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/21 16:30'
+import os
+
+import pytest
+
+from common.dataset import Dataset, parse_slice, select
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('0:100', slice(0, 100)),
+    ('::50', slice(None, None, 50)),
+    ('-10:', slice(-10, None)),
+    ('random:5', ('random', 5, 0)),
+    ('random:5:7', ('random', 5, 7)),
+])
+def test_parse_slice(value, expected):
+    assert parse_slice(value) == expected
+
+
+@pytest.mark.parametrize('value', ['10', 'a:b', '1:2:3:4', 'random', 'random:x', 'random:1:2:3'])
+def test_parse_slice_invalid(value):
+    with pytest.raises(ValueError):
+        parse_slice(value)
+
+
+def test_select():
+    assert list(select(5, None)) == [0, 1, 2, 3, 4]
+    assert list(select(10, parse_slice('::3'))) == [0, 3, 6, 9]
+    assert list(select(10, parse_slice('-2:'))) == [8, 9]
+    # 随机抽样按seed固定，结果排好序，超过总数时取全部
+    picked = select(100, parse_slice('random:5:1'))
+    assert picked == select(100, parse_slice('random:5:1')) and picked == sorted(picked) and len(picked) == 5
+    assert select(3, parse_slice('random:10')) == [0, 1, 2]
+
+
+def _write(path, lines):
+    with open(str(path), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def test_dataset_formats(tmp_path):
+    cache = str(tmp_path / 'cache')
+    _write(tmp_path / 'a.csv', ['name,city', '张三,北京', '李四,上海'])
+    _write(tmp_path / 'a.jsonl', ['{"name": "a"}', '', '{"name": "b"}'])
+    _write(tmp_path / 'a.yaml', ['name: a', '---', 'name: b', '---'])
+    csv_data = Dataset(str(tmp_path / 'a.csv'), cache, id_field='name')
+    assert csv_data.ids == ['张三', '李四'] and csv_data.record(1) == {'name': '李四', 'city': '上海'}
+    for name in ('a.jsonl', 'a.yaml'):
+        data = Dataset(str(tmp_path / name), cache)
+        assert len(data) == 2 and data.ids == ['0', '1'] and data.record(1) == {'name': 'b'}
+    with pytest.raises(Exception):
+        Dataset(str(tmp_path / 'a.txt'), cache)
+
+
+def test_dataset_cache_rebuild(tmp_path):
+    cache = str(tmp_path / 'cache')
+    path = tmp_path / 'a.jsonl'
+    _write(path, ['{"id": 1}', '{"id": 2}'])
+    first = Dataset(str(path), cache, id_field='id')
+    assert first.ids == ['1', '2']
+    # 内容没变时复用缓存
+    assert Dataset(str(path), cache, id_field='id').data_path == first.data_path
+    # 内容变化后按新的hash重建
+    _write(path, ['{"id": 1}', '{"id": 2}', '{"id": 3}'])
+    os.utime(str(path), ns=(0, os.stat(str(path)).st_mtime_ns + 10 ** 9))
+    second = Dataset(str(path), cache, id_field='id')
+    assert second.data_path != first.data_path
+    assert second.ids == ['1', '2', '3'] and second.record(2) == {'id': 3}
+    # 缓存文件被删掉时重建
+    os.remove(second.data_path)
+    assert Dataset(str(path), cache, id_field='id').record(0) == {'id': 1}
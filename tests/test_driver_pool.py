@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/22 16:00'
+import logging
+import threading
+import time
+
+import pytest
+
+from common.driver_pool import DriverPool
+
+logger = logging.getLogger('test_driver_pool')
+
+
+class _Driver:
+    current_window_handle = 'home'
+
+    def quit(self):
+        pass
+
+
+def test_browsers_start_in_parallel():
+    def factory():
+        time.sleep(0.3)
+        return _Driver()
+    pool = DriverPool(factory, logger, size=3)
+    threads = [threading.Thread(target=pool.lease) for _ in range(3)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 启动浏览器不持有锁，3个浏览器同时启动
+    assert time.time() - start < 0.6
+    assert len(pool._handles) == 3 and pool._starting == 0
+
+
+def test_failed_start_releases_slot():
+    results = [Exception('启动失败'), _Driver()]
+
+    def factory():
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    pool = DriverPool(factory, logger, size=1, timeout=0.1)
+    with pytest.raises(Exception, match='启动失败'):
+        pool.lease()
+    # 启动失败时释放预占的位置，下次租用可以重新启动
+    assert pool._starting == 0
+    assert pool.lease().driver is not None
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/22 11:00'
+import json
+import threading
+import time
+
+import pytest
+
+from common.fake_webdriver import FakeWebDriverServer, _FakeError
+from common.grid import GridDispatcher, parse_hosts
+
+pytest_plugins = ['pytester']
+
+CAPABILITIES = {'browserName': 'fake'}
+
+
+class FlakyServer(FakeWebDriverServer):
+    '''可以模拟故障的节点：down时所有请求返回500；status_delay为/status的响应延迟'''
+    down = False
+    status_delay = 0
+
+    def dispatch(self, method, path, body):
+        if self.down:
+            raise _FakeError(500, 'unknown error', 'node down')
+        if path.strip('/') == 'status' and self.status_delay:
+            time.sleep(self.status_delay)
+        return super(FlakyServer, self).dispatch(method, path, body)
+
+
+@pytest.fixture
+def servers():
+    servers = [FlakyServer().start(), FlakyServer().start()]
+    yield servers
+    for server in servers:
+        server.stop()
+
+
+def test_parse_hosts():
+    assert parse_hosts('10.0.0.1:4444/wd/hub*4, http://10.0.0.2:4444/wd/hub/') == [
+        ('http://10.0.0.1:4444/wd/hub', 4), ('http://10.0.0.2:4444/wd/hub', 1)]
+    for value in ('a*x', 'a*0'):
+        with pytest.raises(ValueError):
+            parse_hosts(value)
+
+
+def test_capacity_shared_between_workers():
+    nodes = [('http://a', 3), ('http://b', 1)]
+    shares = [[n.capacity for n in GridDispatcher(nodes, worker_index=i, worker_count=2).nodes] for i in range(2)]
+    assert shares == [[2], [1, 1]]
+
+
+def test_least_loaded_dispatch(servers):
+    grid = GridDispatcher([(s.url, 2) for s in servers], timeout=0.3)
+    drivers = [grid.new_driver(CAPABILITIES) for _ in range(4)]
+    # 按负载交替分配到两个节点
+    assert [d.grid_node.order for d in drivers] == [0, 1, 0, 1]
+    assert [len(s.sessions) for s in servers] == [2, 2]
+    # 节点都满时等待，超时报错
+    with pytest.raises(Exception, match='等待节点超时'):
+        grid.new_driver(CAPABILITIES)
+    drivers[1].quit()
+    assert grid.new_driver(CAPABILITIES).grid_node.order == 1
+    assert [n.sessions for n in grid.nodes] == [2, 3]
+
+
+def test_unhealthy_node_skipped(servers):
+    servers[0].down = True
+    grid = GridDispatcher([(s.url, 2) for s in servers], timeout=0.3)
+    drivers = [grid.new_driver(CAPABILITIES) for _ in range(2)]
+    assert [d.grid_node.order for d in drivers] == [1, 1]
+    assert not grid.nodes[0].healthy and grid.nodes[0].sessions == 0
+    assert grid.is_alive(drivers[0])
+    # 所有节点都不可用时直接报错，不等待
+    servers[1].down = True
+    grid.mark_failed(grid.nodes[1])
+    with pytest.raises(Exception):
+        grid.new_driver(CAPABILITIES)
+
+
+def test_status_probe_outside_lock(servers):
+    '''一个节点的/status很慢时，其他线程仍然可以拿到分配锁'''
+    servers[0].status_delay = 1
+    grid = GridDispatcher([(s.url, 1) for s in servers], health_interval=0)
+    thread = threading.Thread(target=grid.new_driver, args=(CAPABILITIES,))
+    thread.start()
+    time.sleep(0.2)
+    start = time.time()
+    with grid._cond:
+        waited = time.time() - start
+    thread.join()
+    assert waited < 0.5
+
+
+CONFTEST = '''
+import json
+import types
+
+import pytest
+
+from common.grid import GridDispatcher
+
+URLS = %r
+
+
+def pytest_configure(config):
+    config.pluginmanager.register(GridDispatcher([(url, 1) for url in URLS], retries=1), 'grid')
+
+
+@pytest.fixture
+def handle(request):
+    grid = request.config.pluginmanager.get_plugin('grid')
+    driver = grid.new_driver({'browserName': 'fake'})
+    request.addfinalizer(driver.quit)
+    return types.SimpleNamespace(driver=driver)
+
+
+@pytest.fixture
+def title_on_teardown(handle):
+    # teardown阶段再访问一次，节点故障时call、teardown都失败
+    yield
+    handle.driver.title
+
+
+def pytest_sessionfinish(session):
+    grid = session.config.pluginmanager.get_plugin('grid')
+    with open('grid.json', 'w') as f:
+        json.dump({'nodes': [[n.sessions, n.failures, n.healthy] for n in grid.nodes], 'results': grid.results}, f)
+'''
+
+TESTS = '''
+DOWN_FLAG = 'down-%s'
+
+
+def test_node_dies(handle, title_on_teardown):
+    order = handle.driver.grid_node.order
+    if order == 0:
+        open(DOWN_FLAG % order, 'w').close()
+    assert handle.driver.title == ''
+'''
+
+
+def test_reschedule_on_node_failure(servers, pytester):
+    '''第一个节点在用例中途故障：失败只算一次，用例换到第二个节点重跑并通过'''
+    for index, server in enumerate(servers):
+        dispatch = server.dispatch
+
+        def flaky(method, path, body, index=index, dispatch=dispatch, server=server):
+            if (pytester.path / ('down-%s' % index)).exists():
+                server.down = True
+            return dispatch(method, path, body)
+        server.dispatch = flaky
+    pytester.makeconftest(CONFTEST % [s.url for s in servers])
+    pytester.makepyfile(test_grid_node=TESTS)
+    result = pytester.runpytest_inprocess('-p', 'no:cacheprovider', '-p', 'no:html')
+    result.assert_outcomes(passed=1)
+    with open(str(pytester.path / 'grid.json')) as f:
+        data = json.load(f)
+    assert data['nodes'] == [[1, 1, False], [1, 0, True]]
+    results = data['results']
+    # 重跑前的结果不记录，第一个节点上没有用例
+    assert servers[0].url not in results
+    assert results[servers[1].url] == dict(results[servers[1].url], tests=1, failed=0, rescheduled=1)
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/22 14:00'
+import types
+
+from common.launcher import BrowserLauncher
+
+
+def test_worker_times_merged_on_controller():
+    worker = BrowserLauncher('chrome', 'chromedriver', profile='headless')
+    worker.service_times, worker.startup_times = [0.5], [1.0, 2.0]
+    config = types.SimpleNamespace(workeroutput={})
+    worker.pytest_sessionfinish(types.SimpleNamespace(config=config))
+    # xdist的主进程不新建浏览器，只汇总worker传回的耗时
+    controller = BrowserLauncher('chrome', 'chromedriver', profile='headless')
+    assert controller.summary() is None
+    controller.pytest_testnodedown(types.SimpleNamespace(workeroutput=config.workeroutput), None)
+    controller.pytest_testnodedown(types.SimpleNamespace(workeroutput={'browser_launcher': {
+        'service_times': [0.7], 'startup_times': [3.0]}}), None)
+    controller.pytest_testnodedown(types.SimpleNamespace(), None)  # worker异常退出时没有workeroutput
+    assert controller.summary() == '浏览器启动（headless）：driver服务2个，最长0.70秒，新建会话3次，平均2.00秒，最长3.00秒'
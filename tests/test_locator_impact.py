@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/21 17:30'
+import shutil
+import subprocess
+
+import pytest
+
+from common.locator_impact import changed_locators, is_affected, scan_file
+
+PAGE_YAML = '''
+HomePage:
+    dec: 首页
+    locators:
+      - {name: 输入框, type: id, value: kw}
+      - {name: 搜索按钮, type: id, value: su}
+      - {name: 新闻, type: link text, value: 新闻}
+'''
+
+CASE = '''
+from pages.page_objects import HomePage as Home, LoginPage
+
+
+def login(handle):
+    handle.click(LoginPage.登录按钮)
+
+
+def test_search(handle):
+    handle.send_keys(Home.输入框, 'selenium')
+
+
+def test_all(handle):
+    handle.find_all(Home)
+
+
+class TestNews:
+    def test_news(self, handle):
+        handle.click(Home.新闻)
+'''
+
+
+def _git(root, *args):
+    subprocess.run(['git', '-C', str(root), '-c', 'user.name=t', '-c', 'user.email=t@t'] + list(args),
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+@pytest.mark.skipif(not shutil.which('git'), reason='需要git')
+def test_changed_locators(tmp_path):
+    locators = tmp_path / 'pages' / 'locators'
+    locators.mkdir(parents=True)
+    (locators / 'home.yaml').write_text(PAGE_YAML, encoding='utf-8')
+    (locators / 'old.yaml').write_text('OldPage:\n    locators:\n      - {name: a, type: id, value: a}\n',
+                                       encoding='utf-8')
+    _git(tmp_path, 'init', '-q')
+    _git(tmp_path, 'add', '.')
+    _git(tmp_path, 'commit', '-q', '-m', 'init')
+    assert changed_locators(str(tmp_path), str(locators)) == set()
+    # 修改一个、删除一个、新增一个，删除整个文件，新增一个文件
+    text = PAGE_YAML.replace('value: su', 'value: su2').replace('      - {name: 新闻, type: link text, value: 新闻}\n', '')
+    (locators / 'home.yaml').write_text(text + '      - {name: 图片, type: id, value: img}\n', encoding='utf-8')
+    (locators / 'old.yaml').unlink()
+    (locators / 'new.yaml').write_text('NewPage:\n    locators:\n      - {name: b, type: id, value: b}\n',
+                                       encoding='utf-8')
+    assert changed_locators(str(tmp_path), str(locators)) == {
+        'HomePage.搜索按钮', 'HomePage.新闻', 'HomePage.图片', 'OldPage.a', 'NewPage.b'}
+
+
+def test_scan_file(tmp_path):
+    path = tmp_path / 'test_home.py'
+    path.write_text(CASE, encoding='utf-8')
+    index = scan_file(str(path), 'cases/test_home.py')
+    # 模块级辅助函数引用的locator算到所有用例上
+    assert index == {
+        'cases/test_home.py::test_search': ['HomePage.输入框', 'LoginPage.登录按钮'],
+        'cases/test_home.py::test_all': ['HomePage.*', 'LoginPage.登录按钮'],
+        'cases/test_home.py::TestNews::test_news': ['HomePage.新闻', 'LoginPage.登录按钮'],
+    }
+
+
+def test_is_affected():
+    assert is_affected(['HomePage.输入框'], {'HomePage.输入框'})
+    assert not is_affected(['HomePage.输入框'], {'HomePage.新闻'})
+    # 引用整个页面类时，这个页面的任何locator变化都受影响
+    assert is_affected(['HomePage.*'], {'HomePage.新闻'})
+    assert not is_affected(['HomePage.*'], {'LoginPage.登录按钮'})
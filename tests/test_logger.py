@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/21 18:00'
+import logging.handlers
+import os
+import time
+
+import pytest
+
+from common import logger as logger_module
+from common.logger import Logger
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    yield str(tmp_path)
+    # 停掉本用例启动的后台写日志线程
+    for path in [path for path in logger_module._listeners if path.startswith(str(tmp_path))]:
+        logger_module._listeners.pop(path).stop()
+
+
+def _read_until(path, text, timeout=3):
+    '''后台线程在队列空闲时flush，等待文件中出现text'''
+    deadline = time.time() + timeout
+    content = ''
+    while time.time() < deadline:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            if text in content:
+                break
+        time.sleep(0.02)
+    return content
+
+
+def test_queue_mode_writes_in_background(log_dir):
+    logger = Logger(name='test_queue_mode', file_name='queue.log', dir_path=log_dir, use_queue=True, console=False,
+                    set_level='info')
+    handlers = logger.logger.handlers
+    assert len(handlers) == 1 and isinstance(handlers[0], logging.handlers.QueueHandler)
+    for i in range(250):
+        logger.info('第%s条' % i)
+    logger.debug('不写入')
+    content = _read_until(os.path.join(log_dir, 'queue.log'), '第249条')
+    lines = content.splitlines()
+    assert len(lines) == 250 and lines[0].endswith('[INFO] - 第0条') and '不写入' not in content
+
+
+def test_queue_mode_shares_one_listener(log_dir):
+    first = Logger(name='test_queue_a', file_name='shared.log', dir_path=log_dir, use_queue=True, console=False)
+    again = Logger(name='test_queue_a', file_name='shared.log', dir_path=log_dir, use_queue=True, console=False)
+    other = Logger(name='test_queue_b', file_name='shared.log', dir_path=log_dir, use_queue=True, console=False)
+    # 同一个name不重复添加handler，同一个文件只有一个后台线程
+    assert first.logger is again.logger and len(first.logger.handlers) == 1
+    assert first.logger.handlers[0].queue is other.logger.handlers[0].queue
+    first.info('a')
+    other.info('b')
+    content = _read_until(os.path.join(log_dir, 'shared.log'), 'test_queue_b')
+    assert 'test_queue_a - [INFO] - a' in content and 'test_queue_b - [INFO] - b' in content
+
+
+def test_queue_mode_rotates(log_dir):
+    logger = Logger(name='test_queue_rotate', file_name='rotate.log', dir_path=log_dir, use_queue=True,
+                    console=False, max_bytes=2000, backup_count=2)
+    for i in range(200):
+        logger.info('x' * 50)
+    logger.info('最后一条')
+    _read_until(os.path.join(log_dir, 'rotate.log'), '最后一条')
+    assert sorted(os.listdir(log_dir)) == ['rotate.log', 'rotate.log.1', 'rotate.log.2']
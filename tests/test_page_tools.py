@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/21 18:30'
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('jinja2')
+
+from pages import tools  # noqa: E402
+
+PAGE_YAML = 'HomePage:\n    dec: 首页\n    locators:\n      - {name: 输入框, type: id, value: kw}\n'
+
+
+@pytest.fixture
+def pages_dir(tmp_path, monkeypatch):
+    '''在临时文件夹中生成，不改动仓库里的页面对象'''
+    shutil.copy(os.path.join(tools.current_path, 'template'), str(tmp_path / 'template'))
+    (tmp_path / 'locators').mkdir()
+    (tmp_path / 'locators' / 'home.yaml').write_text(PAGE_YAML, encoding='utf-8')
+    monkeypatch.setattr(tools, 'current_path', str(tmp_path))
+    monkeypatch.setattr(tools, 'yaml_path', str(tmp_path / 'locators'))
+    monkeypatch.setattr(tools, 'generated_path', str(tmp_path / 'generated'))
+    monkeypatch.setattr(tools, 'manifest_path', str(tmp_path / 'generated' / 'manifest.json'))
+    return tmp_path
+
+
+def test_check_tracks_yaml_changes(pages_dir):
+    assert tools.check_page_objects() == ['home', 'page_objects']
+    assert tools.yamlLocator_to_pageObject() == ['home']
+    assert tools.check_page_objects() == []
+    assert 'from pages.generated.home import *' in (pages_dir / 'page_objects.py').read_text(encoding='utf-8')
+    # 修改一个文件
+    (pages_dir / 'locators' / 'home.yaml').write_text(PAGE_YAML.replace('kw', 'wd'), encoding='utf-8')
+    assert tools.check_page_objects() == ['home']
+    # 新增一个文件，page_objects.py也要更新
+    (pages_dir / 'locators' / 'login.yaml').write_text(PAGE_YAML.replace('HomePage', 'LoginPage'), encoding='utf-8')
+    assert tools.check_page_objects() == ['home', 'login', 'page_objects']
+    assert tools.yamlLocator_to_pageObject() == ['home', 'login']
+    assert tools.check_page_objects() == []
+    # 删除一个文件
+    (pages_dir / 'locators' / 'login.yaml').unlink()
+    assert tools.check_page_objects() == ['login', 'page_objects']
+    assert tools.yamlLocator_to_pageObject() == ['login']
+    assert not (pages_dir / 'generated' / 'login.py').exists()
+    assert tools.check_page_objects() == []
+
+
+def test_check_generated_modules(pages_dir):
+    tools.yamlLocator_to_pageObject()
+    # 清单没变，但生成的模块被删除或者手动修改
+    (pages_dir / 'generated' / 'home.py').unlink()
+    assert tools.check_page_objects() == ['home']
+    assert tools.yamlLocator_to_pageObject() == ['home']
+    assert tools.check_page_objects() == []
+    with open(str(pages_dir / 'generated' / 'home.py'), 'a', encoding='utf-8') as f:
+        f.write('# 手动修改\n')
+    assert tools.check_page_objects() == ['home']
+    assert tools.yamlLocator_to_pageObject() == ['home']
+    assert tools.check_page_objects() == []
+
+
+def test_check_template_change(pages_dir):
+    (pages_dir / 'locators' / 'login.yaml').write_text(PAGE_YAML.replace('HomePage', 'LoginPage'), encoding='utf-8')
+    tools.yamlLocator_to_pageObject()
+    with open(str(pages_dir / 'template'), 'a', encoding='utf-8') as f:
+        f.write('\n')
+    # 模板变化时所有模块都要重新生成
+    assert tools.check_page_objects() == ['home', 'login']
+    assert tools.yamlLocator_to_pageObject() == ['home', 'login']
+    assert tools.check_page_objects() == []
+
+
+def test_check_cli_on_repo():
+    '''仓库里提交的页面对象必须是最新的'''
+    result = subprocess.run([sys.executable, os.path.join(tools.current_path, 'tools.py'), '--check'],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=os.path.dirname(tools.current_path))
+    assert result.returncode == 0, result.stdout.decode('utf-8') + result.stderr.decode('utf-8')
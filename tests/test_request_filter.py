@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/22 10:00'
+import http.client
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from common.request_filter import FilteringProxy, RequestFilter, guess_resource_type
+
+
+class _Upstream(BaseHTTPRequestHandler):
+    '''本地上游站点：记录收到的路径，返回ok'''
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        body = b'ok'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def upstream():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Upstream)
+    server.daemon_threads = True
+    server.paths = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def proxy():
+    proxy = FilteringProxy().start()
+    yield proxy
+    proxy.stop()
+
+
+def _get(proxy, url):
+    '''通过代理发http请求，返回(状态码, 内容)'''
+    host, port = proxy.address.split(':')
+    conn = http.client.HTTPConnection(host, int(port), timeout=5)
+    try:
+        conn.request('GET', url)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def _tunnel(proxy, host, port):
+    '''通过CONNECT隧道发请求，返回内容'''
+    proxy_host, proxy_port = proxy.address.split(':')
+    conn = http.client.HTTPConnection(proxy_host, int(proxy_port), timeout=5)
+    conn.set_tunnel(host, port)
+    try:
+        conn.request('GET', '/tunnel')
+        return conn.getresponse().read()
+    finally:
+        conn.close()
+
+
+def test_guess_resource_type():
+    assert guess_resource_type('http://a.com/x/logo.PNG?v=1') == 'image'
+    assert guess_resource_type('http://a.com/app.js') == 'script'
+    assert guess_resource_type('http://a.com/img', accept='image/webp,*/*') == 'image'
+    assert guess_resource_type('http://a.com/theme', accept='text/css,*/*') == 'stylesheet'
+    assert guess_resource_type('http://a.com/index.html') is None
+
+
+def test_match():
+    request_filter = RequestFilter(block_types=['image'], block_domains=['hm.baidu.com'])
+    assert request_filter.match('http://www.baidu.com/logo.png') == 'image'
+    assert request_filter.match('http://hm.baidu.com/hm.js') == 'domain'
+    assert request_filter.match('http://a.hm.baidu.com/x') == 'domain'
+    assert request_filter.match('http://xhm.baidu.com/x') is None
+    assert request_filter.match('hm.baidu.com:443') == 'domain'  # CONNECT只有host:port
+    allow = RequestFilter(allow_domains=['baidu.com'])
+    assert allow.match('http://www.baidu.com/') is None
+    assert allow.match('http://cdn.example.com/') == 'domain'
+    assert not RequestFilter() and request_filter
+
+
+def test_cdp_patterns():
+    request_filter = RequestFilter(block_types=['font', 'unknown'], block_domains=['hm.baidu.com'],
+                                   allow_domains=['baidu.com'])
+    # 白名单无法用url规则表示，不包含在内
+    assert request_filter.cdp_patterns() == [
+        '*.woff', '*.woff?*', '*.woff2', '*.woff2?*', '*.ttf', '*.ttf?*', '*.otf', '*.otf?*', '*.eot', '*.eot?*',
+        '*://hm.baidu.com/*', '*://*.hm.baidu.com/*']
+
+
+def test_proxy_blocks_by_type(proxy, upstream):
+    base = 'http://127.0.0.1:%s' % upstream.server_address[1]
+    proxy.request_filter = RequestFilter(block_types=['image'])
+    assert _get(proxy, base + '/index.html') == (200, b'ok')
+    assert _get(proxy, base + '/logo.png?v=1') == (204, b'')
+    # 被拦截的请求不会到达上游
+    assert upstream.paths == ['/index.html']
+    assert proxy.request_filter.stats == {'blocked': 1, 'by_reason': {'image': 1}}
+
+
+def test_proxy_domains(proxy, upstream):
+    port = upstream.server_address[1]
+    proxy.request_filter = RequestFilter(block_domains=['localhost'])
+    assert _get(proxy, 'http://localhost:%s/a' % port)[0] == 204
+    assert _get(proxy, 'http://127.0.0.1:%s/b' % port) == (200, b'ok')
+    proxy.request_filter = RequestFilter(allow_domains=['127.0.0.1'])
+    assert _get(proxy, 'http://localhost:%s/c' % port)[0] == 204
+    assert _get(proxy, 'http://127.0.0.1:%s/d' % port) == (200, b'ok')
+    assert upstream.paths == ['/b', '/d']
+
+
+def test_proxy_connect_by_host(proxy, upstream):
+    port = upstream.server_address[1]
+    proxy.request_filter = RequestFilter(block_domains=['localhost'], block_types=['image'])
+    # 隧道里看不到url，只按host过滤
+    assert _tunnel(proxy, '127.0.0.1', port) == b'ok'
+    with pytest.raises(OSError):
+        _tunnel(proxy, 'localhost', port)
+    assert upstream.paths == ['/tunnel']
+    assert proxy.request_filter.stats == {'blocked': 1, 'by_reason': {'domain': 1}}
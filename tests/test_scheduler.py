@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/21 17:00'
+import pytest
+
+from common.scheduler import TimingStore, lpt_shards, parse_shard, shards_for_budget
+
+
+def test_lpt_shards_balance():
+    durations = [('a', 7), ('b', 5), ('c', 4), ('d', 3), ('e', 3), ('f', 2)]
+    shards = lpt_shards(durations, 3)
+    # 从大到小分给当前最空的分片，耗时相同的分片按序号
+    assert shards == [(9, ['a', 'f']), (8, ['b', 'e']), (7, ['c', 'd'])]
+    assert sorted(n for _, nodeids in shards for n in nodeids) == ['a', 'b', 'c', 'd', 'e', 'f']
+
+
+def test_lpt_shards_stable_on_ties():
+    durations = [('b', 1), ('a', 1), ('c', 1)]
+    assert lpt_shards(durations, 2) == lpt_shards(list(reversed(durations)), 2) == [(2, ['a', 'c']), (1, ['b'])]
+    # 分片数多于用例数时多出的分片为空
+    assert lpt_shards([('a', 1)], 2) == [(1, ['a']), (0.0, [])]
+
+
+def test_shards_for_budget():
+    durations = [('a', 7), ('b', 5), ('c', 4), ('d', 3), ('e', 3), ('f', 2)]
+    assert shards_for_budget(durations, 24) == 1
+    assert shards_for_budget(durations, 9) == 3
+    # LPT分3片最大为9秒，不是最优解，预算8秒时给出的是LPT实际需要的分片数
+    assert shards_for_budget(durations, 8) == 4
+    # 总耗时能整除但LPT分不均时，需要更多的分片
+    assert shards_for_budget([('a', 3), ('b', 3), ('c', 2), ('d', 2), ('e', 2)], 6) == 3
+    assert shards_for_budget(durations, 6) is None
+    assert shards_for_budget([], 10) is None
+
+
+@pytest.mark.parametrize('value, expected', [('1/4', (1, 4)), ('4/4', (4, 4))])
+def test_parse_shard(value, expected):
+    assert parse_shard(value) == expected
+
+
+@pytest.mark.parametrize('value', ['0/4', '5/4', '1', 'a/b'])
+def test_parse_shard_invalid(value):
+    with pytest.raises(ValueError):
+        parse_shard(value)
+
+
+def test_timing_store(tmp_path):
+    path = str(tmp_path / 'timings.json')
+    store = TimingStore(path, alpha=0.5)
+    assert store.duration('t') is None
+    store.update('t', 'setup', 1.0)
+    store.update('t', 'call', 0.0)
+    # 记录的0秒也参与移动平均
+    store.update('t', 'call', 2.0)
+    assert store.duration('t') == 2.0
+    store.save()
+    assert TimingStore(path).timings == {'t': {'setup': 1.0, 'call': 1.0}}
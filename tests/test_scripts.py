@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/21 10:00'
+import os
+import shutil
+import subprocess
+
+import pytest
+from selenium.common.exceptions import JavascriptException
+from selenium import webdriver
+
+from common import waits
+from common.base_selenium import Base, FIND_MANY_JS, RESET_JS
+from common.fake_webdriver import FakeWebDriverServer, demo_page
+from common.launcher import BrowserLauncher
+from common.macro import MACRO_JS
+from common.snapshot import SNAPSHOT_JS
+from common.visual import REGIONS_JS
+
+# 框架注入的脚本：假WebDriver只模拟返回值，这里检查脚本本身的语法和在真实浏览器中的行为
+SCRIPTS = {
+    'FIND_MANY_JS': FIND_MANY_JS,
+    'RESET_JS': RESET_JS,
+    'MACRO_JS': MACRO_JS,
+    'SNAPSHOT_JS': SNAPSHOT_JS,
+    'REGIONS_JS': REGIONS_JS,
+    'IDLE_INSTRUMENT_JS': waits.IDLE_INSTRUMENT_JS,
+    'PAGE_IDLE_JS': waits.PAGE_IDLE_JS,
+}
+for _name in ('PRESENCE_JS', 'ALL_PRESENCE_JS', 'TITLE_IS_JS', 'TITLE_CONTAINS_JS', 'TEXT_IN_ELEMENT_JS',
+              'VALUE_IN_ELEMENT_JS', 'ABSENT_JS', 'INVISIBLE_JS'):
+    SCRIPTS['observe(%s)' % _name] = waits.LOCATE_JS + 'var predicate = ' + getattr(waits, _name) + ';' + \
+        waits.OBSERVER_JS
+
+
+@pytest.mark.skipif(not shutil.which('node'), reason='需要node检查js语法')
+@pytest.mark.parametrize('name', sorted(SCRIPTS))
+def test_script_syntax(name, tmp_path):
+    '''和webdriver一样把脚本包成函数体，用node检查语法'''
+    path = tmp_path / 'script.js'
+    path.write_text('(function () {\n%s\n});\n' % SCRIPTS[name], encoding='utf-8')
+    result = subprocess.run(['node', '--check', str(path)], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert result.returncode == 0, result.stderr.decode('utf-8')
+
+
+def test_fake_rejects_unknown_script():
+    '''假WebDriver不认识的脚本直接报错，脚本改写后基准测试不会悄悄走错分支'''
+    server = FakeWebDriverServer(page_factory=demo_page).start()
+    driver = webdriver.Remote(command_executor=server.url, desired_capabilities={'browserName': 'fake'})
+    try:
+        with pytest.raises(JavascriptException):
+            driver.execute_script('return document.title')
+        assert driver.execute_script(FIND_MANY_JS, [['id', 'kw'], ['id', 'missing']])[1] is None
+    finally:
+        driver.quit()
+        server.stop()
+
+
+@pytest.fixture(scope='module')
+def site(request, local_site, logger):
+    '''无头chrome打开本地站点，启动不了时跳过'''
+    launcher = BrowserLauncher('chrome', os.path.join(os.getcwd(), "driver", "chromedriver"), profile='headless')
+    request.addfinalizer(launcher.stop)
+    try:
+        driver = launcher.new_driver()
+    except Exception as e:
+        pytest.skip('无法启动无头chrome：%s' % e)
+    request.addfinalizer(driver.quit)
+    return Base(logger, driver, wait_mode='observer'), local_site + '/index.html'
+
+
+@pytest.fixture
+def page(site):
+    base, url = site
+    base.get(url)
+    return base
+
+
+def _later(base, js, delay=200):
+    '''delay毫秒后在页面中执行js，用来检查等待脚本在DOM变化时返回'''
+    base.driver.execute_script('var js = arguments[0]; setTimeout(function () { eval(js); }, %s);' % delay, js)
+
+
+def test_find_many(page):
+    found = page.driver.execute_script(FIND_MANY_JS, [['id', 'kw'], ['css selector', '#missing'],
+                                                      ['xpath', '//option[@value="gz"]'], ['name', 'wd'],
+                                                      ['tag name', 'select'], ['link text', '没有']])
+    assert [e.tag_name if e else None for e in found] == ['input', None, 'option', 'input', 'select', None]
+    assert found[2].get_attribute('value') == 'gz'
+
+
+def test_observer_presence_and_absence(page):
+    _later(page, 'var el = document.createElement("div"); el.id = "late"; el.textContent = "ok";'
+                 'document.body.appendChild(el);')
+    element = waits.observe_until(page.driver, waits.PRESENCE_JS, ['id', 'late'], 3)
+    assert element.text == 'ok'
+    _later(page, 'document.getElementById("late").remove();')
+    assert waits.observe_until(page.driver, waits.ABSENT_JS, ['id', 'late'], 3) is True
+    assert waits.observe_until(page.driver, waits.ABSENT_JS, ['id', 'kw'], 0.3) is None
+
+
+def test_observer_invisible_and_text(page):
+    _later(page, 'document.getElementById("result").style.display = "none";')
+    assert waits.observe_until(page.driver, waits.INVISIBLE_JS, ['id', 'result'], 3) is True
+    _later(page, 'document.getElementById("kw").value = "selenium"; '
+                 'document.getElementById("kw").dispatchEvent(new Event("input", {bubbles: true}));')
+    assert waits.observe_until(page.driver, waits.VALUE_IN_ELEMENT_JS, ['id', 'kw', 'sele'], 3) is True
+    assert waits.observe_until(page.driver, waits.TEXT_IN_ELEMENT_JS, ['id', 'city', '广州'], 1) is True
+    assert waits.observe_until(page.driver, waits.TITLE_IS_JS, ['本地测试站点'], 1) is True
+
+
+def test_page_idle(page):
+    assert page.wait_for_page_idle(quiet=0.2, timeout=5)
+    # 埋点统计fetch请求，请求结束后才算空闲
+    page.driver.execute_script('window.__fetched = false; '
+                               'fetch("index.html").then(function () { window.__fetched = true; });')
+    assert page.wait_for_page_idle(quiet=0.2, timeout=5)
+    assert page.driver.execute_script('return [window.__fetched, window.__pageIdle.inflight]') == [True, 0]
+
+
+def test_macro(page):
+    results = page.macro().fill(('id', 'kw'), 'selenium').select(('id', 'city'), value='gz').run()
+    assert [step['result'] for step in results] == [None, 'gz']
+    assert page.driver.execute_script('return [document.getElementById("kw").value, '
+                                      'document.getElementById("city").value]') == ['selenium', 'gz']
+
+
+def test_snapshot(page):
+    page.select_by_value(('id', 'city'), 'sh')
+    snap = page.snapshot(('id', 'city'))
+    options = snap.root.children
+    assert [(o.text, o.get('value'), o.get('selected')) for o in options] == [
+        ('北京', 'bj', None), ('上海', 'sh', 'true'), ('广州', 'gz', None)]
+    assert snap.root.visible and snap.root.rect[2] > 0
+
+
+def test_regions(page):
+    regions = page.driver.execute_script(REGIONS_JS, [['id', 'kw'], ['id', 'missing']])
+    assert len(regions) == 1
+    left, top, right, bottom = regions[0]
+    assert right > left and bottom > top
+
+
+def test_reset(page):
+    page.driver.execute_script('localStorage.setItem("a", "1"); sessionStorage.setItem("b", "2");'
+                               'document.cookie = "c=3; path=/";')
+    page.driver.execute_script(RESET_JS)
+    assert page.driver.execute_script('return [localStorage.length, sessionStorage.length, document.cookie]') == \
+        [0, 0, '']
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/22 15:00'
+import logging
+import os
+import types
+
+from common.session_cache import SessionCache
+
+
+class _Driver:
+    def execute_script(self, script, *args):
+        return {'url': 'http://localhost/', 'localStorage': {'token': 'x'}, 'sessionStorage': {}}
+
+    def get_cookies(self):
+        return [{'name': 'sid', 'value': '1', 'expiry': 4102444800}]
+
+
+def test_capture_and_load(tmp_path):
+    cache = SessionCache(str(tmp_path), logging.getLogger('test_session_cache'))
+    cache.capture(types.SimpleNamespace(driver=_Driver()), 'admin')
+    # 先写临时文件再改名，不留下临时文件
+    assert os.listdir(str(tmp_path)) == ['admin.json']
+    assert cache.load('admin')['localStorage'] == {'token': 'x'}
+
+
+def test_corrupt_cache_is_a_miss(tmp_path, caplog):
+    cache = SessionCache(str(tmp_path), logging.getLogger('test_session_cache'))
+    with open(cache._path('admin'), 'w', encoding='utf-8') as f:
+        f.write('{"url": "http://loc')
+    assert cache.load('admin') is None
+    assert not os.path.exists(cache._path('admin'))
+    assert '读取登录态缓存失败：admin' in caplog.text
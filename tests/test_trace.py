@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/21 16:00'
+import gzip
+import os
+
+import pytest
+from selenium.webdriver.remote.remote_connection import RemoteConnection
+
+from common.base_selenium import Base
+from common.profiler import Profiler
+from common.trace import TraceRecorder, TraceStore, format_records
+
+
+def _records(n, msg='x'):
+    return [{'t': i * 0.1, 'level': 'INFO', 'msg': '%s-%s' % (msg, i)} for i in range(n)]
+
+
+def test_write_and_query(tmp_path):
+    store = TraceStore(str(tmp_path))
+    store.write('cases/test_a.py::test_1', _records(3, 'a'), 'passed', 100.0, 1.0)
+    store.write('cases/test_a.py::test_2', _records(2, 'b'), 'failed', 101.0, 2.0)
+    store.write('cases/test_a.py::test_1', _records(1, 'c'), 'failed', 102.0, 0.5)
+    store.close()
+    # 完整nodeid走索引，新的在前
+    found = store.find('cases/test_a.py::test_1')
+    assert [(e['start'], e['outcome'], e['records']) for e in found] == [(102.0, 'failed', 1), (100.0, 'passed', 3)]
+    assert [r['msg'] for r in store.read(found[1])] == ['a-0', 'a-1', 'a-2']
+    assert store.latest('cases/test_a.py::test_1') == _records(1, 'c')
+    # 部分nodeid按包含查询，--failed只看失败的
+    assert [e['nodeid'] for e in store.find('test_2')] == ['cases/test_a.py::test_2']
+    assert [e['start'] for e in store.find('test_a', failed=True)] == [102.0, 101.0]
+    assert store.latest('missing') is None
+    assert format_records(_records(1))[0].strip() == '0.000s      [INFO] x-0'
+
+
+def test_rotation_compresses_per_test_members(tmp_path):
+    store = TraceStore(str(tmp_path), max_bytes=200)
+    for i in range(6):
+        store.write('t::%s' % i, _records(3, str(i)), 'passed', float(i), 0.1)
+    store.close()
+    names = sorted(os.listdir(str(tmp_path)))
+    gz = [name for name in names if name.endswith('.jsonl.gz')]
+    assert gz and all(not name.endswith('.jsonl') or name.replace('.jsonl', '.jsonl.gz') not in names for name in names)
+    for i in range(6):
+        entry = store.find('t::%s' % i)[0]
+        assert [r['msg'] for r in store.read(entry)] == ['%s-%s' % (i, n) for n in range(3)]
+    # 每个用例一个gzip成员，整个文件仍然可以整体解压
+    entry = store.find('t::0')[0]
+    assert entry['compressed'] == 1
+    with open(os.path.join(str(tmp_path), entry['segment']), 'rb') as f:
+        assert b'"0-0"' in gzip.decompress(f.read())
+
+
+def test_prune_old_segments(tmp_path):
+    store = TraceStore(str(tmp_path), max_bytes=1, backup_count=2)
+    for i in range(5):
+        store.write('t::%s' % i, _records(1), 'passed', float(i), 0.1)
+    store.close()
+    assert len(store._segments()) == 2
+    assert [e['nodeid'] for e in store.find('t::')] == ['t::4', 't::3']
+
+
+def test_compress_leftovers(tmp_path):
+    # 上次运行没有close，段文件没有切割也没有压缩
+    store = TraceStore(str(tmp_path))
+    store.write('t::old', _records(2, 'old'), 'passed', 1.0, 0.1)
+    store._file.close()
+    store._file = None
+    store.close()
+    assert os.listdir(str(tmp_path)).count('trace-00001.jsonl') == 1
+    store = TraceStore(str(tmp_path))
+    store.compress_leftovers()
+    store.write('t::new', _records(1, 'new'), 'passed', 2.0, 0.1)
+    store.close()
+    names = os.listdir(str(tmp_path))
+    assert 'trace-00001.jsonl.gz' in names and 'trace-00001.jsonl' not in names and 'trace-00002.jsonl' in names
+    assert [r['msg'] for r in store.latest('t::old')] == ['old-0', 'old-1']
+    assert [r['msg'] for r in store.latest('t::new')] == ['new-0']
+
+
+@pytest.mark.parametrize('order', ['profiler_first', 'trace_first'])
+def test_uninstall_in_any_order(tmp_path, order):
+    originals = dict(vars(Base)), RemoteConnection.execute
+    profiler = Profiler(str(tmp_path / 'profile.json'), write=False)
+    recorder = TraceRecorder(TraceStore(str(tmp_path / 'trace')))
+    profiler.install()
+    recorder.install()
+    # 先卸载外层还是内层，Base最终都要还原成原来的方法
+    for plugin in ([profiler, recorder] if order == 'profiler_first' else [recorder, profiler]):
+        plugin.uninstall()
+    recorder.store.close()
+    assert dict(vars(Base)) == originals[0] and RemoteConnection.execute is originals[1]
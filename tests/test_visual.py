@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+__author__ = 'dongwenda'
+__date__ = '2019/2/21 15:00'
+import io
+
+import pytest
+
+np = pytest.importorskip('numpy')
+Image = pytest.importorskip('PIL.Image')
+
+from common.visual import compare_images  # noqa: E402
+
+
+def _png(array):
+    buffer = io.BytesIO()
+    Image.fromarray(array.astype(np.uint8)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _gradient():
+    '''左右渐变，感知哈希的64位不全相同'''
+    return np.tile(np.linspace(0, 255, 64)[None, :, None], (48, 1, 3))
+
+
+def _job(tmp_path, png, **kwargs):
+    job = {'png': png, 'baseline': str(tmp_path / 'base' / 'step.png'), 'diff_path': str(tmp_path / 'diff' / 'step.png'),
+           'regions': [], 'tolerance': 16, 'max_ratio': 0.001, 'reject_bits': 20}
+    job.update(kwargs)
+    return job
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    png = _png(_gradient())
+    assert compare_images(_job(tmp_path, png))['status'] == 'created'
+    return png
+
+
+def test_identical_bytes_pass(tmp_path, baseline):
+    assert compare_images(_job(tmp_path, baseline)) == {'status': 'passed', 'ratio': 0.0, 'message': '', 'diff': None}
+
+
+def test_small_change_within_tolerance_and_ratio(tmp_path, baseline):
+    image = _gradient()
+    image[0, 0] += 10  # 小于tolerance
+    assert compare_images(_job(tmp_path, _png(image)))['status'] == 'passed'
+    image[0, 0] = 255 - image[0, 0]
+    result = compare_images(_job(tmp_path, _png(image), max_ratio=0.01))
+    assert result['status'] == 'passed' and 0 < result['ratio'] <= 0.01
+
+
+def test_pixel_diff_over_max_ratio_writes_diff(tmp_path, baseline):
+    image = _gradient()
+    image[:4, :8] = 255 - image[:4, :8]
+    result = compare_images(_job(tmp_path, _png(image)))
+    assert result['status'] == 'failed'
+    assert result['ratio'] == pytest.approx(32 / (48 * 64.0))
+    diff = np.asarray(Image.open(result['diff']))
+    assert (diff[:4, :8] == (255, 0, 0)).all() and not (diff[4:] == (255, 0, 0)).all(axis=2).any()
+
+
+def test_ignored_regions(tmp_path, baseline):
+    image = _gradient()
+    image[:4, :8] = 255 - image[:4, :8]
+    assert compare_images(_job(tmp_path, _png(image), regions=[[0, 0, 7, 3]]))['status'] == 'passed'
+
+
+def test_hash_reject_skips_pixel_diff(tmp_path, baseline):
+    png = _png(_gradient()[:, ::-1])
+    result = compare_images(_job(tmp_path, png))
+    assert result['status'] == 'failed' and result['ratio'] is None
+    # 差异图位置保存的是当前截图
+    with open(result['diff'], 'rb') as f:
+        assert f.read() == png
+    # 超过reject_bits才直接判定，否则按像素比例判断
+    assert compare_images(_job(tmp_path, png, reject_bits=64, max_ratio=1.0))['status'] == 'passed'
+
+
+def test_size_mismatch(tmp_path, baseline):
+    result = compare_images(_job(tmp_path, _png(_gradient()[:40])))
+    assert result['status'] == 'failed' and '尺寸不同' in result['message']